@@ -1,58 +1,110 @@
+from __future__ import annotations
+
 import os
 import io
+import asyncio
 import base64 
 import logging
+import mimetypes
+from functools import lru_cache
 from pathlib import Path
-import json
-from quart import Quart, jsonify, request, send_file, render_template, session
+import time
+from quart import Blueprint, Quart, jsonify, request, send_file, render_template, session, current_app, g
 from quart import send_from_directory 
+from werkzeug.exceptions import NotFound
+from werkzeug.security import safe_join
 from werkzeug.utils import secure_filename
-import pandas as pd
-import numpy as np
-from scipy.ndimage import gaussian_filter
-from sklearn.neighbors import KernelDensity
-from PIL import Image, ImageDraw
-import matplotlib
-matplotlib.use('Agg')
-import matplotlib.pyplot as plt
-from matplotlib.colors import Normalize
-from matplotlib.patches import PathPatch
-from matplotlib.path import Path as MplPath
-from matplotlib.colorbar import ColorbarBase
-import matplotlib.cm
 from routes.data_api import bp as data_api_bp
-import tracemalloc
-tracemalloc.start()
-
-# --- Basic Setup -----------------------------------------------------------------
-app = Quart(__name__, static_folder=None)
-
-# Now set the config
-app.config['PROVIDE_AUTOMATIC_OPTIONS'] = True
-app.config['SECRET_KEY'] = os.urandom(24)
-app.config['MAX_CONTENT_LENGTH'] = 50 * 1024 * 1024  # 50MB
-app.config['UPLOAD_FOLDER'] = 'uploads'
-app.config['BOUNDARY_UPLOAD_DIR'] = os.path.join('static', 'data', 'uploads')
-
-# Create uploads directory if it doesn't exist
-Path(app.config['UPLOAD_FOLDER']).mkdir(parents=True, exist_ok=True)
-Path(app.config['BOUNDARY_UPLOAD_DIR']).mkdir(parents=True, exist_ok=True)
-
-# Manually set static folder path
-app.static_folder = os.path.join(app.root_path, 'static')
-app.static_url_path = '/static'
-# Manually add the static route now that config is set
-app.add_url_rule(
-    '/static/<path:filename>',
-    endpoint='static',
-    view_func=app.send_static_file
+from routes.animation_api import animation_bp
+from routes.profiling_api import profiling_bp
+from db import start_query_count, get_query_count
+from utils.boundary import read_boundary
+from utils.single_flight import SingleFlight, canonical_key
+from utils.admission import RENDER_WORKERS, RenderBusyError, render_executor
+from utils.compression import (
+    COMPRESS_MIN_BYTES, COMPRESSIBLE_SUFFIXES, available_encodings, compress, is_compressible, negotiate,
+    precompress_file, variant_for,
+)
+from utils.metrics import (
+    COMPRESSED_BYTES, StageClock, observe_request, render_metrics, request_timings, server_timing_header, stage,
+    start_request_timings,
 )
 
-app.register_blueprint(data_api_bp)
+# pandas, numpy, scipy, scikit-learn and matplotlib are imported inside the
+# handlers that need them, so a worker starts without paying for all of
+# them; WARM_UP=1 loads them (and primes caches) before serving instead.
 
 ALLOWED_EXTENSIONS = {'csv', 'xlsx', 'xls'}
-
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+# Seconds browsers may reuse static files without revalidating; 0 means
+# revalidate every time (answered with 304 while the ETag matches).
+STATIC_MAX_AGE = int(os.getenv('STATIC_MAX_AGE', '0'))
+
+main_bp = Blueprint('main', __name__)
+
+
+# --- Per-request DB query and stage timing reporting ------------------------------
+
+@main_bp.before_app_request
+async def _start_db_query_count():
+    start_query_count()
+    start_request_timings()
+    g.request_started = time.perf_counter()
+
+@main_bp.after_app_request
+async def _report_db_query_count(response):
+    """Expose the number of SQL statements a request issued (X-DB-Query-Count)."""
+    count = get_query_count()
+    if count:
+        response.headers['X-DB-Query-Count'] = str(count)
+        logging.info(f"{request.method} {request.path} issued {count} DB queries")
+    return response
+
+@main_bp.after_app_request
+async def _report_stage_timings(response):
+    """Expose per-stage timings (Server-Timing) and record the request in /metrics."""
+    started = getattr(g, 'request_started', None)
+    if started is None:
+        return response
+    total = time.perf_counter() - started
+    response.headers['Server-Timing'] = server_timing_header(request_timings(), total)
+    endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+    observe_request(request.method, endpoint, response.status_code, total)
+    return response
+
+# Registered after the timing hook so it runs first and its stage is reported.
+@main_bp.after_app_request
+async def _compress_response(response):
+    """gzip/brotli-encode text and JSON bodies for clients that accept it."""
+    from quart.wrappers.response import DataBody
+
+    if (request.method == 'HEAD' or response.status_code < 200 or response.status_code in (204, 206)
+            or 'Content-Encoding' in response.headers or not is_compressible(response.mimetype)
+            or not isinstance(response.response, DataBody)  # files and streams
+            or 'no-transform' in response.headers.get('Cache-Control', '')):
+        return response
+    data = await response.get_data()
+    if len(data) < COMPRESS_MIN_BYTES:
+        return response
+    response.vary.add('Accept-Encoding')
+    encoding = negotiate(request.headers.get('Accept-Encoding'), available_encodings())
+    if encoding is None:
+        return response
+    with stage('response.compress'):
+        body = await asyncio.to_thread(compress, data, encoding)
+    response.set_data(body)
+    response.headers['Content-Encoding'] = encoding
+    # The encoded bytes differ, so a strong validator would be wrong.
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    COMPRESSED_BYTES.inc((encoding, 'in'), len(data))
+    COMPRESSED_BYTES.inc((encoding, 'out'), len(body))
+    return response
+
+@main_bp.route('/metrics')
+async def metrics():
+    """Stage and request latency histograms in the Prometheus text format."""
+    return render_metrics(), 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
 
 # --- Helper Functions ------------------------------------------------------------
 
@@ -60,8 +112,39 @@ def allowed_file(filename: str) -> bool:
     """Checks if the file extension is in the allowed list."""
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+def uploaded_dataset(dataset: str | None):
+    """Cleaned upload frame stored by /upload under ``dataset``, or None."""
+    if not dataset:
+        return None
+    from utils.shared_store import shared_store
+    try:
+        return shared_store.get_frame('upload', dataset)
+    except ValueError:  # not a store key
+        return None
+
+def sample_of(frame, records: list) -> bool:
+    """True if ``records`` are the first rows of ``frame``, as /upload returns them."""
+    import pandas as pd
+    posted = pd.DataFrame(records)
+    if len(posted) > len(frame) or not set(posted.columns) <= set(frame.columns):
+        return False
+    head = frame.head(len(posted))[list(posted.columns)].reset_index(drop=True)
+    try:
+        posted = posted.astype(head.dtypes.to_dict())
+    except (TypeError, ValueError):
+        return False
+    return posted.equals(head)
+
+def busy_response(error: RenderBusyError):
+    """429 for a render turned away by admission control."""
+    response = jsonify({'error': str(error)})
+    response.headers['Retry-After'] = str(error.retry_after)
+    return response, 429
+
 def clean_and_validate_data(df: pd.DataFrame) -> (pd.DataFrame | str):
     """Standardizes column names, types, and validates required data."""
+    import pandas as pd
+
     df.columns = df.columns.str.strip().str.lower()
     
     # Check for required latitude and longitude columns
@@ -102,72 +185,80 @@ def clean_and_validate_data(df: pd.DataFrame) -> (pd.DataFrame | str):
 
 # --- Core Routes -----------------------------------------------------------------
 
-@app.route('/')
+@main_bp.route('/')
 async def index():
     """Serves the main HTML page of the application."""
     return await render_template('index.html')
 
-from quart import send_from_directory
-
-@app.route('/static/data/export.geojson')
+async def send_static(filename: str, mimetype: str | None = None):
+    """A file under static/ as its best precompressed variant, with ETag and Cache-Control."""
+    path = safe_join(current_app.static_folder, filename)
+    if path is None or not os.path.isfile(path):
+        raise NotFound()
+    sent, encoding = variant_for(path, request.headers.get('Accept-Encoding'))
+    # The type of the original file, not of its .br/.gz variant.
+    mimetype = mimetype or mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    response = await send_file(sent, mimetype=mimetype, conditional=True)
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    if filename.endswith(COMPRESSIBLE_SUFFIXES):
+        response.vary.add('Accept-Encoding')
+    response.headers['Cache-Control'] = f'public, max-age={STATIC_MAX_AGE}' if STATIC_MAX_AGE else 'no-cache'
+    return response
+
+async def static_file(filename):
+    return await send_static(filename)
+
+@main_bp.route('/static/data/export.geojson')
 async def serve_geojson():
-    return await send_from_directory('static/data', 'export.geojson', mimetype='application/json')
+    return await send_static('data/export.geojson', mimetype='application/json')
 
-@app.route('/upload', methods=['POST'])
+@main_bp.route('/upload', methods=['POST'])
 async def upload_data():
     """Handles file upload, cleaning, validation, and returns data and stats."""
-    print("\n=== UPLOAD REQUEST RECEIVED ===")
-    
-    form = await request.form
+    import pandas as pd
+
+    clock = StageClock()
     files = await request.files
+    clock.lap('upload.receive')
 
-    print(f"Form data: {form}")
-    print(f"Files received: {files}")
-    
     try:
         # Check if the post request has the file part
         if 'file' not in files:
-            print("ERROR: No file part in request")
+            logging.warning("Upload rejected: no file part in request")
             return jsonify({'error': 'No file part in the request'}), 400
             
         file = files['file']
         filename = secure_filename(file.filename)
-        print(f"Processing file: {filename}")
         
         # Save file to uploads directory for later use by animation (synchronous)
-        file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        file.save(file_path)
-        print(f"File saved to: {file_path}")
+        file_path = os.path.join(current_app.config['UPLOAD_FOLDER'], filename)
+        await file.save(file_path)
+        logging.debug(f"Upload saved to {file_path}")
 
         if filename == '':
-            print("ERROR: No file selected")
+            logging.warning("Upload rejected: no file selected")
             return jsonify({'error': 'No selected file'}), 400
             
         if not file or not allowed_file(file.filename):
-            print(f"ERROR: Invalid file type: {file.filename}")
+            logging.warning(f"Upload rejected: file type not allowed ({file.filename})")
             return jsonify({'error': 'File type not allowed. Please upload a CSV or Excel file.'}), 400
-            
-        print(f"File type allowed: {file.filename}")
 
         try:
-            print("\n=== READING FILE ===")
             # Read the saved file into a pandas DataFrame
             try:
                 if filename.lower().endswith(('.xls', '.xlsx')):
-                    print("Reading Excel file from disk...")
                     df = pd.read_excel(file_path)
                 else:
-                    print("Reading CSV file from disk...")
                     df = pd.read_csv(file_path)
-                
-                print(f"Successfully read file with shape: {df.shape}")
-                print(f"Columns: {df.columns.tolist()}")
-                if len(df) > 0:
-                    print("First few rows:")
-                    print(df.head(2).to_string())
-                
+                clock.lap('upload.read')
+
+                logging.info(f"Read {filename}: shape {df.shape}")
+                if logging.getLogger().isEnabledFor(logging.DEBUG):
+                    logging.debug(f"Columns: {df.columns.tolist()}\n{df.head(2).to_string()}")
+
             except Exception as read_error:
-                print(f"ERROR reading file: {str(read_error)}")
+                logging.warning(f"Error reading upload {filename}: {read_error}")
                 return jsonify({
                     'error': f'Error reading file: {str(read_error)}',
                     'type': 'file_read_error'
@@ -175,8 +266,9 @@ async def upload_data():
             
             # Handle wide format data (first two columns are lat/lon, rest are timestamps)
             stats_timestamps = None
-            if len(df.columns) > 2:
-                print("Converting wide format to long format...")
+            # Long-format files already carry timestamp/value columns.
+            is_long = {'timestamp', 'value'}.issubset(df.columns.str.strip().str.lower())
+            if len(df.columns) > 2 and not is_long:
                 # First two columns are lat/lon, rest are timestamps
                 lat_col = df.columns[0]
                 lon_col = df.columns[1]
@@ -216,10 +308,7 @@ async def upload_data():
                 # Drop rows with missing values
                 df = df_long.dropna(subset=['latitude', 'longitude', 'value'])
                 
-                print(f"Converted to long format. New shape: {df.shape}")
-                if len(df) > 0:
-                    print("First few rows after conversion:")
-                    print(df.head(2).to_string())
+                logging.debug(f"Converted wide upload to long format: shape {df.shape}")
             
             # Ensure required columns exist
             if 'species' not in df.columns:
@@ -229,36 +318,35 @@ async def upload_data():
             if 'value' not in df.columns and 'count' in df.columns:
                 df = df.rename(columns={'count': 'value'})
 
-            print("\n=== VALIDATING DATA ===")
             # Process and validate the data
             try:
                 df_clean, error = clean_and_validate_data(df)
                 if error:
-                    print(f"Data validation failed: {error}")
+                    logging.warning(f"Upload validation failed: {error}")
                     return jsonify({
                         'error': f'Data validation error: {error}',
                         'type': 'validation_error'
                     }), 400
                     
                 if df_clean is None or df_clean.empty:
-                    print("No valid data found after cleaning")
+                    logging.warning("Upload has no valid data after cleaning")
                     return jsonify({
                         'error': 'No valid data found in the file',
                         'type': 'no_valid_data'
                     }), 400
                 
-                print(f"Data validation successful. Cleaned data shape: {df_clean.shape}")
                 
             except Exception as validation_error:
-                print(f"ERROR during validation: {str(validation_error)}")
+                logging.warning(f"Upload validation error: {validation_error}")
                 return jsonify({
                     'error': f'Error during data validation: {str(validation_error)}',
                     'type': 'validation_exception'
                 }), 400
             
+            clock.lap('upload.clean')
             # Log some info about the processed data
             logging.info(f"Processed {len(df_clean)} rows of data")
-            logging.info(f"Columns in cleaned data: {df_clean.columns.tolist()}")
+            logging.debug(f"Columns in cleaned data: {df_clean.columns.tolist()}")
             
             # Prepare response
             # Compute timestamps robustly from cleaned data if not already computed
@@ -285,12 +373,15 @@ async def upload_data():
             global_min = df_clean['value'].min()
             global_max = df_clean['value'].max()
 
-            # Store full data in session for persistence
+            # The full data goes to the shared store, where every worker can
+            # map it; the session only refers to it.
+            from utils.shared_store import file_key, shared_store
+            dataset = file_key(file_path)
+            shared_store.put_frame('upload', dataset, df_clean)
             session['uploaded_data'] = {
-                'data': df_clean.to_dict(orient='records'),
+                'dataset': dataset,
                 'global_min': float(global_min),
                 'global_max': float(global_max),
-                'timestamp_columns': stats['timestamps'],
                 'filename': filename,
                 'total_records': len(df_clean)
             }
@@ -303,10 +394,13 @@ async def upload_data():
                 'global_min': float(global_min),
                 'global_max': float(global_max),
                 'timestamp_columns': stats['timestamps'],
-                'filename': filename
+                'filename': filename,
+                'dataset': dataset
             }
 
-            return jsonify(response_data), 200
+            response = jsonify(response_data)
+            clock.lap('upload.serialize')
+            return response, 200
             
         except Exception as e:
             logging.error(f"Error processing file: {str(e)}", exc_info=True)
@@ -324,6 +418,8 @@ async def upload_data():
 
 def polygon_to_path(polygon):
     """Converts shapely Polygon or MultiPolygon to matplotlib Path objects."""
+    from matplotlib.path import Path as MplPath
+
     if polygon.is_empty:
         return []
     paths = []
@@ -337,118 +433,101 @@ def polygon_to_path(polygon):
         paths.append(MplPath(vertices, codes))
     return paths
 
-@app.route('/generate-heatmap', methods=['POST'])
-async def generate_heatmap():
-    """Generates a correctly aspected and masked heatmap using matplotlib."""
-    try:
-        # Try to get JSON data first, fall back to form data if that fails
-        try:
-            payload = await request.get_json(force=True)  # ✅ FIXED
-
-            if 'global_min' not in payload or 'global_max' not in payload:
-                logging.warning("Global min/max not provided in payload, calculating from data")
-                all_values = [float(point['value']) for point in payload['data']]
-                global_min = min(all_values)
-                global_max = max(all_values)
-            else:
-                global_min = float(payload['global_min'])
-                global_max = float(payload['global_max'])
-
-            if not payload or 'data' not in payload:
-                return jsonify({'error': 'Invalid request data'}), 400
-
-        except Exception as e:
-            logging.error(f"Error processing JSON data: {str(e)}", exc_info=True)
-            return jsonify({'error': 'Invalid JSON data format'}), 400
-
-        if not payload or 'data' not in payload:
-            return jsonify({'error': 'No data provided in the request.'}), 400
-
-        bandwidth_km = max(float(payload.get('bandwidth', 0.05)), 0.05)
-        method = (payload.get('method') or 'idw').lower()
-        data_records = payload['data']
-        
-        df = pd.DataFrame(data_records)
-        if df.empty:
-            return jsonify({'error': 'Data is empty after processing.'}), 400
-
-        timestamps = payload.get('timestamp_columns') or [payload.get('timestamp')]
-
-        if not timestamps:
-            return jsonify({'error': 'No timestamps provided'}), 400
-
-        timestamp = timestamps
-        if not timestamp or 'timestamp' not in df.columns:
-            return jsonify({'error': 'Missing timestamp field in data'}), 400
-
-        from shapely.geometry import Polygon, shape
-        # Lagoon boundary (avoid GeoPandas+Fiona by using pure JSON + Shapely)
-        # Resolve dynamic boundary path: payload > session > default
-        boundary_path = payload.get('boundary_path') or session.get('boundary_geojson') or os.path.join('static','data','export.geojson')
-        fs_path = boundary_path
-        if boundary_path.startswith('/'):
-            fs_path = os.path.join(app.root_path, boundary_path.lstrip('/'))
-        elif not os.path.isabs(boundary_path):
-            fs_path = os.path.join(app.root_path, boundary_path)
-        with open(fs_path, 'r', encoding='utf-8') as f:
-            gj = json.load(f)
-        # Support FeatureCollection or single Feature/Geometry
-        if gj.get('type') == 'FeatureCollection':
-            geom_obj = gj['features'][0]['geometry']
-        elif gj.get('type') == 'Feature':
-            geom_obj = gj['geometry']
-        else:
-            geom_obj = gj
-        lake_boundary = shape(geom_obj)
-        min_lon, min_lat, max_lon, max_lat = lake_boundary.bounds
-
-        # Rectangle polygon from bounding box
-        rect_poly = Polygon([
-            (85.389862, 19.858694),
-            (85.624695, 19.858694),
-            (85.624695, 19.942627),
-            (85.389862, 19.942627)
-        ])
-        # Intersection: lagoon ∩ rectangle
-        intersection_poly = lake_boundary.intersection(rect_poly)
-        # Lagoon minus rectangle: lagoon - rectangle
-        lagoon_minus_rect = lake_boundary.difference(rect_poly)
-
-        # Create a square grid for density estimation
-        grid_res = 400
-        grid_lon = np.linspace(min_lon, max_lon, grid_res)
-        grid_lat = np.linspace(min_lat, max_lat, grid_res)
-        grid_x, grid_y = np.meshgrid(grid_lon, grid_lat)
-        grid_points = np.vstack([grid_x.ravel(), grid_y.ravel()]).T
-
-        results = {}
-
-        print(f"[INFO] Generating {len(timestamps)} heatmaps...")
-
-        timestamps = timestamps # TEMP: Only process first 2 for test
-
-        for ts in timestamps:
-            df_filtered = df[df['timestamp'] == ts]
-            print(f"→ Processing timestamp: {ts} with {len(df_filtered)} points...")
-            print(f"→ Global min/max: {global_min}, {global_max}")
-            print(f"→ Bandwidth: {bandwidth_km} km")
-
-            if df_filtered.empty:
-                continue
-
-            df_agg = df_filtered.groupby(['latitude', 'longitude'])['value'].mean().reset_index()
-
-            coords = df_agg[['longitude', 'latitude']].to_numpy()
-            weights = df_agg['value'].to_numpy()
-
-            norm_min = global_min
-            norm_max = global_max
-
-            # Convert bandwidth from km to degrees
-            bandwidth_deg = bandwidth_km / 111.0
-            # Ensure weights are clipped to global range
-            weights = np.clip(weights, global_min, global_max)
-
+DEFAULT_HEATMAP_BOUNDARY = os.path.join('static', 'data', 'export.geojson')
+# Rectangle (lon, lat corners) of the lagoon drawn as a solid patch
+# under the heatmap; the heatmap itself is clipped to the rest.
+HEATMAP_RECT = [
+    (85.389862, 19.858694),
+    (85.624695, 19.858694),
+    (85.624695, 19.942627),
+    (85.389862, 19.942627)
+]
+
+
+@lru_cache(maxsize=16)
+def _heatmap_masks(path: str, mtime_ns: int):
+    from shapely.geometry import Polygon
+
+    lake_boundary = read_boundary(path)
+    rect_poly = Polygon(HEATMAP_RECT)
+    # Intersection: lagoon ∩ rectangle; lagoon minus rectangle: lagoon - rectangle
+    return lake_boundary, lake_boundary.intersection(rect_poly), lake_boundary.difference(rect_poly)
+
+
+def heatmap_boundary(fs_path: str):
+    """(lagoon, lagoon ∩ rectangle, lagoon - rectangle), cached per boundary file version."""
+    return _heatmap_masks(os.path.abspath(fs_path), os.stat(fs_path).st_mtime_ns)
+
+# Render settings per heatmap quality. ``preview`` is a coarse, unsmoothed
+# grid at screen resolution for fast iteration on bandwidth/colormap;
+# ``full`` is the final render.
+HEATMAP_QUALITY = {
+    'full': {'grid_res': 400, 'dpi': 150, 'smooth': True},
+    'preview': {'grid_res': 100, 'dpi': 72, 'smooth': False},
+}
+
+# Identical concurrent /generate-heatmap requests share one render.
+heatmap_flights = SingleFlight('heatmap')
+
+# Slots on the shared render executor (see utils/admission). A coalesced
+# request does not take a slot of its own.
+render_executor.register('heatmap', concurrency=RENDER_WORKERS, queue=16, timeout=30)
+render_executor.register('legend', concurrency=2, queue=32, timeout=10)
+
+class HeatmapRenderError(RuntimeError):
+    """A render step failed; the message is safe to return to the client."""
+
+def render_heatmaps(df, timestamps, *, method, bandwidth_km, settings, global_min, global_max,
+                    colormap_name, fs_path) -> dict:
+    """Base64 PNG per timestamp. Runs in a worker thread, so it uses no pyplot state."""
+    import numpy as np
+    import matplotlib
+    from matplotlib.colors import Normalize
+    from matplotlib.figure import Figure
+    from matplotlib.patches import PathPatch
+    from scipy.ndimage import gaussian_filter
+    from sklearn.neighbors import KernelDensity
+    from utils.animation_cache import boundary_hash
+    from utils.shared_store import array_key, shared_store
+
+    clock = StageClock()
+    lake_boundary, intersection_poly, lagoon_minus_rect = heatmap_boundary(fs_path)
+    boundary_digest = boundary_hash(fs_path)
+    min_lon, min_lat, max_lon, max_lat = lake_boundary.bounds
+
+    # Create a square grid for density estimation
+    grid_res = settings['grid_res']
+    grid_lon = np.linspace(min_lon, max_lon, grid_res)
+    grid_lat = np.linspace(min_lat, max_lat, grid_res)
+    grid_x, grid_y = np.meshgrid(grid_lon, grid_lat)
+    grid_points = np.vstack([grid_x.ravel(), grid_y.ravel()]).T
+    clock.lap('heatmap.setup')
+
+    results = {}
+
+    for ts in timestamps:
+        clock.reset()
+        df_filtered = df[df['timestamp'] == ts]
+        logging.debug(f"Heatmap {ts}: {len(df_filtered)} points")
+
+        if df_filtered.empty:
+            continue
+
+        df_agg = df_filtered.groupby(['latitude', 'longitude'])['value'].mean().reset_index()
+
+        coords = df_agg[['longitude', 'latitude']].to_numpy()
+        weights = df_agg['value'].to_numpy()
+
+        norm_min = global_min
+        norm_max = global_max
+
+        # Convert bandwidth from km to degrees
+        bandwidth_deg = bandwidth_km / 111.0
+        # Ensure weights are clipped to global range
+        weights = np.clip(weights, global_min, global_max)
+        clock.lap('heatmap.aggregate')
+
+        def interpolate():
             if method == 'kde':
                 # --- KDE Interpolation (weighted) ---
                 try:
@@ -468,7 +547,7 @@ async def generate_heatmap():
                     interpolated_grid = np.clip(scaled, global_min, global_max)
                 except Exception as e:
                     logging.error(f"KDE failed for {ts}: {e}")
-                    return jsonify({'error': 'KDE failed during heatmap generation.'}), 500
+                    raise HeatmapRenderError('KDE failed during heatmap generation.') from e
             else:
                 # --- IDW Interpolation ---
                 def idw_interpolate(coords, values, grid_points, power=2):
@@ -484,107 +563,202 @@ async def generate_heatmap():
 
                 interpolated_values = idw_interpolate(coords, weights, grid_points)
                 interpolated_grid = interpolated_values.reshape(grid_res, grid_res)
-                interpolated_grid = gaussian_filter(interpolated_grid, sigma=3.6)
+                if settings['smooth']:
+                    # sigma is in grid cells; keep the same smoothing radius on the ground.
+                    interpolated_grid = gaussian_filter(interpolated_grid, sigma=3.6 * grid_res / 400)
                 # Use the global min/max from payload for normalization
                 interpolated_grid = np.clip(interpolated_grid, global_min, global_max)
+            return interpolated_grid
+
+        # Grids depend only on the points and settings, so a colormap change
+        # (or another worker) reuses them from the shared store.
+        grid_key = array_key(coords, weights, method, bandwidth_km, grid_res, settings['smooth'],
+                             global_min, global_max, boundary_digest)
+        interpolated_grid = shared_store.arrays('heatmap_grid', grid_key, lambda: {'grid': interpolate()})['grid']
+
+        clock.lap('heatmap.interpolate')
+        logging.debug(f"Heatmap {ts}: interpolated range "
+                      f"{np.nanmin(interpolated_grid):.2f}..{np.nanmax(interpolated_grid):.2f}")
+
+        # Tight bounding box from lagoon bounds
+        extent = (min_lon, max_lon, min_lat, max_lat)
+
+        aspect_ratio = (max_lon - min_lon) / (max_lat - min_lat)
+        fig_width = 6
+        fig_height = fig_width / aspect_ratio
+        fig = Figure(figsize=(fig_width, fig_height), dpi=settings['dpi'])  # Lower DPI avoids Leaflet pixel distortion
+        ax = fig.subplots()
+        fig.patch.set_alpha(0)
+        ax.patch.set_alpha(0)
+        ax.set_xlim(min_lon, max_lon)
+        ax.set_ylim(min_lat, max_lat)
+        ax.set_aspect('equal', adjustable='box')  # Prevent distortion across lat-long scaling
+        ax.axis('off')
+        fig.subplots_adjust(left=0, right=1, top=1, bottom=0)
 
-            sample_vals = interpolated_grid.flatten()
-            print("Sample interpolated values:", np.round(np.sort(sample_vals)[-10:], 2))
-
-            # Tight bounding box from lagoon bounds
-            extent = (min_lon, max_lon, min_lat, max_lat)
-
-            aspect_ratio = (max_lon - min_lon) / (max_lat - min_lat)
-            fig_width = 6
-            fig_height = fig_width / aspect_ratio
-            fig, ax = plt.subplots(figsize=(fig_width, fig_height), dpi=150)  # Lower DPI avoids Leaflet pixel distortion
-            fig.patch.set_alpha(0)
-            ax.patch.set_alpha(0)
-            ax.set_xlim(min_lon, max_lon)
-            ax.set_ylim(min_lat, max_lat)
-            ax.set_aspect('equal', adjustable='box')  # Prevent distortion across lat-long scaling
-            ax.axis('off')
-            plt.subplots_adjust(left=0, right=1, top=1, bottom=0)
-
-            # Intersection
-            for p in polygon_to_path(intersection_poly):
-                patch = PathPatch(p, transform=ax.transData, facecolor='#006400', edgecolor='none', zorder=1)
-                ax.add_patch(patch)
-
-            if interpolated_grid.min() < norm_min or interpolated_grid.max() > norm_max:
-                logging.warning(f"[WARN] Density values outside global range for {ts}: min={interpolated_grid.min()}, max={interpolated_grid.max()}")
-
-            norm = Normalize(vmin=global_min, vmax=global_max)
-            scaled_grid = norm(interpolated_grid)  # values in [0, 1] range
-
-            # Get colormap from payload or default to turbo
-            colormap_name = payload.get('colormap', 'turbo')
-            try:
-                colormap = matplotlib.cm.get_cmap(colormap_name)
-            except:
-                colormap = matplotlib.cm.turbo
-            
-            heatmap_im = ax.imshow(interpolated_grid,
-                                cmap=colormap,
-                                origin='lower',
-                                extent=extent,
-                                interpolation='gaussian',
-                                zorder=2,
-                                vmin=global_min,
-                                vmax=global_max)
-
-            for p in polygon_to_path(lagoon_minus_rect):
-                clip_patch = PathPatch(p, transform=ax.transData, facecolor='none', edgecolor='none')
-                heatmap_im.set_clip_path(clip_patch)
-
-            # 🔻 Encode to base64 inside loop
-            buf = io.BytesIO()
-            fig.savefig(buf,
-                        format='PNG',
-                        dpi=150,
-                        bbox_inches='tight',
-                        pad_inches=0,
-                        transparent=True)
-            plt.close(fig)
-            buf.seek(0)
-            results[ts] = base64.b64encode(buf.read()).decode('utf-8')
-            
-            print(f"Processing heatmap for: {ts} | Points: {len(df_filtered)}") 
-            print(f"Global min/max: {norm_min} / {norm_max}")
+        # Intersection
+        for p in polygon_to_path(intersection_poly):
+            patch = PathPatch(p, transform=ax.transData, facecolor='#006400', edgecolor='none', zorder=1)
+            ax.add_patch(patch)
+
+        if interpolated_grid.min() < norm_min or interpolated_grid.max() > norm_max:
+            logging.warning(f"[WARN] Density values outside global range for {ts}: min={interpolated_grid.min()}, max={interpolated_grid.max()}")
+
+        norm = Normalize(vmin=global_min, vmax=global_max)
+        scaled_grid = norm(interpolated_grid)  # values in [0, 1] range
+
+        # Colormap from the payload, turbo if unknown
+        try:
+            colormap = matplotlib.colormaps[colormap_name]
+        except KeyError:
+            colormap = matplotlib.colormaps['turbo']
         
+        heatmap_im = ax.imshow(interpolated_grid,
+                            cmap=colormap,
+                            origin='lower',
+                            extent=extent,
+                            interpolation='gaussian',
+                            zorder=2,
+                            vmin=global_min,
+                            vmax=global_max)
+
+        for p in polygon_to_path(lagoon_minus_rect):
+            clip_patch = PathPatch(p, transform=ax.transData, facecolor='none', edgecolor='none')
+            heatmap_im.set_clip_path(clip_patch)
+
+        clock.lap('heatmap.render')
+        # 🔻 Encode to base64 inside loop
+        buf = io.BytesIO()
+        fig.savefig(buf,
+                    format='PNG',
+                    dpi=settings['dpi'],
+                    bbox_inches='tight',
+                    pad_inches=0,
+                    transparent=True)
+        buf.seek(0)
+        results[ts] = base64.b64encode(buf.read()).decode('utf-8')
+        clock.lap('heatmap.encode')
+
+    return results
+
+@main_bp.route('/generate-heatmap', methods=['POST'])
+async def generate_heatmap():
+    """Generates a correctly aspected and masked heatmap using matplotlib."""
+    import pandas as pd
+
+    try:
+        # Try to get JSON data first, fall back to form data if that fails
+        try:
+            payload = await request.get_json(force=True)  # ✅ FIXED
+
+            if not payload or ('data' not in payload and 'dataset' not in payload):
+                return jsonify({'error': 'Invalid request data'}), 400
+
+        except Exception as e:
+            logging.error(f"Error processing JSON data: {str(e)}", exc_info=True)
+            return jsonify({'error': 'Invalid JSON data format'}), 400
+
+        bandwidth_km = max(float(payload.get('bandwidth', 0.05)), 0.05)
+        method = (payload.get('method') or 'idw').lower()
+        quality = (payload.get('quality') or 'full').lower()
+        if quality not in HEATMAP_QUALITY:
+            return jsonify({'error': f"Unknown quality '{quality}'. Choose from {sorted(HEATMAP_QUALITY)}."}), 400
+        settings = HEATMAP_QUALITY[quality]
+        data_records = payload.get('data')
+
+        # An upload named by the client is mapped in full from the shared
+        # store, unless the client posted rows of its own: only a sample of
+        # that upload (what /upload returned) stands for it. The posted rows
+        # are also the fallback when the upload has been evicted.
+        dataset = payload.get('dataset')
+        df = uploaded_dataset(dataset)
+        if df is not None and data_records is not None and not sample_of(df, data_records):
+            df = None
+        if df is None:
+            if data_records is None:
+                return jsonify({'error': 'Uploaded dataset is no longer available; upload the file again.'}), 410
+            dataset = None
+            df = pd.DataFrame(data_records)
+        if df.empty:
+            return jsonify({'error': 'Data is empty after processing.'}), 400
+
+        if 'global_min' not in payload or 'global_max' not in payload:
+            logging.warning("Global min/max not provided in payload, calculating from data")
+            all_values = df['value'].astype(float)
+            global_min = all_values.min()
+            global_max = all_values.max()
+        else:
+            global_min = float(payload['global_min'])
+            global_max = float(payload['global_max'])
+
+        timestamps = payload.get('timestamp_columns') or [payload.get('timestamp')]
+
+        if not timestamps:
+            return jsonify({'error': 'No timestamps provided'}), 400
+
+        timestamp = timestamps
+        if not timestamp or 'timestamp' not in df.columns:
+            return jsonify({'error': 'Missing timestamp field in data'}), 400
+
+        # Lagoon boundary (avoid GeoPandas+Fiona by using pure JSON + Shapely)
+        # Resolve dynamic boundary path: payload > session > default
+        boundary_path = payload.get('boundary_path') or session.get('boundary_geojson') or DEFAULT_HEATMAP_BOUNDARY
+        fs_path = boundary_path
+        if boundary_path.startswith('/'):
+            fs_path = os.path.join(current_app.root_path, boundary_path.lstrip('/'))
+        elif not os.path.isabs(boundary_path):
+            fs_path = os.path.join(current_app.root_path, boundary_path)
+        colormap_name = payload.get('colormap', 'turbo')
+
+        logging.info(f"Generating {len(timestamps)} {quality} heatmaps ({method}, bandwidth {bandwidth_km} km, "
+                     f"range {global_min}..{global_max})")
+
+        # Byte-identical requests from several browsers render once.
+        key = canonical_key([dataset or data_records, timestamps, method, bandwidth_km, quality, global_min, global_max,
+                             colormap_name, fs_path])
+        results, shared = await heatmap_flights.run(key, lambda: render_executor.run(
+            'heatmap', render_heatmaps, df, timestamps, method=method, bandwidth_km=bandwidth_km, settings=settings,
+            global_min=global_min, global_max=global_max, colormap_name=colormap_name, fs_path=fs_path,
+        ))
+        if shared:
+            logging.info("Heatmap request joined an identical render in flight")
+
         # --- End Masking ---
-        print(f"\nGenerated {len(results)} heatmaps successfully")
+        logging.info(f"Generated {len(results)} heatmaps")
         return jsonify({
             'images': results,
             'global_min': float(global_min),
-            'global_max': float(global_max)
+            'global_max': float(global_max),
+            'quality': quality
         }), 200
 
+    except RenderBusyError as e:
+        return busy_response(e)
+    except HeatmapRenderError as e:
+        return jsonify({'error': str(e)}), 500
     except Exception as e:
         logging.error(f"Heatmap generation failed: {e}", exc_info=True)
         return jsonify({'error': 'Could not generate heatmap.'}), 500
 
-@app.route('/animate')
+@main_bp.route('/animate')
 async def animation_page():
     return await render_template('animation.html')
 
 # --- Error Handlers --------------------------------------------------------------
 
-@app.errorhandler(404)
+@main_bp.app_errorhandler(404)
 def not_found_error(error):
     return jsonify({'error': 'Resource not found.'}), 404
 
-@app.errorhandler(500)
+@main_bp.app_errorhandler(500)
 def internal_error(error):
     logging.error(f'Internal Server Error: {error}', exc_info=True)
     return jsonify({'error': 'An internal server error occurred.'}), 500
 
-from routes.animation_api import animation_bp
-app.register_blueprint(animation_bp)
 
 # --- Boundary Upload ------------------------------------------------------------
 
-@app.route('/upload-boundary', methods=['POST'])
+@main_bp.route('/upload-boundary', methods=['POST'])
 async def upload_boundary():
     try:
         files = await request.files
@@ -594,8 +768,10 @@ async def upload_boundary():
         bname = secure_filename(bfile.filename)
         if not bname.lower().endswith(('.geojson', '.json')):
             return jsonify({'error': 'Only .geojson or .json files are allowed'}), 400
-        save_path = os.path.join(app.config['BOUNDARY_UPLOAD_DIR'], bname)
-        bfile.save(save_path)
+        save_path = os.path.join(current_app.config['BOUNDARY_UPLOAD_DIR'], bname)
+        await bfile.save(save_path)
+        # Boundaries are fetched by every page load that uses them.
+        await asyncio.to_thread(precompress_file, save_path, False)
         # Save for later requests
         session['boundary_geojson'] = save_path
         # Return a static URL path so frontend can fetch it
@@ -605,7 +781,55 @@ async def upload_boundary():
         logging.error(f"Boundary upload failed: {e}", exc_info=True)
         return jsonify({'error': 'Boundary upload failed'}), 500
 
-@app.route('/legend/<timestamp>.png')
+def render_legend(global_min: float, global_max: float, colormap: str) -> bytes:
+    """PNG of a vertical colorbar; runs on the render executor, so no pyplot."""
+    import numpy as np
+    import matplotlib
+    from matplotlib.colors import Normalize
+    from matplotlib.colorbar import ColorbarBase
+    from matplotlib.figure import Figure
+
+    clock = StageClock()
+    fig = Figure(figsize=(1.4, 12))
+    ax = fig.subplots()
+    fig.patch.set_alpha(0)
+
+    # Colormap from the request, turbo if unknown (as in render_heatmaps)
+    try:
+        cmap = matplotlib.colormaps[colormap]
+    except KeyError:
+        cmap = matplotlib.colormaps['turbo']
+
+    norm = Normalize(vmin=global_min, vmax=global_max)
+    cbar = ColorbarBase(
+        ax,
+        cmap=cmap,
+        norm=norm,
+        orientation='vertical'
+    )
+
+    tick_values = np.linspace(global_min, global_max, 7)
+    cbar.set_ticks(tick_values)
+    cbar.set_ticklabels([f"{v:.2f}" for v in tick_values])
+
+    # Give extra padding between bar and labels
+    cbar.ax.tick_params(labelsize=18, width=1.2, length=6, pad=8)
+    for label in cbar.ax.get_yticklabels():
+        label.set_fontweight('bold')
+
+    buf = io.BytesIO()
+    fig.savefig(
+        buf,
+        format='png',
+        dpi=200,
+        bbox_inches='tight',   # keep ticks inside
+        transparent=True,
+        pad_inches=0.3         # more padding on sides
+    )
+    clock.lap('legend.render')
+    return buf.getvalue()
+
+@main_bp.route('/legend/<timestamp>.png')
 async def serve_legend(timestamp):
     """Generates a vertical colorbar legend image with fixed global scale."""
     try:
@@ -614,44 +838,118 @@ async def serve_legend(timestamp):
         global_max = float(request.args.get('max', 1))
         colormap = request.args.get('colormap', 'turbo')
 
-        fig, ax = plt.subplots(figsize=(1.4, 12))
-        fig.patch.set_alpha(0)
-
-        norm = Normalize(vmin=global_min, vmax=global_max)
-        cbar = ColorbarBase(
-            ax,
-            cmap=matplotlib.cm.get_cmap(colormap),
-            norm=norm,
-            orientation='vertical'
-        )
-
-        tick_values = np.linspace(global_min, global_max, 7)
-        cbar.set_ticks(tick_values)
-        cbar.set_ticklabels([f"{v:.2f}" for v in tick_values])
-
-        # Give extra padding between bar and labels
-        cbar.ax.tick_params(labelsize=18, width=1.2, length=6, pad=8)
-        for label in cbar.ax.get_yticklabels():
-            label.set_fontweight('bold')
-
-        buf = io.BytesIO()
-        plt.savefig(
-            buf,
-            format='png',
-            dpi=200,
-            bbox_inches='tight',   # keep ticks inside
-            transparent=True,
-            pad_inches=0.3         # more padding on sides
-        )
-        plt.close(fig)
-
-        buf.seek(0)
-        return await send_file(buf, mimetype='image/png')
+        png = await render_executor.run('legend', render_legend, global_min, global_max, colormap)
+        return await send_file(io.BytesIO(png), mimetype='image/png')
 
+    except RenderBusyError as e:
+        return busy_response(e)
     except Exception as e:
         logging.error(f"Legend generation failed: {e}", exc_info=True)
         return jsonify({'error': 'Could not generate legend'}), 500
 
+# --- Warm-up ---------------------------------------------------------------------
+
+# Colormaps offered by the heatmap and animation forms.
+WARM_UP_COLORMAPS = ('turbo', 'viridis', 'plasma', 'inferno', 'magma', 'cividis', 'jet', 'rainbow', 'gray')
+
+async def _warm_up():
+    """Load the heavy libraries and prime per-process caches before serving.
+
+    Enabled with WARM_UP=1, so the first heatmap/animation request on a fresh
+    worker does not pay for imports, boundary parsing or matplotlib's font cache.
+    """
+    started = time.perf_counter()
+    import pandas  # noqa: F401
+    import scipy.ndimage  # noqa: F401
+    import sklearn.neighbors  # noqa: F401
+    from utils.animation_engine import load_boundary
+    from utils.frame_encoder import colormap_lut
+    imported = time.perf_counter()
+
+    heatmap_boundary(os.path.join(current_app.root_path, DEFAULT_HEATMAP_BOUNDARY))
+    load_boundary()
+    for name in WARM_UP_COLORMAPS:
+        colormap_lut(name)
+
+    # Drawing text once builds matplotlib's font cache and loads the fonts.
+    render_legend(0.0, 1.0, 'turbo')
+    logging.info(f"Warm-up done in {time.perf_counter() - started:.2f}s "
+                 f"(imports {imported - started:.2f}s)")
+
+# --- App Factory -----------------------------------------------------------------
+
+async def _shutdown_render_executor():
+    render_executor.shutdown()
+
+
+def _secret_key() -> bytes:
+    """Session key shared by every worker: SECRET_KEY, else a key file created once."""
+    if os.getenv('SECRET_KEY'):
+        return os.environ['SECRET_KEY'].encode()
+    path = os.getenv('SECRET_KEY_FILE', os.path.join('data', 'secret_key'))
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    try:
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    except FileExistsError:
+        # Another worker created it; wait until its key is written.
+        for _ in range(50):
+            key = Path(path).read_bytes()
+            if key:
+                return key
+            time.sleep(0.01)
+        raise RuntimeError(f"Secret key file {path} is empty")
+    key = os.urandom(24)
+    with os.fdopen(fd, 'wb') as f:
+        f.write(key)
+    return key
+
+
+def create_app() -> Quart:
+    """Build the Quart app; import-time work stays limited to defining routes."""
+    # LOG_LEVEL=DEBUG turns on the per-request data diagnostics.
+    logging.basicConfig(level=os.getenv('LOG_LEVEL', 'INFO').upper(),
+                        format='%(asctime)s - %(levelname)s - %(message)s')
+
+    # Allocation tracing slows every allocation, so it is opt-in:
+    # TRACEMALLOC=<frames> (e.g. TRACEMALLOC=1).
+    if os.getenv('TRACEMALLOC'):
+        import tracemalloc
+        tracemalloc.start(int(os.getenv('TRACEMALLOC')) if os.getenv('TRACEMALLOC').isdigit() else 1)
+
+    app = Quart(__name__, static_folder=None)
+
+    app.config['PROVIDE_AUTOMATIC_OPTIONS'] = True
+    app.config['SECRET_KEY'] = _secret_key()
+    app.config['MAX_CONTENT_LENGTH'] = 50 * 1024 * 1024  # 50MB
+    app.config['UPLOAD_FOLDER'] = 'uploads'
+    app.config['BOUNDARY_UPLOAD_DIR'] = os.path.join('static', 'data', 'uploads')
+
+    # Create uploads directory if it doesn't exist
+    Path(app.config['UPLOAD_FOLDER']).mkdir(parents=True, exist_ok=True)
+    Path(app.config['BOUNDARY_UPLOAD_DIR']).mkdir(parents=True, exist_ok=True)
+
+    # Manually set static folder path; files are served with their precompressed variants.
+    app.static_folder = os.path.join(app.root_path, 'static')
+    app.static_url_path = '/static'
+    app.add_url_rule(
+        '/static/<path:filename>',
+        endpoint='static',
+        view_func=static_file
+    )
+
+    app.register_blueprint(main_bp)
+    app.register_blueprint(data_api_bp)
+    app.register_blueprint(animation_bp)
+    app.register_blueprint(profiling_bp)
+    # After the blueprints' hooks, so animation jobs are cancelled before the executor drains.
+    app.after_serving(_shutdown_render_executor)
+
+    if os.getenv('WARM_UP', '').lower() in ('1', 'true', 'yes'):
+        app.before_serving(_warm_up)
+    return app
+
+app = create_app()
+
 # --- Main Execution --------------------------------------------------------------
 
 if __name__ == '__main__':
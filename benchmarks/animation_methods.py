@@ -0,0 +1,83 @@
+"""Compare the animation engine's interpolation methods on one dataset.
+
+Every spatial method is combined with every temporal method on the same
+synthetic dataset. The keyframe stage (spatial interpolation of every date)
+and the full render + encode are timed separately.
+
+    python -m benchmarks.animation_methods [--stations 40] [--dates 12] [--fpt 10]
+"""
+
+import argparse
+import json
+import os
+import tempfile
+import time
+
+from benchmarks.synthetic import synthetic_measurements
+from utils.animation_engine import (
+    SPATIAL_METHODS, TEMPORAL_METHODS, keyframe_fields, load_boundary, make_grid, render_animation,
+    spatial_interpolator,
+)
+from utils.parallel_render import shutdown_render_pools
+
+
+def run(df, spatial_methods, temporal_methods, fps: int, fpt: int, grid_size: int) -> list[dict]:
+    boundary = load_boundary()
+    grid_shape, grid_points = make_grid(boundary.bounds, grid_size)
+    value_range = (float(df["value"].min()), float(df["value"].max()))
+    results = []
+    for spatial in spatial_methods:
+        start = time.perf_counter()
+        keyframe_fields(df, spatial_interpolator(spatial, grid_points, value_range), grid_shape)
+        keyframes_s = time.perf_counter() - start
+        for temporal in temporal_methods:
+            fd, path = tempfile.mkstemp(suffix=".mp4")
+            os.close(fd)
+            try:
+                start = time.perf_counter()
+                frames = render_animation(df, path, fps=fps, frames_per_transition=fpt, cmap="turbo",
+                                          spatial=spatial, temporal=temporal, grid_size=grid_size)
+                total_s = time.perf_counter() - start
+                size = os.path.getsize(path)
+            finally:
+                os.remove(path)
+            results.append({
+                "spatial": spatial,
+                "temporal": temporal,
+                "frames": frames,
+                "keyframes_s": round(keyframes_s, 3),
+                "total_s": round(total_s, 3),
+                "fps_rendered": round(frames / total_s, 1),
+                "mp4_bytes": size,
+            })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--stations", type=int, default=40)
+    parser.add_argument("--dates", type=int, default=12)
+    parser.add_argument("--fps", type=int, default=15)
+    parser.add_argument("--fpt", type=int, default=10, help="frames per transition")
+    parser.add_argument("--grid", type=int, default=300)
+    parser.add_argument("--spatial", default=",".join(SPATIAL_METHODS))
+    parser.add_argument("--temporal", default=",".join(TEMPORAL_METHODS))
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    df = synthetic_measurements(args.stations, args.dates)
+    try:
+        results = run(df, args.spatial.split(","), args.temporal.split(","), args.fps, args.fpt, args.grid)
+    finally:
+        shutdown_render_pools()
+
+    print(f"stations={args.stations} dates={args.dates} grid={args.grid}")
+    for row in results:
+        print("  ".join(f"{key}={value}" for key, value in row.items()))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"stations": args.stations, "dates": args.dates, "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,379 @@
+"""Concurrent end-to-end load test of the Quart app.
+
+Simulated users issue a weighted mix of requests (upload, heatmap, legend,
+table reads and writes, animation jobs) for a fixed duration. The app runs
+in this process, either behind the Quart test client or behind a local
+hypercorn server on the same event loop (the Dockerfile's single worker).
+While the load runs, a probe task measures event-loop lag: how late a
+short sleep wakes up. Any handler that blocks the loop shows up there.
+
+    python -m benchmarks.load_test [--users 8] [--duration 30] [--transport hypercorn]
+                                   [--mix heatmap=4,legend=2,...] [--json results.json]
+
+Throughput and p50/p95/p99 latency are reported per endpoint. Requests
+answered with a non-2xx status are counted as errors.
+"""
+
+import argparse
+import asyncio
+import io
+import json
+import os
+import platform
+import random
+import tempfile
+import time
+import urllib.error
+import urllib.request
+import uuid
+from collections import defaultdict
+from datetime import datetime, timezone
+
+import numpy as np
+from werkzeug.datastructures import FileStorage
+
+from benchmarks.synthetic import synthetic_measurements, upload_table, write_table
+
+DEFAULT_MIX = {
+    "heatmap": 3,
+    "legend": 2,
+    "table_read": 3,
+    "table_write": 2,
+    "upload": 1,
+    "animation": 1,
+}
+LAG_PROBE_SECONDS = 0.01
+ANIMATION_POLL_SECONDS = 0.5
+
+
+# ---------------------------------------------------------------------------
+# Transports
+# ---------------------------------------------------------------------------
+
+class TestClientTransport:
+    """Requests through Quart's in-process test client."""
+
+    def __init__(self, test_app):
+        self.client = test_app.test_client()
+
+    async def request(self, method: str, path: str, json_body=None, upload=None) -> tuple[int, bytes]:
+        kwargs = {}
+        if json_body is not None:
+            kwargs["json"] = json_body
+        if upload is not None:
+            filename, data = upload
+            kwargs["files"] = {"file": FileStorage(io.BytesIO(data), filename=filename)}
+        response = await self.client.open(path, method=method, **kwargs)
+        return response.status_code, await response.get_data()
+
+
+class HttpTransport:
+    """Real HTTP against ``base_url``; blocking urllib calls run in threads."""
+
+    def __init__(self, base_url: str):
+        self.base_url = base_url.rstrip("/")
+
+    def _send(self, method, path, body, headers) -> tuple[int, bytes]:
+        req = urllib.request.Request(self.base_url + path, data=body, headers=headers, method=method)
+        try:
+            with urllib.request.urlopen(req, timeout=600) as response:
+                return response.status, response.read()
+        except urllib.error.HTTPError as e:
+            return e.code, e.read()
+
+    async def request(self, method: str, path: str, json_body=None, upload=None) -> tuple[int, bytes]:
+        headers, body = {}, None
+        if json_body is not None:
+            headers["Content-Type"] = "application/json"
+            body = json.dumps(json_body).encode()
+        elif upload is not None:
+            filename, data = upload
+            boundary = uuid.uuid4().hex
+            headers["Content-Type"] = f"multipart/form-data; boundary={boundary}"
+            body = (f"--{boundary}\r\nContent-Disposition: form-data; name=\"file\"; filename=\"{filename}\"\r\n"
+                    f"Content-Type: application/octet-stream\r\n\r\n").encode() + data + f"\r\n--{boundary}--\r\n".encode()
+        return await asyncio.to_thread(self._send, method, path, body, headers)
+
+
+# ---------------------------------------------------------------------------
+# Scenarios
+# ---------------------------------------------------------------------------
+
+class Workload:
+    """Synthetic dataset and per-run state shared by the simulated users."""
+
+    def __init__(self, args):
+        self.args = args
+        self.df = synthetic_measurements(args.stations, args.dates)
+        self.records = [
+            {"latitude": r.latitude, "longitude": r.longitude, "value": r.value,
+             "timestamp": r.sampled_at.strftime("%Y-%m-%d")}
+            for r in self.df.itertuples()
+        ]
+        self.timestamps = sorted({r["timestamp"] for r in self.records})
+        self.value_range = (float(self.df["value"].min()), float(self.df["value"].max()))
+        # Animation requests read the uploaded file from uploads/, so it is
+        # placed there up front rather than after the first upload request.
+        self.filename = f"loadtest_{os.getpid()}.csv"
+        os.makedirs("uploads", exist_ok=True)
+        with open(write_table(upload_table(self.df, "wide"), os.path.join("uploads", self.filename)), "rb") as f:
+            self.upload_bytes = f.read()
+
+
+async def heatmap(transport, load: Workload, rng: random.Random, record):
+    ts = rng.choice(load.timestamps)
+    payload = {
+        "data": [r for r in load.records if r["timestamp"] == ts],
+        "timestamp_columns": [ts],
+        "method": rng.choice(("idw", "kde")),
+        "bandwidth": 2.7,
+        "quality": load.args.heatmap_quality,
+        "global_min": load.value_range[0],
+        "global_max": load.value_range[1],
+    }
+    await record("POST /generate-heatmap", transport.request("POST", "/generate-heatmap", payload))
+
+
+async def legend(transport, load: Workload, rng: random.Random, record):
+    lo, hi = load.value_range
+    cmap = rng.choice(("turbo", "viridis", "plasma"))
+    await record("GET /legend", transport.request("GET", f"/legend/load.png?min={lo}&max={hi}&colormap={cmap}"))
+
+
+async def table_read(transport, load: Workload, rng: random.Random, record):
+    await record("GET /api/table", transport.request("GET", "/api/table"))
+
+
+async def table_write(transport, load: Workload, rng: random.Random, record):
+    cells = [{"latitude": r["latitude"], "longitude": r["longitude"], "parameter": "LoadTest",
+              "sampled_at": r["timestamp"], "value": r["value"] + rng.gauss(0, 0.1)}
+             for r in rng.sample(load.records, min(20, len(load.records)))]
+    await record("POST /api/table", transport.request("POST", "/api/table", {"cells": cells}))
+
+
+async def upload(transport, load: Workload, rng: random.Random, record):
+    await record("POST /upload", transport.request("POST", "/upload", upload=(load.filename, load.upload_bytes)))
+
+
+async def animation(transport, load: Workload, rng: random.Random, record):
+    """Submit an animation job and wait for it; job latency is recorded separately."""
+    payload = {
+        "parameter": "LoadTest",
+        "start_date": load.timestamps[0],
+        "end_date": load.timestamps[-1],
+        "fps": 10,
+        # Vary the render so the disk cache does not answer every request.
+        "frames_per_transition": rng.randint(2, 12),
+        "colormap": rng.choice(("turbo", "viridis", "plasma")),
+        "method": "idw",
+        "temporal": "linear",
+        "quality": load.args.animation_quality,
+        "filename": load.filename,
+    }
+    start = time.perf_counter()
+    status, body = await record("POST /api/animate", transport.request("POST", "/api/animate", payload))
+    if status != 202:
+        return
+    status_url = json.loads(body)["status_url"]
+    while True:
+        await asyncio.sleep(ANIMATION_POLL_SECONDS)
+        status, body = await transport.request("GET", status_url)
+        if status != 200 or json.loads(body)["status"] in ("done", "failed", "cancelled"):
+            break
+    ok = status == 200 and json.loads(body)["status"] == "done"
+    record.add("animation job", time.perf_counter() - start, 200 if ok else 500)
+
+
+SCENARIOS = {
+    "heatmap": heatmap,
+    "legend": legend,
+    "table_read": table_read,
+    "table_write": table_write,
+    "upload": upload,
+    "animation": animation,
+}
+
+
+# ---------------------------------------------------------------------------
+# Measurement
+# ---------------------------------------------------------------------------
+
+class Recorder:
+    """Latency samples and status counts per endpoint."""
+
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.statuses = defaultdict(lambda: defaultdict(int))
+
+    def add(self, endpoint: str, seconds: float, status: int) -> None:
+        self.latencies[endpoint].append(seconds)
+        self.statuses[endpoint][status] += 1
+
+    async def __call__(self, endpoint: str, pending) -> tuple[int, bytes]:
+        start = time.perf_counter()
+        status, body = await pending
+        self.add(endpoint, time.perf_counter() - start, status)
+        return status, body
+
+
+def _percentiles(samples) -> dict:
+    values = np.asarray(samples) * 1000
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return {"p50_ms": round(p50, 1), "p95_ms": round(p95, 1), "p99_ms": round(p99, 1),
+            "max_ms": round(float(values.max()), 1)}
+
+
+async def _probe_loop_lag(samples: list, stop: asyncio.Event) -> None:
+    """Record how late a LAG_PROBE_SECONDS sleep wakes up."""
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(LAG_PROBE_SECONDS)
+        samples.append(max(0.0, time.perf_counter() - start - LAG_PROBE_SECONDS))
+
+
+async def _user(transport, load: Workload, mix: dict, seed: int, deadline: float, record: Recorder) -> None:
+    rng = random.Random(seed)
+    names, weights = list(mix), list(mix.values())
+    while time.perf_counter() < deadline:
+        scenario = SCENARIOS[rng.choices(names, weights)[0]]
+        try:
+            await scenario(transport, load, rng, record)
+        except Exception as e:
+            record.add(f"{scenario.__name__} (exception)", 0.0, 599)
+            print(f"{scenario.__name__} failed: {e!r}")
+
+
+async def _drive(transport, load: Workload, args, mix: dict) -> dict:
+    record, lag = Recorder(), []
+    stop = asyncio.Event()
+    probe = asyncio.create_task(_probe_loop_lag(lag, stop))
+    start = time.perf_counter()
+    deadline = start + args.duration
+    await asyncio.gather(*(_user(transport, load, mix, args.seed + i, deadline, record) for i in range(args.users)))
+    elapsed = time.perf_counter() - start
+    stop.set()
+    await probe
+
+    endpoints = {}
+    for endpoint, samples in sorted(record.latencies.items()):
+        statuses = record.statuses[endpoint]
+        endpoints[endpoint] = {
+            "requests": len(samples),
+            "errors": sum(n for status, n in statuses.items() if not 200 <= status < 300),
+            "statuses": {str(status): n for status, n in sorted(statuses.items())},
+            "throughput_rps": round(len(samples) / elapsed, 2),
+            **_percentiles(samples),
+        }
+    total = sum(len(s) for endpoint, s in record.latencies.items() if endpoint != "animation job")
+    return {
+        "elapsed_s": round(elapsed, 2),
+        "requests": total,
+        "throughput_rps": round(total / elapsed, 2),
+        "endpoints": endpoints,
+        "loop_lag": _percentiles(lag) if lag else None,
+    }
+
+
+async def run(args, mix: dict) -> dict:
+    from app import app
+
+    load = Workload(args)
+    try:
+        if args.transport == "testclient":
+            async with app.test_app() as test_app:
+                return await _drive(TestClientTransport(test_app), load, args, mix)
+
+        from hypercorn.asyncio import serve
+        from hypercorn.config import Config
+
+        config = Config()
+        config.bind = [f"127.0.0.1:{args.port}"]
+        config.accesslog = None
+        shutdown = asyncio.Event()
+        server = asyncio.create_task(serve(app, config, shutdown_trigger=shutdown.wait))
+        await asyncio.sleep(1.0)  # let the server bind and run before_serving
+        try:
+            return await _drive(HttpTransport(f"http://127.0.0.1:{args.port}"), load, args, mix)
+        finally:
+            shutdown.set()
+            await server
+    finally:
+        uploaded = os.path.join("uploads", load.filename)
+        if os.path.exists(uploaded):
+            os.remove(uploaded)
+
+
+def _parse_mix(text: str) -> dict:
+    mix = {}
+    for item in text.split(","):
+        name, _, weight = item.partition("=")
+        if name not in SCENARIOS:
+            raise ValueError(f"Unknown scenario '{name}'. Choose from {list(SCENARIOS)}.")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=8, help="concurrent simulated users")
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds of load")
+    parser.add_argument("--transport", choices=("testclient", "hypercorn"), default="testclient")
+    parser.add_argument("--port", type=int, default=7861, help="hypercorn port")
+    parser.add_argument("--mix", default=",".join(f"{k}={v}" for k, v in DEFAULT_MIX.items()),
+                        help="scenario=weight pairs")
+    parser.add_argument("--stations", type=int, default=40)
+    parser.add_argument("--dates", type=int, default=12)
+    parser.add_argument("--heatmap-quality", choices=("full", "preview"), default="preview")
+    parser.add_argument("--animation-quality", choices=("full", "preview"), default="preview")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+    try:
+        mix = _parse_mix(args.mix)
+    except ValueError as e:
+        parser.error(str(e))
+
+    with tempfile.TemporaryDirectory(prefix="trendmapp-load-") as workdir:
+        # Must be set before db.py is imported (via app).
+        os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{os.path.join(workdir, 'load.db')}"
+        started = datetime.now(timezone.utc).isoformat(timespec="seconds")
+        try:
+            summary = asyncio.run(run(args, mix))
+        finally:
+            from utils.parallel_render import shutdown_render_pools
+            shutdown_render_pools()
+
+    print(f"\n{summary['requests']} requests in {summary['elapsed_s']}s "
+          f"({summary['throughput_rps']} req/s, {args.users} users, {args.transport})")
+    print(f"{'endpoint':<24}{'n':>6}{'err':>5}{'rps':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for endpoint, row in summary["endpoints"].items():
+        print(f"{endpoint:<24}{row['requests']:>6}{row['errors']:>5}{row['throughput_rps']:>8}"
+              f"{row['p50_ms']:>10}{row['p95_ms']:>10}{row['p99_ms']:>10}")
+    if summary["loop_lag"]:
+        lag = summary["loop_lag"]
+        print(f"event-loop lag: p50 {lag['p50_ms']} ms, p95 {lag['p95_ms']} ms, "
+              f"p99 {lag['p99_ms']} ms, max {lag['max_ms']} ms")
+
+    if args.json:
+        report = {
+            "meta": {
+                "started": started,
+                "python": platform.python_version(),
+                "cpu_count": os.cpu_count(),
+                "users": args.users,
+                "duration_s": args.duration,
+                "transport": args.transport,
+                "mix": mix,
+                "stations": args.stations,
+                "dates": args.dates,
+                "heatmap_quality": args.heatmap_quality,
+                "animation_quality": args.animation_quality,
+            },
+            **summary,
+        }
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
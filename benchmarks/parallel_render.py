@@ -0,0 +1,117 @@
+"""Benchmark frame-parallel animation rendering.
+
+Renders a synthetic animation over the lagoon boundary with 1, 2, 4 and 8
+worker processes, checks that every run produces the same frames as the
+serial path, and reports frames per second. ``--encode`` also times the
+full render + H.264 encode.
+
+    python -m benchmarks.parallel_render [--keyframes 24] [--fpt 15] [--encode]
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from utils.animation_engine import load_boundary
+from utils.frame_encoder import FrameRenderer, encode_video_to_file
+from utils.parallel_render import iter_rendered_frames, shutdown_render_pools
+from utils.temporal_interp import LazyTemporalInterpolator
+
+
+def _synthetic_keyframes(n_keys: int, grid: int, seed: int = 0) -> np.ndarray:
+    """Smooth random fields: a few moving Gaussian blobs per keyframe."""
+    rng = np.random.default_rng(seed)
+    x, y = np.mgrid[0:1:grid * 1j, 0:1:grid * 1j]
+    frames = np.empty((n_keys, grid, grid), dtype=np.float32)
+    centers = rng.uniform(0, 1, (6, 2))
+    for k in range(n_keys):
+        centers = np.clip(centers + rng.normal(0, 0.05, centers.shape), 0, 1)
+        field = np.zeros_like(x)
+        for cx, cy in centers:
+            field += np.exp(-((x - cx) ** 2 + (y - cy) ** 2) / 0.02)
+        frames[k] = field
+    return frames
+
+
+def _setup(n_keys: int, grid: int, width: int):
+    boundary = load_boundary()
+    keyframes = _synthetic_keyframes(n_keys, grid)
+    temporal = LazyTemporalInterpolator(keyframes, kind="cubic")
+    renderer = FrameRenderer(boundary, boundary.bounds, (grid, grid), "turbo",
+                             float(keyframes.min()), float(keyframes.max()), width=width)
+    return temporal, renderer
+
+
+def run(workers_list, n_keys: int, fpt: int, grid: int, width: int, encode: bool) -> list[dict]:
+    temporal, renderer = _setup(n_keys, grid, width)
+    total_frames = (n_keys - 1) * fpt
+    results, reference = [], None
+    for workers in workers_list:
+        # Warm the pool so process start-up is not counted.
+        for _ in iter_rendered_frames(temporal, renderer, 32, workers=workers):
+            pass
+
+        digest = hashlib.sha256()
+        start = time.perf_counter()
+        for frame in iter_rendered_frames(temporal, renderer, total_frames, workers=workers):
+            digest.update(frame)
+        render_s = time.perf_counter() - start
+        if reference is None:
+            reference = digest.hexdigest()
+        row = {
+            "workers": workers,
+            "frames": total_frames,
+            "render_s": round(render_s, 3),
+            "render_fps": round(total_frames / render_s, 1),
+            "identical": digest.hexdigest() == reference,
+        }
+
+        if encode:
+            fd, path = tempfile.mkstemp(suffix=".mp4")
+            os.close(fd)
+            try:
+                start = time.perf_counter()
+                encode_video_to_file(iter_rendered_frames(temporal, renderer, total_frames, workers=workers),
+                                     15, path)
+                row["encode_s"] = round(time.perf_counter() - start, 3)
+            finally:
+                os.remove(path)
+        results.append(row)
+    base = results[0]["render_s"]
+    for row in results:
+        row["speedup"] = round(base / row["render_s"], 2)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", default="1,2,4,8")
+    parser.add_argument("--keyframes", type=int, default=24)
+    parser.add_argument("--fpt", type=int, default=15, help="frames per transition")
+    parser.add_argument("--grid", type=int, default=300)
+    parser.add_argument("--width", type=int, default=600)
+    parser.add_argument("--encode", action="store_true", help="also time render + encode")
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    workers_list = [int(w) for w in args.workers.split(",")]
+    try:
+        results = run(workers_list, args.keyframes, args.fpt, args.grid, args.width, args.encode)
+    finally:
+        shutdown_render_pools()
+
+    print(f"cpu_count={os.cpu_count()}")
+    for row in results:
+        print("  ".join(f"{key}={value}" for key, value in row.items()))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"cpu_count": os.cpu_count(), "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
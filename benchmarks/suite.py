@@ -0,0 +1,291 @@
+"""Timed microbenchmarks for the upload, heatmap, legend, animation and table paths.
+
+Every case runs against a synthetic dataset over the bundled lagoon
+boundary and an embedded SQLite database in a temporary directory, so no
+server database is touched. Requests go through the Quart test client, so
+routing, JSON and session handling are included in the timings.
+
+    python -m benchmarks.suite [--stations 40] [--dates 12] [--repeat 3] [--cases 'heatmap_*']
+                               [--json results.json] [--baseline previous.json]
+
+``--baseline`` prints each case's median against an earlier ``--json`` run.
+"""
+
+import argparse
+import asyncio
+import fnmatch
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+from werkzeug.datastructures import FileStorage
+
+from benchmarks.synthetic import synthetic_measurements, upload_table, write_table
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# name -> (async case function, description); filled by @case.
+CASES = {}
+
+
+def case(name: str, description: str):
+    def register(fn):
+        CASES[name] = (fn, description)
+        return fn
+    return register
+
+
+class Context:
+    """Shared state for the cases: dataset, temp dir and the app client."""
+
+    def __init__(self, args, workdir: str):
+        self.args = args
+        self.workdir = workdir
+        self.df = synthetic_measurements(args.stations, args.dates)
+        self.records = [
+            {"latitude": r.latitude, "longitude": r.longitude, "value": r.value,
+             "timestamp": r.sampled_at.strftime("%Y-%m-%d")}
+            for r in self.df.itertuples()
+        ]
+        self.timestamps = sorted({r["timestamp"] for r in self.records})
+        self.value_range = (float(self.df["value"].min()), float(self.df["value"].max()))
+        self.files = {}
+        for layout in ("wide", "long"):
+            table = upload_table(self.df, layout)
+            for ext in ("csv", "xlsx"):
+                self.files[(ext, layout)] = write_table(table, os.path.join(workdir, f"synthetic_{layout}.{ext}"))
+        self.client = None
+        self.calls = 0
+
+    def next_id(self) -> int:
+        self.calls += 1
+        return self.calls
+
+
+async def _check(response, expected: int = 200):
+    if response.status_code != expected:
+        body = await response.get_data(as_text=True)
+        raise RuntimeError(f"HTTP {response.status_code}: {body[:200]}")
+    return response
+
+
+# ---------------------------------------------------------------------------
+# Cases
+# ---------------------------------------------------------------------------
+
+@case("import_app", "python -c 'import app' in a fresh interpreter (worker cold start)")
+async def import_app(ctx: Context):
+    # Same environment, so the child also uses the temporary database.
+    await asyncio.to_thread(subprocess.run, [sys.executable, "-c", "import app"], check=True,
+                            cwd=PROJECT_ROOT, capture_output=True)
+
+
+def _upload_case(ext: str, layout: str):
+    async def run(ctx: Context):
+        with open(ctx.files[(ext, layout)], "rb") as f:
+            data = f.read()
+        upload = FileStorage(io.BytesIO(data), filename=f"synthetic_{layout}.{ext}")
+        await _check(await ctx.client.post("/upload", files={"file": upload}))
+    return run
+
+
+for _ext in ("csv", "xlsx"):
+    for _layout in ("wide", "long"):
+        case(f"upload_{_ext}_{_layout}", f"POST /upload, {_layout} {_ext.upper()}")(_upload_case(_ext, _layout))
+
+
+def _heatmap_case(method: str):
+    async def run(ctx: Context):
+        # One timestamp per call: the per-frame cost is what changes matter to.
+        ts = ctx.timestamps[0]
+        payload = {
+            "data": [r for r in ctx.records if r["timestamp"] == ts],
+            "timestamp_columns": [ts],
+            "method": method,
+            "bandwidth": 2.7,
+            "quality": ctx.args.heatmap_quality,
+            "global_min": ctx.value_range[0],
+            "global_max": ctx.value_range[1],
+        }
+        await _check(await ctx.client.post("/generate-heatmap", json=payload))
+    return run
+
+
+case("heatmap_idw", "POST /generate-heatmap, IDW, one timestamp")(_heatmap_case("idw"))
+case("heatmap_kde", "POST /generate-heatmap, KDE, one timestamp")(_heatmap_case("kde"))
+
+
+@case("legend", "GET /legend/<timestamp>.png")
+async def legend(ctx: Context):
+    lo, hi = ctx.value_range
+    await _check(await ctx.client.get(f"/legend/bench.png?min={lo}&max={hi}&colormap=turbo"))
+
+
+@case("render_frames", "FrameRenderer.render of 100 animation frames")
+async def render_frames(ctx: Context):
+    from utils.animation_engine import keyframe_fields, load_boundary, make_grid, spatial_interpolator
+    from utils.frame_encoder import FrameRenderer
+
+    if not hasattr(ctx, "render_setup"):
+        boundary = load_boundary()
+        grid_shape, grid_points = make_grid(boundary.bounds)
+        keyframes, _ = keyframe_fields(ctx.df, spatial_interpolator("idw", grid_points, ctx.value_range), grid_shape)
+        renderer = FrameRenderer(boundary, boundary.bounds, grid_shape, "turbo", *ctx.value_range)
+        ctx.render_setup = (keyframes, renderer)
+    keyframes, renderer = ctx.render_setup
+    for i in range(100):
+        renderer.render(keyframes[i % len(keyframes)])
+
+
+@case("animation", "render_animation to MP4, IDW + linear, 10 frames per transition")
+async def animation(ctx: Context):
+    from utils.animation_engine import render_animation
+
+    path = os.path.join(ctx.workdir, "bench.mp4")
+    await asyncio.to_thread(render_animation, ctx.df, path, fps=15, frames_per_transition=10, cmap="turbo",
+                            spatial="idw", temporal="linear", quality=ctx.args.animation_quality)
+
+
+def _table_cells(ctx: Context, parameter: str) -> list[dict]:
+    return [{"latitude": r["latitude"], "longitude": r["longitude"], "parameter": parameter,
+             "sampled_at": r["timestamp"], "value": r["value"]} for r in ctx.records]
+
+
+@case("post_table_insert", "POST /api/table, every cell new")
+async def post_table_insert(ctx: Context):
+    cells = _table_cells(ctx, f"Bench{ctx.next_id()}")
+    await _check(await ctx.client.post("/api/table", json={"cells": cells}))
+
+
+@case("post_table_update", "POST /api/table, every cell already stored")
+async def post_table_update(ctx: Context):
+    cells = _table_cells(ctx, "BenchUpdate")
+    if not getattr(ctx, "update_seeded", False):
+        await _check(await ctx.client.post("/api/table", json={"cells": cells}))
+        ctx.update_seeded = True
+    await _check(await ctx.client.post("/api/table", json={"cells": cells}))
+
+
+# ---------------------------------------------------------------------------
+# Runner
+# ---------------------------------------------------------------------------
+
+async def _time_case(fn, ctx: Context, repeat: int, warmup: int) -> list[float]:
+    for _ in range(warmup):
+        await fn(ctx)
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        await fn(ctx)
+        times.append(time.perf_counter() - start)
+    return times
+
+
+async def run(args, names: list[str], workdir: str) -> list[dict]:
+    from app import app
+
+    app.config["UPLOAD_FOLDER"] = os.path.join(workdir, "uploads")
+    os.makedirs(app.config["UPLOAD_FOLDER"], exist_ok=True)
+    ctx = Context(args, workdir)
+    results = []
+    # test_app runs the before/after_serving hooks (DB init, shutdown).
+    async with app.test_app() as test_app:
+        ctx.client = test_app.test_client()
+        for name in names:
+            fn, description = CASES[name]
+            times = await _time_case(fn, ctx, args.repeat, args.warmup)
+            results.append({
+                "case": name,
+                "description": description,
+                "repeat": len(times),
+                "min_s": round(min(times), 4),
+                "median_s": round(statistics.median(times), 4),
+                "mean_s": round(statistics.fmean(times), 4),
+                "max_s": round(max(times), 4),
+            })
+            print(f"{name:<20} median={results[-1]['median_s']:.4f}s  min={results[-1]['min_s']:.4f}s")
+    return results
+
+
+def _git_commit() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _compare(results: list[dict], baseline_path: str) -> None:
+    with open(baseline_path) as f:
+        baseline = {row["case"]: row for row in json.load(f)["results"]}
+    print(f"\nagainst {baseline_path} (ratio < 1 is faster):")
+    for row in results:
+        old = baseline.get(row["case"])
+        if old and old["median_s"] > 0:
+            print(f"{row['case']:<20} {old['median_s']:.4f}s -> {row['median_s']:.4f}s "
+                  f"({row['median_s'] / old['median_s']:.2f}x)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--stations", type=int, default=40)
+    parser.add_argument("--dates", type=int, default=12)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--warmup", type=int, default=1)
+    parser.add_argument("--cases", default="*", help="comma-separated glob patterns over case names")
+    parser.add_argument("--heatmap-quality", choices=("full", "preview"), default="full")
+    parser.add_argument("--animation-quality", choices=("full", "preview"), default="full")
+    parser.add_argument("--list", action="store_true", help="list the cases and exit")
+    parser.add_argument("--json", help="write results to this file")
+    parser.add_argument("--baseline", help="compare against an earlier --json file")
+    args = parser.parse_args()
+
+    if args.list:
+        for name, (_, description) in CASES.items():
+            print(f"{name:<20} {description}")
+        return
+    patterns = args.cases.split(",")
+    names = [name for name in CASES if any(fnmatch.fnmatch(name, p) for p in patterns)]
+    if not names:
+        parser.error(f"No case matches {args.cases!r}.")
+
+    with tempfile.TemporaryDirectory(prefix="trendmapp-bench-") as workdir:
+        # Must be set before db.py is imported (via app).
+        os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{os.path.join(workdir, 'bench.db')}"
+        started = datetime.now(timezone.utc).isoformat(timespec="seconds")
+        try:
+            results = asyncio.run(run(args, names, workdir))
+        finally:
+            from utils.parallel_render import shutdown_render_pools
+            shutdown_render_pools()
+
+    report = {
+        "meta": {
+            "started": started,
+            "commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "stations": args.stations,
+            "dates": args.dates,
+            "heatmap_quality": args.heatmap_quality,
+            "animation_quality": args.animation_quality,
+        },
+        "results": results,
+    }
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.baseline:
+        _compare(results, args.baseline)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""Synthetic measurement datasets for benchmarks.
+
+Stations are scattered uniformly inside the lagoon boundary. Their values
+follow a smooth spatial field that drifts over the sampling dates, plus
+noise, so every interpolation method has realistic structure to recover.
+
+The same data can be laid out the way users upload it: ``wide`` (latitude,
+longitude, then one column per timestamp) or ``long`` (latitude,
+longitude, timestamp, value, species), and written as CSV or XLSX.
+
+    python -m benchmarks.synthetic out.xlsx [--stations 40] [--dates 12] [--layout long]
+"""
+
+import argparse
+
+import numpy as np
+import pandas as pd
+import shapely
+
+from utils.animation_engine import DEFAULT_BOUNDARY_PATH, load_boundary
+
+LAYOUTS = ("wide", "long")
+
+
+def station_points(n_stations: int, boundary_path: str = DEFAULT_BOUNDARY_PATH, seed: int = 0) -> np.ndarray:
+    """(n_stations, 2) lon/lat points inside the boundary."""
+    boundary = load_boundary(boundary_path)
+    shapely.prepare(boundary)
+    min_lon, min_lat, max_lon, max_lat = boundary.bounds
+    rng = np.random.default_rng(seed)
+    points = np.empty((0, 2))
+    while len(points) < n_stations:
+        candidates = rng.uniform((min_lon, min_lat), (max_lon, max_lat), (4 * n_stations, 2))
+        inside = shapely.contains_xy(boundary, candidates[:, 0], candidates[:, 1])
+        points = np.vstack([points, candidates[inside]])
+    return points[:n_stations]
+
+
+def synthetic_measurements(n_stations: int = 40, n_dates: int = 12, boundary_path: str = DEFAULT_BOUNDARY_PATH,
+                           seed: int = 0) -> pd.DataFrame:
+    """Long-format frame with latitude, longitude, sampled_at and value columns."""
+    points = station_points(n_stations, boundary_path, seed)
+    rng = np.random.default_rng(seed + 1)
+    lon, lat = points[:, 0], points[:, 1]
+    lon_n = (lon - lon.min()) / np.ptp(lon)
+    lat_n = (lat - lat.min()) / np.ptp(lat)
+    dates = pd.date_range("2024-01-01", periods=n_dates, freq="MS")
+    frames = []
+    for k, date in enumerate(dates):
+        phase = 2 * np.pi * k / max(n_dates, 1)
+        values = (10 + 4 * np.sin(3 * lon_n + phase) * np.cos(2 * lat_n - phase)
+                  + rng.normal(0, 0.3, n_stations))
+        frames.append(pd.DataFrame({"latitude": lat, "longitude": lon, "sampled_at": date, "value": values}))
+    return pd.concat(frames, ignore_index=True)
+
+
+def upload_table(df: pd.DataFrame, layout: str = "wide") -> pd.DataFrame:
+    """Lay out ``synthetic_measurements`` output as an upload spreadsheet."""
+    if layout not in LAYOUTS:
+        raise ValueError(f"Unknown layout '{layout}'. Choose from {LAYOUTS}.")
+    table = df.assign(timestamp=df["sampled_at"].dt.strftime("%Y-%m-%d")).drop(columns="sampled_at")
+    if layout == "long":
+        return table.assign(species="Synthetic")[["latitude", "longitude", "timestamp", "value", "species"]]
+    wide = table.pivot_table(index=["latitude", "longitude"], columns="timestamp", values="value", sort=True)
+    wide.columns.name = None
+    return wide.reset_index()
+
+
+def write_table(table: pd.DataFrame, path: str) -> str:
+    """Write ``table`` as CSV or XLSX, chosen by the file extension."""
+    if path.lower().endswith(".xlsx"):
+        table.to_excel(path, index=False)
+    elif path.lower().endswith(".csv"):
+        table.to_csv(path, index=False)
+    else:
+        raise ValueError("Output must be a .csv or .xlsx file.")
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("output", help=".csv or .xlsx path")
+    parser.add_argument("--stations", type=int, default=40)
+    parser.add_argument("--dates", type=int, default=12)
+    parser.add_argument("--layout", choices=LAYOUTS, default="wide")
+    parser.add_argument("--boundary", default=DEFAULT_BOUNDARY_PATH)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    df = synthetic_measurements(args.stations, args.dates, args.boundary, args.seed)
+    write_table(upload_table(df, args.layout), args.output)
+    print(f"wrote {args.output} ({args.stations} stations x {args.dates} dates, {args.layout})")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,26 @@
+import asyncio
 import os
 import logging
+import secrets
 from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
 from typing import AsyncGenerator
 from pathlib import Path
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.orm import sessionmaker, DeclarativeBase, Mapped, mapped_column
-from sqlalchemy import Integer, Float, String, Date, UniqueConstraint, ForeignKey, select
+from sqlalchemy import (
+    BigInteger, Integer, Float, String, Date, DateTime, UniqueConstraint, ForeignKey,
+    delete, event, func, inspect, select, text, update,
+)
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.pool import StaticPool
 from dotenv import load_dotenv, find_dotenv
+import time
+from datetime import datetime, timedelta, timezone
+from utils.metrics import record_stage
 
 # ---------------------------------------------------------------------------
 # Load environment variables -------------------------------------------------
@@ -18,32 +32,139 @@ if "DATABASE_URL" not in os.environ:
     if alt_path.exists():
         load_dotenv(alt_path)
 DATABASE_URL = os.getenv("DATABASE_URL")
+# Without a server URL the app runs on an embedded SQLite file, which gives
+# local/offline runs, tests and benchmarks a zero-network database.
+EMBEDDED_DB_PATH = os.getenv("EMBEDDED_DB_PATH", str(Path(__file__).with_name("data") / "trendmapp.db"))
 if not DATABASE_URL:
-    raise RuntimeError("DATABASE_URL environment variable not set.")
+    DATABASE_URL = f"sqlite+aiosqlite:///{EMBEDDED_DB_PATH}"
+    logging.warning(f"DATABASE_URL not set; using embedded SQLite database at {EMBEDDED_DB_PATH}")
 
 # ---------------------------------------------------------------------------
-# Build asyncpg-compatible URL & connection args ----------------------------
+# Build async driver URL & connection args ----------------------------------
 # ---------------------------------------------------------------------------
 from urllib.parse import urlparse, urlunparse, parse_qsl, urlencode
 
 DATABASE_URL = DATABASE_URL.strip().strip('"').strip("'")
 
-parsed = urlparse(DATABASE_URL)
-
-# 1. Switch dialect driver to asyncpg
-if parsed.scheme == "postgresql":
-    scheme_async = "postgresql+asyncpg"
+if DATABASE_URL.startswith("sqlite"):
+    BACKEND = "sqlite"
+    # sqlite:///path -> sqlite+aiosqlite:///path (urlparse would mangle the
+    # empty host, so rewrite the scheme only).
+    scheme_async = "sqlite+aiosqlite"
+    ASYNC_DB_URL = scheme_async + DATABASE_URL[DATABASE_URL.index(":"):]
+    CONNECT_ARGS = {}
+    _db_file = ASYNC_DB_URL.split(":///", 1)[1] if ":///" in ASYNC_DB_URL else ""
+    if _db_file and _db_file != ":memory:":
+        Path(_db_file).parent.mkdir(parents=True, exist_ok=True)
 else:
-    scheme_async = parsed.scheme
+    BACKEND = "postgres"
+    parsed = urlparse(DATABASE_URL)
+
+    # 1. Switch dialect driver to asyncpg
+    if parsed.scheme == "postgresql":
+        scheme_async = "postgresql+asyncpg"
+    else:
+        scheme_async = parsed.scheme
+
+    # 2. Remove unsupported query params (e.g. sslmode) for asyncpg
+    query_items = {k: v for k, v in parse_qsl(parsed.query, keep_blank_values=True) if k.lower() not in ("sslmode", "channel_binding")}
+
+    ASYNC_DB_URL = urlunparse(parsed._replace(scheme=scheme_async, query=urlencode(query_items)))
+
+    # asyncpg requires ssl=True instead of sslmode=require. Always enforce SSL if
+    # the original URL had sslmode in its query string.
+    CONNECT_ARGS = {"ssl": True} if "sslmode" in parsed.query.lower() else {}
+
+# ---------------------------------------------------------------------------
+# Connection profile (pool / echo / statement cache) from the environment ---
+# ---------------------------------------------------------------------------
+def _env_bool(name: str, default: bool) -> bool:
+    raw = os.getenv(name)
+    if raw is None:
+        return default
+    return raw.strip().lower() in ("1", "true", "yes", "on")
+
+
+def _env_int(name: str, default: int) -> int:
+    raw = os.getenv(name)
+    if raw is None or not raw.strip():
+        return default
+    try:
+        return int(raw)
+    except ValueError:
+        raise RuntimeError(f"{name} must be an integer, got {raw!r}.")
+
+
+PRE_PING_STRATEGIES = ("checkout", "off")
+
+
+@dataclass(frozen=True)
+class DBProfile:
+    """Engine tuning knobs, read from ``DB_*`` environment variables.
+
+    ``pre_ping`` is either ``"checkout"`` (SQLAlchemy pings a pooled
+    connection when it is handed out) or ``"off"`` (rely on ``pool_recycle``
+    to retire stale connections). ``statement_cache_size`` sizes asyncpg's
+    per-connection prepared statement cache; set it to 0 behind
+    transaction-mode poolers such as pgbouncer.
+    """
+
+    pool_size: int = 5
+    max_overflow: int = 5
+    pool_recycle: int = 300
+    pool_timeout: int = 30
+    echo: bool = False
+    statement_cache_size: int = 100
+    pre_ping: str = "checkout"
+
+    @classmethod
+    def from_env(cls) -> "DBProfile":
+        pre_ping = os.getenv("DB_PRE_PING", cls.pre_ping).strip().lower()
+        if pre_ping not in PRE_PING_STRATEGIES:
+            raise RuntimeError(f"DB_PRE_PING must be one of {PRE_PING_STRATEGIES}, got {pre_ping!r}.")
+        return cls(
+            pool_size=_env_int("DB_POOL_SIZE", cls.pool_size),
+            max_overflow=_env_int("DB_MAX_OVERFLOW", cls.max_overflow),
+            pool_recycle=_env_int("DB_POOL_RECYCLE", cls.pool_recycle),
+            pool_timeout=_env_int("DB_POOL_TIMEOUT", cls.pool_timeout),
+            echo=_env_bool("DB_ECHO", cls.echo),
+            statement_cache_size=_env_int("DB_STATEMENT_CACHE_SIZE", cls.statement_cache_size),
+            pre_ping=pre_ping,
+        )
 
-# 2. Remove unsupported query params (e.g. sslmode) for asyncpg
-query_items = {k: v for k, v in parse_qsl(parsed.query, keep_blank_values=True) if k.lower() not in ("sslmode", "channel_binding")}
 
-ASYNC_DB_URL = urlunparse(parsed._replace(scheme=scheme_async, query=urlencode(query_items)))
+DB_PROFILE = DBProfile.from_env()
 
-# asyncpg requires ssl=True instead of sslmode=require. Always enforce SSL if
-# the original URL had sslmode in its query string.
-CONNECT_ARGS = {"ssl": True} if "sslmode" in parsed.query.lower() else {}
+
+def _engine_kwargs(profile: DBProfile) -> dict:
+    """create_async_engine arguments for the configured backend."""
+    if BACKEND == "sqlite":
+        if ASYNC_DB_URL.endswith((":memory:", "sqlite+aiosqlite://")):
+            # One shared connection, otherwise every checkout sees a new empty DB.
+            return {"echo": profile.echo, "poolclass": StaticPool}
+        return {
+            "echo": profile.echo,
+            "pool_size": profile.pool_size,
+            "max_overflow": profile.max_overflow,
+            "pool_timeout": profile.pool_timeout,
+        }
+    return {
+        "echo": profile.echo,
+        "pool_size": profile.pool_size,
+        "max_overflow": profile.max_overflow,
+        "pool_pre_ping": profile.pre_ping == "checkout",
+        "pool_recycle": profile.pool_recycle,
+        "pool_timeout": profile.pool_timeout,
+        "connect_args": CONNECT_ARGS,
+    }
+
+# asyncpg keeps a per-connection LRU of prepared statements, and SQLAlchemy's
+# asyncpg dialect keeps its own cache of the prepared statement handles. Size
+# both from the profile so repeated queries skip the Parse round trip.
+if scheme_async == "postgresql+asyncpg":
+    CONNECT_ARGS["statement_cache_size"] = DB_PROFILE.statement_cache_size
+    query_items["prepared_statement_cache_size"] = str(DB_PROFILE.statement_cache_size)
+    ASYNC_DB_URL = urlunparse(parsed._replace(scheme=scheme_async, query=urlencode(query_items)))
 
 # ---------------------------------------------------------------------------
 # SQLAlchemy base & engine ----------------------------------------------------
@@ -51,15 +172,24 @@ CONNECT_ARGS = {"ssl": True} if "sslmode" in parsed.query.lower() else {}
 class Base(DeclarativeBase):
     pass
 
-engine = create_async_engine(
-    ASYNC_DB_URL,
-    echo=True,  # Enable SQL logging for debugging
-    pool_size=5,
-    max_overflow=5,
-    pool_pre_ping=True,  # Enable connection health checks
-    pool_recycle=300,  # Recycle connections after 5 minutes
-    connect_args=CONNECT_ARGS,
-)
+engine = create_async_engine(ASYNC_DB_URL, **_engine_kwargs(DB_PROFILE))
+
+if BACKEND == "sqlite":
+    @event.listens_for(engine.sync_engine, "connect")
+    def _sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA foreign_keys=ON")  # needed for ON DELETE CASCADE
+        cursor.execute("PRAGMA journal_mode=WAL")  # readers do not block the writer
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute("PRAGMA busy_timeout=5000")
+        cursor.close()
+
+
+def upsert_insert(model):
+    """Dialect-specific INSERT supporting ``on_conflict_do_update/nothing``."""
+    if BACKEND == "sqlite":
+        return sqlite_insert(model)
+    return pg_insert(model)
 
 AsyncSessionLocal = sessionmaker(
     engine, expire_on_commit=False, class_=AsyncSession
@@ -92,22 +222,164 @@ class Measurement(Base):
     parameter_id: Mapped[int] = mapped_column(Integer, ForeignKey("parameters.id", ondelete="CASCADE"))
     sampled_at: Mapped[Date] = mapped_column(Date, nullable=False)
     value: Mapped[float | None] = mapped_column(Float)
+    # Sync version of the last write to this row (see allocate_row_version).
+    row_version: Mapped[int | None] = mapped_column(BigInteger, index=True)
 
     __table_args__ = (
         UniqueConstraint("station_id", "parameter_id", "sampled_at", name="uix_measurement_comb"),
     )
 
 
+class MeasurementDeletion(Base):
+    """Tombstone for a deleted measurement so delta sync can report removals."""
+    __tablename__ = "measurement_deletions"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    station_id: Mapped[int] = mapped_column(Integer, ForeignKey("stations.id", ondelete="CASCADE"))
+    parameter_id: Mapped[int] = mapped_column(Integer, ForeignKey("parameters.id", ondelete="CASCADE"))
+    sampled_at: Mapped[Date] = mapped_column(Date, nullable=False)
+    row_version: Mapped[int] = mapped_column(BigInteger, nullable=False, index=True)
+    deleted_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True))
+
+
+class SyncState(Base):
+    """Single-row counter that hands out measurement row versions."""
+    __tablename__ = "sync_state"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    version: Mapped[int] = mapped_column(BigInteger, nullable=False, default=0)
+    # Random per database, set when the row is created: tells a recreated
+    # database apart from the old one at the same version.
+    identity: Mapped[str | None] = mapped_column(String(32))
+    # Tombstones up to this version have been pruned (see prune_deletions).
+    pruned_version: Mapped[int] = mapped_column(BigInteger, nullable=False, default=0, server_default="0")
+
+
+# Tombstones older than this are dropped; clients that last synced before
+# the pruned version get a full reload instead of a delta.
+TOMBSTONE_RETENTION_DAYS = _env_int("TOMBSTONE_RETENTION_DAYS", 7)
+TOMBSTONE_PRUNE_INTERVAL = 3600.0
+_last_prune = 0.0
+
+
+async def allocate_row_version(session) -> int:
+    """Reserve the next row version for the writes of the current transaction.
+
+    Incrementing the counter row locks it until commit, so concurrent writers
+    are serialized here and versions become visible in commit order. That is
+    what lets ``/api/table/changes?since=N`` never skip a change.
+
+    Call it as the first statement of every write transaction: all writers
+    then take the counter lock before any row lock, in the same order, and
+    cannot deadlock one another.
+    """
+    result = await session.execute(
+        update(SyncState)
+        .where(SyncState.id == 1)
+        .values(version=SyncState.version + 1)
+        .returning(SyncState.version)
+    )
+    return result.scalar_one()
+
+
+async def current_row_version(session) -> int:
+    """Latest committed row version (0 if nothing has been written yet)."""
+    result = await session.execute(select(SyncState.version).where(SyncState.id == 1))
+    return result.scalar_one_or_none() or 0
+
+
+async def current_data_version(session) -> tuple[str, int]:
+    """(database identity, latest committed row version), in one read."""
+    result = await session.execute(select(SyncState.identity, SyncState.version).where(SyncState.id == 1))
+    row = result.one_or_none()
+    return (row[0] or "", row[1]) if row is not None else ("", 0)
+
+
+async def pruned_row_version(session) -> int:
+    """Highest row version whose tombstones may have been pruned."""
+    result = await session.execute(select(SyncState.pruned_version).where(SyncState.id == 1))
+    return result.scalar_one_or_none() or 0
+
+
+async def prune_deletions(session) -> None:
+    """Drop tombstones older than ``TOMBSTONE_RETENTION_DAYS``, at most once an interval.
+
+    Must run after ``allocate_row_version`` in the same transaction, which
+    already holds the counter row that ``pruned_version`` lives on.
+    """
+    global _last_prune
+    now = time.monotonic()
+    if now - _last_prune < TOMBSTONE_PRUNE_INTERVAL:
+        return
+    _last_prune = now
+    cutoff = datetime.now(timezone.utc) - timedelta(days=TOMBSTONE_RETENTION_DAYS)
+    # Tombstones from before deleted_at existed count as expired.
+    expired = (MeasurementDeletion.deleted_at < cutoff) | MeasurementDeletion.deleted_at.is_(None)
+    result = await session.execute(select(func.max(MeasurementDeletion.row_version)).where(expired))
+    upto = result.scalar_one_or_none()
+    if upto is None:
+        return
+    await session.execute(delete(MeasurementDeletion).where(MeasurementDeletion.row_version <= upto))
+    await session.execute(
+        update(SyncState)
+        .where(SyncState.id == 1, SyncState.pruned_version < upto)
+        .values(pruned_version=upto)
+    )
+
+
+# ---------------------------------------------------------------------------
+# Per-request query counting ------------------------------------------------
+# ---------------------------------------------------------------------------
+# The counter is a mutable cell stored in a ContextVar so that statements run
+# from SQLAlchemy's greenlets (which share the calling task's context) add to
+# the count of the request that issued them.
+_query_count: ContextVar[list[int] | None] = ContextVar("db_query_count", default=None)
+
+
+@event.listens_for(engine.sync_engine, "before_cursor_execute")
+def _count_query(conn, cursor, statement, parameters, context, executemany):
+    counter = _query_count.get()
+    if counter is not None:
+        counter[0] += 1
+    conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+
+@event.listens_for(engine.sync_engine, "after_cursor_execute")
+def _time_query(conn, cursor, statement, parameters, context, executemany):
+    # Reported as the "db" stage (Server-Timing and /metrics).
+    record_stage("db", time.perf_counter() - conn.info["query_start"].pop())
+
+
+@event.listens_for(engine.sync_engine, "handle_error")
+def _drop_failed_query_start(exception_context):
+    conn = exception_context.connection
+    if conn is not None and conn.info.get("query_start"):
+        conn.info["query_start"].pop()
+
+
+def start_query_count() -> None:
+    """Begin counting statements issued by the current request/task."""
+    _query_count.set([0])
+
+
+def get_query_count() -> int | None:
+    """Number of statements issued since ``start_query_count`` (None if not started)."""
+    counter = _query_count.get()
+    return counter[0] if counter is not None else None
+
+
 # ---------------------------------------------------------------------------
 # Database Session Management -----------------------------------------------
 # ---------------------------------------------------------------------------
 @asynccontextmanager
 async def get_db_session() -> AsyncGenerator:
-    """Get a database session with proper cleanup and connection validation."""
+    """Get a database session with proper cleanup.
+
+    Liveness of pooled connections is handled by the engine's pre-ping /
+    recycle settings, so no probe query is issued here.
+    """
     session = AsyncSessionLocal()
     try:
-        # Validate the connection is still alive
-        await session.execute(select(1))
         yield session
         await session.commit()
     except Exception as e:
@@ -121,8 +393,58 @@ async def get_db_session() -> AsyncGenerator:
 # ---------------------------------------------------------------------------
 # Utility to create all tables ----------------------------------------------
 # ---------------------------------------------------------------------------
-async def init_db() -> None:
-    """Create tables if they do not exist."""
+# Columns added after their table first shipped: table -> {column: DDL type}.
+_ADDED_COLUMNS = {
+    "measurements": {"row_version": "BIGINT"},
+    "measurement_deletions": {"deleted_at": "TIMESTAMP WITH TIME ZONE"},
+    "sync_state": {"pruned_version": "BIGINT NOT NULL DEFAULT 0", "identity": "VARCHAR(32)"},
+}
+
+
+def _missing_columns(sync_conn) -> list[tuple[str, str, str]]:
+    inspector = inspect(sync_conn)
+    missing = []
+    for table, columns in _ADDED_COLUMNS.items():
+        present = {c["name"] for c in inspector.get_columns(table)}
+        missing.extend((table, name, ddl) for name, ddl in columns.items() if name not in present)
+    return missing
+
+
+async def init_db(attempts: int = 3) -> None:
+    """Create tables if they do not exist and apply additive column upgrades.
+
+    Workers of one deployment start together and race to create the schema;
+    the loser sees "already exists" and retries against the finished schema.
+    """
+    for attempt in range(1, attempts + 1):
+        try:
+            await _create_schema()
+            return
+        except DBAPIError as e:
+            if attempt == attempts:
+                raise
+            logging.warning(f"Schema creation failed ({e.orig}); retrying")
+            await asyncio.sleep(0.5 * attempt)
+
+
+async def _create_schema() -> None:
     async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all) 
+        await conn.run_sync(Base.metadata.create_all)
+        # create_all does not alter existing tables; add the columns that
+        # databases created by earlier versions lack.
+        for table, name, ddl in await conn.run_sync(_missing_columns):
+            await conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {name} {ddl}"))
+            if name == "row_version":
+                await conn.execute(text(
+                    "CREATE INDEX IF NOT EXISTS ix_measurements_row_version ON measurements (row_version)"
+                ))
+        identity = secrets.token_hex(8)
+        await conn.execute(
+            upsert_insert(SyncState).values(id=1, version=0, identity=identity)
+            .on_conflict_do_nothing(index_elements=[SyncState.id])
+        )
+        # Rows created before the identity column existed.
+        await conn.execute(
+            update(SyncState).where(SyncState.id == 1, SyncState.identity.is_(None)).values(identity=identity)
+        ) 
 
@@ -1,14 +1,64 @@
-from quart import Blueprint, request, jsonify, send_file, current_app
+from quart import Blueprint, request, jsonify, send_file, current_app, url_for, Response
 from datetime import datetime
+import asyncio
+import os
+import sys
 import traceback
-import io
-from utils.animation_generator import fetch_data_for_animation, generate_spatiotemporal_video
+from utils.animation_jobs import animation_jobs, QueueFullError, DONE, FAILED, CANCELLED, FINISHED_STATES
+from utils.animation_cache import animation_cache, animation_cache_key
 
 animation_bp = Blueprint("animation_api", __name__)
 
+# Suggested client back-off when the render queue is full.
+QUEUE_FULL_RETRY_AFTER = 30
+# Cached videos are content-addressed, so browsers may keep them for long.
+CACHED_VIDEO_MAX_AGE = 7 * 24 * 3600
+# Progressive streams: read size and how often to look for new fragments.
+STREAM_CHUNK_BYTES = 64 * 1024
+STREAM_POLL_SECONDS = 0.25
+
+
+def _download_name(parameter):
+    return f"{(parameter or 'parameter').replace(' ', '_')}_animation.mp4"
+
+
+async def _send_video(path, parameter, cache_timeout=None):
+    """Serves an MP4 with Accept-Ranges/206 support so players can seek."""
+    response = await send_file(
+        path,
+        mimetype="video/mp4",
+        as_attachment=True,
+        attachment_filename=_download_name(parameter),
+        cache_timeout=cache_timeout,
+        conditional=True,
+    )
+    # Advertise range support on full responses too, so players know they
+    # can seek before the download completes.
+    response.headers["Accept-Ranges"] = "bytes"
+    if response.status_code == 206:
+        # Quart 0.19 reports the inclusive end one byte short; rebuild the
+        # header from the body that is actually sent.
+        body = response.response
+        response.headers["Content-Range"] = f"bytes {body.begin}-{body.end - 1}/{os.path.getsize(path)}"
+    return response
+
+
 @animation_bp.route("/api/animate", methods=["POST"])
 async def handle_animation_request():
-    """Handles the request to generate a spatiotemporal animation."""
+    """Validates an animation request and queues it for background rendering.
+
+    Returns 202 with the job id and the URLs to poll for progress and to
+    fetch the finished video, or 200 with ``status: "done"`` when the same
+    animation is already in the disk cache. With ``"progressive": true``
+    the video is written as fragmented MP4 and ``stream_url`` can be played
+    while it renders. ``"quality": "preview"`` renders a coarse, short-frame
+    draft; full quality is the default. A request for an animation that is
+    already queued or rendering gets the existing job.
+    """
+    # The rendering stack (numpy/scipy/pandas/imageio) loads on first use.
+    from utils.animation_generator import fetch_data_for_animation, render_spatiotemporal_video
+    from utils.animation_engine import ANIMATION_QUALITIES, SPATIAL_METHODS, TEMPORAL_METHODS
+
     try:
         payload = await request.get_json()
         if not payload:
@@ -27,22 +77,60 @@ async def handle_animation_request():
         parameter = payload.get("parameter", "").strip()
         filename = payload.get("filename", "")
         boundary_path = payload.get("boundary_path", "static/data/export.geojson")
+        neighbors = int(payload['neighbors']) if payload.get('neighbors') else None
+        spatial = (payload.get('method') or 'rbf').lower()
+        temporal = (payload.get('temporal') or 'cubic').lower()
+        progressive = bool(payload.get('progressive', False))
+        quality = (payload.get('quality') or 'full').lower()
+        if spatial not in SPATIAL_METHODS:
+            return jsonify({"error": f"Unknown method '{spatial}'. Choose from {list(SPATIAL_METHODS)}."}), 400
+        if temporal not in TEMPORAL_METHODS:
+            return jsonify({"error": f"Unknown temporal interpolation '{temporal}'. Choose from {list(TEMPORAL_METHODS)}."}), 400
+        if quality not in ANIMATION_QUALITIES:
+            return jsonify({"error": f"Unknown quality '{quality}'. Choose from {list(ANIMATION_QUALITIES)}."}), 400
 
-        # 1. Fetch data
+        # 1. Fetch data (cheap; errors are reported synchronously)
         df = await fetch_data_for_animation(parameter, start_date, end_date, filename)
         if df.empty:
             return jsonify({"error": "No data available for the selected parameter and date range."}), 404
 
-        # 2. Generate video
-        video_bytes = generate_spatiotemporal_video(df, fps, frames_per_transition, cmap, boundary_path)
-
-        # 3. Send video file as response
-        return await send_file(
-            io.BytesIO(video_bytes),
-            mimetype="video/mp4",
-            as_attachment=True,
-            download_name=f"{parameter.replace(' ', '_')}_animation.mp4"
+        # 2. Serve a previously rendered copy of the same animation
+        cache_key = animation_cache_key(
+            df, boundary_path, parameter=parameter, fps=fps, frames_per_transition=frames_per_transition,
+            colormap=cmap, neighbors=neighbors, method=spatial, temporal=temporal, fragmented=progressive,
+            quality=quality,
         )
+        result_url = url_for("animation_api.cached_animation", key=cache_key, parameter=parameter)
+        if animation_cache.get(cache_key):
+            return jsonify({"job_id": None, "status": DONE, "cached": True, "quality": quality,
+                            "result_url": result_url})
+
+        # 3. Queue the render
+        def render(output_path, progress):
+            render_spatiotemporal_video(df, fps, frames_per_transition, cmap, output_path,
+                                        boundary_path, neighbors, progress, spatial=spatial, temporal=temporal,
+                                        fragmented=progressive, quality=quality)
+            return animation_cache.put(cache_key, output_path)
+
+        try:
+            # An identical animation already rendering is shared, not rendered twice.
+            job = animation_jobs.submit(render, label=parameter, key=cache_key)
+        except QueueFullError as qe:
+            response = jsonify({"error": str(qe)})
+            response.headers["Retry-After"] = str(QUEUE_FULL_RETRY_AFTER)
+            return response, 429
+
+        body = {
+            "job_id": job.id,
+            "status": job.status,
+            "cached": False,
+            "quality": quality,
+            "status_url": url_for("animation_api.animation_job_status", job_id=job.id),
+            "result_url": result_url,
+        }
+        if progressive:
+            body["stream_url"] = url_for("animation_api.animation_job_stream", job_id=job.id)
+        return jsonify(body), 202
 
     except ValueError as ve:
         current_app.logger.warning(f"Animation generation validation error: {ve}")
@@ -50,3 +138,113 @@ async def handle_animation_request():
     except Exception as e:
         current_app.logger.error(f"Animation generation failed: {traceback.format_exc()}")
         return jsonify({"error": "An unexpected error occurred while generating the animation."}), 500
+
+
+@animation_bp.route("/api/animate/<job_id>", methods=["GET"])
+async def animation_job_status(job_id):
+    """Progress of a queued animation: status, frames done, percent and ETA."""
+    job = animation_jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown or expired animation job."}), 404
+    return jsonify(job.to_dict())
+
+
+@animation_bp.route("/api/animate/<job_id>/result", methods=["GET"])
+async def animation_job_result(job_id):
+    """The finished MP4 of a completed job."""
+    job = animation_jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown or expired animation job."}), 404
+    if job.status == FAILED:
+        return jsonify({"error": job.error or "Animation rendering failed."}), 500
+    if job.status == CANCELLED:
+        return jsonify({"error": "Animation job was cancelled."}), 410
+    if job.status != DONE:
+        return jsonify({"error": "Animation is not ready yet.", **job.to_dict()}), 409
+    if not os.path.exists(job.result_path):
+        return jsonify({"error": "Animation has been evicted from the cache."}), 410
+    return await _send_video(job.result_path, job.label)
+
+
+async def _follow_output(job):
+    """Yields the job's output file as it grows, until the job finishes.
+
+    The job is looked up again on every poll, so a job of another worker
+    advances with its snapshot.
+    """
+    path = job.output_path
+    while path is None or not os.path.exists(path):
+        if job.status in FINISHED_STATES:
+            # The render moves its file into the cache just before the job is
+            # marked done; a stream that starts in that window sends the result.
+            if job.status == DONE and job.result_path and os.path.exists(job.result_path):
+                path = job.result_path
+                break
+            return
+        await asyncio.sleep(STREAM_POLL_SECONDS)
+        job = animation_jobs.get(job.id) or job
+        path = job.output_path
+    # The open handle stays valid when the finished file is moved into the cache.
+    with open(path, 'rb') as f:
+        while True:
+            data = f.read(STREAM_CHUNK_BYTES)
+            if data:
+                yield data
+                continue
+            if job.status in FINISHED_STATES:
+                if job.status == DONE:
+                    while data := f.read(STREAM_CHUNK_BYTES):
+                        yield data
+                return
+            await asyncio.sleep(STREAM_POLL_SECONDS)
+            job = animation_jobs.get(job.id) or job
+
+
+@animation_bp.route("/api/animate/<job_id>/stream", methods=["GET"])
+async def animation_job_stream(job_id):
+    """Progressive playback of a job's fragmented MP4 while it is rendering.
+
+    Once the job has finished this is the same as the result download.
+    """
+    job = animation_jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown or expired animation job."}), 404
+    if job.status in (FAILED, CANCELLED):
+        return await animation_job_result(job_id)
+    if job.status == DONE:
+        if not os.path.exists(job.result_path):
+            return jsonify({"error": "Animation has been evicted from the cache."}), 410
+        return await _send_video(job.result_path, job.label)
+    response = Response(_follow_output(job), mimetype="video/mp4")
+    response.headers["Cache-Control"] = "no-store"
+    # Rendering can outlast Quart's default response timeout.
+    response.timeout = None
+    return response
+
+
+@animation_bp.route("/api/animations/<key>", methods=["GET"])
+async def cached_animation(key):
+    """A rendered animation from the disk cache (range requests supported)."""
+    path = animation_cache.get(key)
+    if path is None:
+        # Not rendered yet, or evicted.
+        return jsonify({"error": "Animation not found in cache."}), 404
+    return await _send_video(path, request.args.get("parameter", ""), cache_timeout=CACHED_VIDEO_MAX_AGE)
+
+
+@animation_bp.route("/api/animate/<job_id>", methods=["DELETE"])
+async def cancel_animation_job(job_id):
+    """Cancels a queued or running animation job."""
+    job = animation_jobs.cancel(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown or expired animation job."}), 404
+    return jsonify(job.to_dict())
+
+
+@animation_bp.after_app_serving
+async def _shutdown_animation_jobs():
+    animation_jobs.shutdown()
+    # Only if an animation was rendered; importing it here would load numpy/scipy.
+    parallel_render = sys.modules.get("utils.parallel_render")
+    if parallel_render is not None:
+        parallel_render.shutdown_render_pools()
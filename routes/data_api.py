@@ -1,14 +1,20 @@
 from __future__ import annotations
 
 import asyncio
-from datetime import datetime
+from datetime import datetime, timezone
 
-from quart import Blueprint, jsonify, request, render_template, current_app
-import pandas as pd
-from sqlalchemy import select, insert, update
+from quart import Blueprint, Response, jsonify, request, render_template, current_app
+from sqlalchemy import select, insert, update, delete, tuple_
 from sqlalchemy.exc import IntegrityError, SQLAlchemyError
 
-from db import get_db_session, init_db, Station, Parameter, Measurement
+from db import (
+    engine, get_db_session, init_db, allocate_row_version, current_data_version, current_row_version,
+    pruned_row_version,
+    prune_deletions, upsert_insert,
+    Station, Parameter, Measurement, MeasurementDeletion,
+)
+from utils.lookup_cache import lookup_cache
+from utils.measurement_queries import fetch_table_pivot
 
 bp = Blueprint("data_api", __name__)
 
@@ -24,16 +30,36 @@ async def data_entry_page():
     """Serve the spreadsheet page."""
     return await render_template("data-entry.html")
 
+# ---------------------------------------------------------------------------
+# Cached lookups ------------------------------------------------------------
+# ---------------------------------------------------------------------------
+async def _cached_lookup_response(key: str, loader):
+    """Serve a lookup from ``lookup_cache`` with ETag / If-None-Match support."""
+    async with get_db_session() as session:
+        identity, version = await current_data_version(session)
+    etag = lookup_cache.etag(key, identity, version)
+    # Weak comparison: compressed responses carry the ETag as W/"...".
+    if request.if_none_match.contains_weak(etag):
+        response = Response(status=304)
+    else:
+        response = jsonify(await lookup_cache.get_or_load(key, identity, version, loader))
+    response.set_etag(etag)
+    # Clients must revalidate, but revalidation only reads the data version.
+    response.headers["Cache-Control"] = "no-cache"
+    return response
+
 # ---------------------------------------------------------------------------
 # Parameters API ------------------------------------------------------------
 # ---------------------------------------------------------------------------
+async def _load_parameter_names() -> list[str]:
+    async with get_db_session() as session:
+        result = await session.execute(select(Parameter.name).order_by(Parameter.name))
+        return [row[0] for row in result.all()]
+
 @bp.route("/api/parameters", methods=["GET"])
 async def list_parameters():
     try:
-        async with get_db_session() as session:
-            result = await session.execute(select(Parameter.name).order_by(Parameter.name))
-            names = [row[0] for row in result.all()]
-            return jsonify(names)
+        return await _cached_lookup_response("parameters", _load_parameter_names)
     except Exception as e:
         current_app.logger.error(f"Error in list_parameters: {str(e)}")
         return jsonify({"error": "Failed to fetch parameters"}), 500
@@ -46,9 +72,11 @@ async def add_parameter():
 
     try:
         async with get_db_session() as session:
+            # Lookups are versioned by the row version (see utils/lookup_cache).
+            await allocate_row_version(session)
             stmt = insert(Parameter).values(name=data['name'])
             await session.execute(stmt)
-            return jsonify({"status": "success"})
+        return jsonify({"status": "success"})
     except IntegrityError:
         return jsonify({"error": "Parameter already exists"}), 400
     except Exception as e:
@@ -57,18 +85,20 @@ async def add_parameter():
 # ---------------------------------------------------------------------------
 # Timestamps helper ---------------------------------------------------------
 # ---------------------------------------------------------------------------
+async def _load_timestamps() -> list[str]:
+    async with get_db_session() as session:
+        result = await session.execute(
+            select(Measurement.sampled_at)
+            .distinct()
+            .order_by(Measurement.sampled_at.desc())
+        )
+        return [row[0].isoformat() for row in result.all()]
+
 @bp.route("/api/timestamps", methods=["GET"])
 async def list_timestamps():
     """Return sorted list of unique timestamps in ISO format."""
     try:
-        async with get_db_session() as session:
-            result = await session.execute(
-                select(Measurement.sampled_at)
-                .distinct()
-                .order_by(Measurement.sampled_at.desc())
-            )
-            timestamps = [row[0].isoformat() for row in result.all()]
-            return jsonify(timestamps)
+        return await _cached_lookup_response("timestamps", _load_timestamps)
     except Exception as e:
         current_app.logger.error(f"Error fetching timestamps: {e}")
         return jsonify({"error": "Failed to fetch timestamps"}), 500
@@ -82,50 +112,23 @@ async def get_table():
     try:
         async with get_db_session() as session:
             try:
-                # Fetch all measurement data required for the pivot
-                stmt = select(
-                    Station.id,
-                    Station.latitude,
-                    Station.longitude,
-                    Parameter.name,
-                    Measurement.sampled_at,
-                    Measurement.value
-                ).select_from(Station) \
-                 .join(Measurement, Measurement.station_id == Station.id) \
-                 .join(Parameter, Parameter.id == Measurement.parameter_id)
-
-                result = await session.execute(stmt)
-                rows = result.all()
-
-                if not rows:
-                    return jsonify([])
-
-                # Convert to pandas DataFrame for easy pivoting
-                df = pd.DataFrame(rows, columns=['station_id', 'latitude', 'longitude', 'parameter', 'sampled_at', 'value'])
-
-                # Ensure correct data types and format the date
-                df['latitude'] = pd.to_numeric(df['latitude'])
-                df['longitude'] = pd.to_numeric(df['longitude'])
-                df['value'] = pd.to_numeric(df['value'])
-                df['sampled_at'] = pd.to_datetime(df['sampled_at']).dt.strftime('%Y-%m-%d')
-
-                # Create a combined column for the pivot operation
-                df['param_date'] = df['parameter'] + '_' + df['sampled_at']
-
-                # Pivot the table to create the desired wide format
-                pivot_df = df.pivot_table(
-                    index=['station_id', 'latitude', 'longitude'],
-                    columns='param_date',
-                    values='value'
-                ).reset_index()
+                # Version before the snapshot, so a later delta sync from it
+                # can only repeat changes, never miss them.
+                version = await current_row_version(session)
+
+                # Pivot in one set-based read (see utils/measurement_queries)
+                pivot_df = await fetch_table_pivot(session)
+
+                if pivot_df.empty:
+                    return jsonify([]), 200, {"X-Table-Version": str(version)}
 
                 # Replace NaN with None for clean JSON output
-                pivot_df = pivot_df.where(pd.notnull(pivot_df), None)
+                pivot_df = pivot_df.astype(object).where(pivot_df.notna(), None)
 
                 # Convert the final DataFrame to a list of dictionaries
                 pivoted_data = pivot_df.to_dict(orient='records')
 
-                return jsonify(pivoted_data)
+                return jsonify(pivoted_data), 200, {"X-Table-Version": str(version)}
 
             except SQLAlchemyError as e:
                 current_app.logger.error(f"Database error in get_table: {e}")
@@ -135,91 +138,239 @@ async def get_table():
         current_app.logger.error(f"Error in get_table: {e}")
         return jsonify({"error": "An error occurred while fetching data"}), 500
 
+# Rows per multi-row upsert/delete statement.
+UPSERT_CHUNK = 1000
+
+
+def _parse_cell(row: dict) -> tuple | None:
+    """Normalize one posted cell to (station_id, lat, lon, parameter, date, value).
+
+    ``latitude``/``longitude`` identify the station, falling back to
+    ``station_id`` when coordinates are absent; the date may be sent as
+    ``sampled_at`` or ``timestamp``.
+    """
+    try:
+        lat_raw, lon_raw = row.get("latitude"), row.get("longitude")
+        if lat_raw not in (None, "") and lon_raw not in (None, ""):
+            station_id, lat, lon = None, float(lat_raw), float(lon_raw)
+        else:
+            station_id, lat, lon = int(row["station_id"]), None, None
+        param_name = str(row["parameter"]).strip()
+        date_val = datetime.fromisoformat(str(row.get("sampled_at") or row["timestamp"])).date()
+        val = float(row["value"]) if row.get("value") not in (None, "") else None
+    except (KeyError, TypeError, ValueError):
+        return None
+    if not param_name:
+        return None
+    return station_id, lat, lon, param_name, date_val, val
+
+
+async def _resolve_parameter_ids(session, names: set[str]) -> dict[str, int]:
+    """Map parameter names to ids, creating the missing ones."""
+    param_rows = await session.execute(select(Parameter.id, Parameter.name).where(Parameter.name.in_(names)))
+    param_map = {name: pid for pid, name in param_rows.all()}
+    missing = [Parameter(name=name) for name in names if name not in param_map]
+    if missing:
+        session.add_all(missing)
+        await session.flush()
+        param_map.update({p.name: p.id for p in missing})
+    return param_map
+
+
+async def _resolve_station_ids(session, coords: set[tuple[float, float]]) -> dict[tuple[float, float], int]:
+    """Map (lat, lon) pairs to station ids, creating stations that do not exist."""
+    station_map: dict[tuple[float, float], int] = {}
+    coord_list = list(coords)
+    for chunk in _chunks(coord_list, UPSERT_CHUNK):
+        rows = await session.execute(
+            select(Station.id, Station.latitude, Station.longitude)
+            .where(tuple_(Station.latitude, Station.longitude).in_(chunk))
+            .order_by(Station.id)
+        )
+        for sid, lat, lon in rows.all():
+            station_map.setdefault((lat, lon), sid)
+    missing = [Station(latitude=lat, longitude=lon) for lat, lon in coord_list if (lat, lon) not in station_map]
+    if missing:
+        session.add_all(missing)
+        await session.flush()
+        station_map.update({(st.latitude, st.longitude): st.id for st in missing})
+    return station_map
+
+
+async def _record_deletions(session, keys, version: int) -> None:
+    """Write tombstones for deleted (station_id, parameter_id, sampled_at) keys."""
+    now = datetime.now(timezone.utc)
+    rows = [
+        {"station_id": sid, "parameter_id": pid, "sampled_at": day, "row_version": version, "deleted_at": now}
+        for sid, pid, day in keys
+    ]
+    for chunk in _chunks(rows, UPSERT_CHUNK):
+        await session.execute(insert(MeasurementDeletion), chunk)
+    if rows:
+        await prune_deletions(session)
+
+
+async def _apply_cells(session, version: int, cells: list[tuple], delete_nulls: bool) -> int:
+    """Upsert parsed cells in bulk as row ``version`` and return how many were applied.
+
+    With ``delete_nulls`` a ``None`` value removes the stored measurement
+    instead of writing a NULL (the cell-level patch semantics).
+    """
+    param_map = await _resolve_parameter_ids(session, {c[3] for c in cells})
+    station_map = await _resolve_station_ids(session, {(c[1], c[2]) for c in cells if c[0] is None})
+
+    # Last write wins for repeated keys: one statement cannot touch a row twice.
+    upserts: dict[tuple[int, int, object], float | None] = {}
+    deletes: set[tuple[int, int, object]] = set()
+    for station_id, lat, lon, param_name, date_val, val in cells:
+        key = (station_id if station_id is not None else station_map[(lat, lon)], param_map[param_name], date_val)
+        if delete_nulls and val is None:
+            upserts.pop(key, None)
+            deletes.add(key)
+        else:
+            deletes.discard(key)
+            upserts[key] = val
+
+    for chunk in _chunks(list(upserts.items()), UPSERT_CHUNK):
+        stmt = upsert_insert(Measurement).values([
+            {"station_id": sid, "parameter_id": pid, "sampled_at": day, "value": val, "row_version": version}
+            for (sid, pid, day), val in chunk
+        ])
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[Measurement.station_id, Measurement.parameter_id, Measurement.sampled_at],
+            set_={"value": stmt.excluded.value, "row_version": stmt.excluded.row_version},
+        )
+        await session.execute(stmt)
+
+    deleted: list[tuple] = []
+    for chunk in _chunks(list(deletes), UPSERT_CHUNK):
+        result = await session.execute(
+            delete(Measurement)
+            .where(tuple_(Measurement.station_id, Measurement.parameter_id, Measurement.sampled_at).in_(chunk))
+            .returning(Measurement.station_id, Measurement.parameter_id, Measurement.sampled_at)
+        )
+        deleted.extend(tuple(row) for row in result.all())
+    await _record_deletions(session, deleted, version)
+
+    return len(upserts) + len(deletes)
+
+
 @bp.route("/api/table", methods=["POST"])
 async def post_table():
+    """Upserts measurements.
+
+    Accepts the legacy array of unpivoted rows, or a cell-level patch
+    ``{"cells": [{station_id | latitude+longitude, parameter, sampled_at, value}]}``
+    where a ``null`` value deletes the cell.
+    """
     try:
         data = await request.get_json()
-        if not isinstance(data, list):
-            return jsonify({"error": "Expected array of rows."}), 400
-
-        async with get_db_session() as session:
+        if isinstance(data, dict) and isinstance(data.get("cells"), list):
+            rows, delete_nulls = data["cells"], True
+        elif isinstance(data, list):
+            rows, delete_nulls = data, False
+        else:
+            return jsonify({"error": "Expected array of rows or {'cells': [...]} patch."}), 400
+
+        cells = []
+        for row in rows:
+            cell = _parse_cell(row) if isinstance(row, dict) else None
+            if cell is None:
+                current_app.logger.warning(f"Skipping invalid row: {row}")
+                continue
+            cells.append(cell)
+
+        rows_processed = 0
+        if cells:
             try:
-                # Cache existing parameters
-                param_rows = await session.execute(select(Parameter))
-                param_map = {p.name: p.id for p in param_rows.scalars()}
-
-                station_cache: dict[tuple[float, float], int] = {}
-                rows_processed = 0
-
-                for row in data:
-                    try:
-                        lat = float(row["latitude"])
-                        lon = float(row["longitude"])
-                        param_name = row["parameter"].strip()
-                        date_val = datetime.fromisoformat(row["sampled_at"]).date()
-                        val = float(row.get("value")) if row.get("value") is not None else None
-                    except (KeyError, ValueError) as e:
-                        current_app.logger.warning(f"Skipping invalid row: {row}, error: {e}")
-                        continue  # skip invalid row
-
-                    try:
-                        # ensure parameter exists
-                        if param_name not in param_map:
-                            prm = Parameter(name=param_name)
-                            session.add(prm)
-                            await session.flush()
-                            param_map[param_name] = prm.id
-
-                        # ensure station exists / cached
-                        key = (lat, lon)
-                        if key not in station_cache:
-                            st = Station(latitude=lat, longitude=lon)
-                            session.add(st)
-                            await session.flush()
-                            station_cache[key] = st.id
-                        station_id = station_cache[key]
-                        parameter_id = param_map[param_name]
-
-                        # upsert measurement
-                        stmt = insert(Measurement).values(
-                            station_id=station_id,
-                            parameter_id=parameter_id,
-                            sampled_at=date_val,
-                            value=val,
-                        ).on_conflict_do_update(
-                            index_elements=[
-                                Measurement.station_id, 
-                                Measurement.parameter_id, 
-                                Measurement.sampled_at
-                            ],
-                            set_={"value": val},
-                        )
-                        await session.execute(stmt)
-                        rows_processed += 1
-                        
-                    except SQLAlchemyError as e:
-                        await session.rollback()
-                        current_app.logger.error(f"Database error processing row {row}: {e}")
-                        continue
-                    except Exception as e:
-                        await session.rollback()
-                        current_app.logger.error(f"Error processing row {row}: {e}")
-                        continue
-
-                return jsonify({
-                    "status": "success",
-                    "rows_processed": rows_processed,
-                    "total_rows": len(data)
-                })
-                
+                async with get_db_session() as session:
+                    version = await allocate_row_version(session)
+                    rows_processed = await _apply_cells(session, version, cells, delete_nulls)
             except SQLAlchemyError as e:
                 current_app.logger.error(f"Database error in post_table: {e}")
                 return jsonify({"error": "Database error occurred"}), 500
-                
+        else:
+            async with get_db_session() as session:
+                version = await current_row_version(session)
+
+        return jsonify({
+            "status": "success",
+            "rows_processed": rows_processed,
+            "total_rows": len(rows),
+            "version": version,
+        })
+
     except Exception as e:
         current_app.logger.error(f"Error in post_table: {e}")
         return jsonify({"error": "An error occurred while saving data"}), 500
 
+# ---------------------------------------------------------------------------
+# Table API: delta sync -----------------------------------------------------
+# ---------------------------------------------------------------------------
+@bp.route("/api/table/changes", methods=["GET"])
+async def get_table_changes():
+    """Returns cells written or deleted after ``?since=<version>``.
+
+    Cells are keyed like the pivoted ``/api/table`` rows: ``station_id`` plus
+    the ``<parameter>_<YYYY-MM-DD>`` column name. Pass the returned
+    ``version`` as ``since`` on the next call. When the tombstones after
+    ``since`` have already been pruned the answer is ``"reload": true`` and
+    the client must fetch the whole table again.
+    """
+    try:
+        since = int(request.args.get("since", 0))
+    except ValueError:
+        return jsonify({"error": "'since' must be an integer version."}), 400
+
+    try:
+        async with get_db_session() as session:
+            # Read the version first: anything committed after this point is
+            # simply reported again on the next poll.
+            version = await current_row_version(session)
+            if version <= since:
+                return jsonify({"version": version, "cells": [], "deleted": []})
+            if since < await pruned_row_version(session):
+                return jsonify({"version": version, "reload": True, "cells": [], "deleted": []})
+
+            changed = await session.execute(
+                select(Station.id, Station.latitude, Station.longitude, Parameter.name,
+                       Measurement.sampled_at, Measurement.value)
+                .join(Measurement, Measurement.station_id == Station.id)
+                .join(Parameter, Parameter.id == Measurement.parameter_id)
+                .where(Measurement.row_version > since, Measurement.row_version <= version)
+            )
+            removed = await session.execute(
+                select(Station.id, Station.latitude, Station.longitude, Parameter.name,
+                       MeasurementDeletion.sampled_at)
+                .join(MeasurementDeletion, MeasurementDeletion.station_id == Station.id)
+                .join(Parameter, Parameter.id == MeasurementDeletion.parameter_id)
+                .where(MeasurementDeletion.row_version > since, MeasurementDeletion.row_version <= version)
+            )
+            # A prune committed while we read may have taken tombstones we needed.
+            if since < await pruned_row_version(session):
+                return jsonify({"version": version, "reload": True, "cells": [], "deleted": []})
+
+            cells = [
+                {"station_id": sid, "latitude": lat, "longitude": lon,
+                 "field": f"{name}_{day.isoformat()}", "value": val}
+                for sid, lat, lon, name, day, val in changed.all()
+            ]
+            # A cell deleted and re-written within the window is reported once,
+            # as its current value.
+            seen = {(c["station_id"], c["field"]) for c in cells}
+            deleted = []
+            for sid, lat, lon, name, day in removed.all():
+                field = f"{name}_{day.isoformat()}"
+                if (sid, field) not in seen:
+                    seen.add((sid, field))
+                    deleted.append({"station_id": sid, "latitude": lat, "longitude": lon, "field": field})
+
+        return jsonify({"version": version, "cells": cells, "deleted": deleted})
+
+    except Exception as e:
+        current_app.logger.error(f"Error in get_table_changes: {e}", exc_info=True)
+        return jsonify({"error": "An error occurred while fetching changes"}), 500
+
 # ---------------------------------------------------------------------------
 # Table API: delete measurement ---------------------------------------------
 # ---------------------------------------------------------------------------
@@ -241,16 +392,20 @@ async def delete_measurement():
         timestamp = datetime.fromisoformat(data["timestamp"]).date()
 
         async with get_db_session() as session:
+            version = await allocate_row_version(session)
+
             # Find Station ID from coordinates
             station_stmt = select(Station.id).where(Station.latitude == lat, Station.longitude == lon)
             station_id = (await session.execute(station_stmt)).scalar_one_or_none()
             if not station_id:
+                await session.rollback()
                 return jsonify({"error": "Station not found at the given coordinates."}), 404
 
             # Find Parameter ID from name
             param_stmt = select(Parameter.id).where(Parameter.name == param_name)
             parameter_id = (await session.execute(param_stmt)).scalar_one_or_none()
             if not parameter_id:
+                await session.rollback()
                 return jsonify({"error": "Parameter not found."}), 404
 
             # Execute delete statement
@@ -262,9 +417,12 @@ async def delete_measurement():
             result = await session.execute(delete_stmt)
 
             if result.rowcount == 0:
+                await session.rollback()
                 return jsonify({"error": "Measurement not found for the given details."}), 404
 
-            return jsonify({"status": "success", "message": "Measurement deleted successfully."}), 200
+            await _record_deletions(session, [(station_id, parameter_id, timestamp)], version)
+
+        return jsonify({"status": "success", "message": "Measurement deleted successfully."}), 200
 
     except (ValueError, TypeError) as e:
         current_app.logger.warning(f"Invalid data for measurement deletion: {e}")
@@ -274,6 +432,161 @@ async def delete_measurement():
         return jsonify({"error": "An unexpected error occurred."}), 500
 
 
+# ---------------------------------------------------------------------------
+# Table API: batch delete ---------------------------------------------------
+# ---------------------------------------------------------------------------
+# Upper bound on items per request, and on keys per set-based statement.
+MAX_BATCH_DELETE_ITEMS = 10_000
+BATCH_DELETE_CHUNK = 500
+
+
+def _chunks(seq: list, size: int):
+    for i in range(0, len(seq), size):
+        yield seq[i:i + size]
+
+
+async def _batch_delete_items(session, version: int, items: list) -> list[dict]:
+    """Delete explicit (lat, lon, parameter, timestamp) tuples as row ``version``.
+
+    Station and parameter ids are resolved with one query each per chunk and
+    every chunk is removed with a single ``DELETE ... WHERE (..) IN (..)``.
+    Returns one status dict per input item, in input order.
+    """
+    statuses: list[dict] = [{"index": i, "status": "invalid"} for i in range(len(items))]
+    parsed: list[tuple[int, float, float, str, object]] = []
+    for i, item in enumerate(items):
+        try:
+            parsed.append((
+                i,
+                float(item["latitude"]),
+                float(item["longitude"]),
+                str(item["parameter"]).strip(),
+                datetime.fromisoformat(str(item["timestamp"])).date(),
+            ))
+        except (KeyError, TypeError, ValueError):
+            continue
+
+    for chunk in _chunks(parsed, BATCH_DELETE_CHUNK):
+        coords = list({(lat, lon) for _, lat, lon, _, _ in chunk})
+        names = list({name for _, _, _, name, _ in chunk})
+
+        station_rows = await session.execute(
+            select(Station.id, Station.latitude, Station.longitude)
+            .where(tuple_(Station.latitude, Station.longitude).in_(coords))
+        )
+        station_ids: dict[tuple[float, float], list[int]] = {}
+        for sid, lat, lon in station_rows.all():
+            station_ids.setdefault((lat, lon), []).append(sid)
+
+        param_rows = await session.execute(
+            select(Parameter.id, Parameter.name).where(Parameter.name.in_(names))
+        )
+        param_ids = {name: pid for pid, name in param_rows.all()}
+
+        keys: set[tuple[int, int, object]] = set()
+        pending: list[tuple[int, list[tuple[int, int, object]]]] = []
+        for i, lat, lon, name, day in chunk:
+            sids = station_ids.get((lat, lon))
+            if not sids:
+                statuses[i]["status"] = "station_not_found"
+                continue
+            pid = param_ids.get(name)
+            if pid is None:
+                statuses[i]["status"] = "parameter_not_found"
+                continue
+            item_keys = [(sid, pid, day) for sid in sids]
+            keys.update(item_keys)
+            pending.append((i, item_keys))
+
+        deleted: set[tuple[int, int, object]] = set()
+        if keys:
+            result = await session.execute(
+                delete(Measurement)
+                .where(tuple_(Measurement.station_id, Measurement.parameter_id, Measurement.sampled_at).in_(list(keys)))
+                .returning(Measurement.station_id, Measurement.parameter_id, Measurement.sampled_at)
+            )
+            deleted = {tuple(row) for row in result.all()}
+            await _record_deletions(session, deleted, version)
+
+        for i, item_keys in pending:
+            statuses[i]["status"] = "deleted" if any(k in deleted for k in item_keys) else "not_found"
+
+    return statuses
+
+
+async def _batch_delete_filter(session, version: int, flt: dict) -> int:
+    """Delete every measurement matching a parameter / date range / bbox filter as row ``version``.
+
+    ``bbox`` is ``[min_lon, min_lat, max_lon, max_lat]``. Returns the number of
+    rows removed by the single set-based DELETE.
+    """
+    param_name = str(flt["parameter"]).strip()
+    conditions = [
+        Measurement.parameter_id == select(Parameter.id).where(Parameter.name == param_name).scalar_subquery()
+    ]
+    if flt.get("start_date"):
+        conditions.append(Measurement.sampled_at >= datetime.fromisoformat(flt["start_date"]).date())
+    if flt.get("end_date"):
+        conditions.append(Measurement.sampled_at <= datetime.fromisoformat(flt["end_date"]).date())
+    if flt.get("bbox") is not None:
+        min_lon, min_lat, max_lon, max_lat = (float(v) for v in flt["bbox"])
+        conditions.append(Measurement.station_id.in_(
+            select(Station.id).where(
+                Station.longitude.between(min_lon, max_lon),
+                Station.latitude.between(min_lat, max_lat),
+            )
+        ))
+
+    result = await session.execute(
+        delete(Measurement)
+        .where(*conditions)
+        .returning(Measurement.station_id, Measurement.parameter_id, Measurement.sampled_at)
+    )
+    deleted = [tuple(row) for row in result.all()]
+    await _record_deletions(session, deleted, version)
+    return len(deleted)
+
+
+@bp.route("/api/measurements", methods=["DELETE"])
+async def delete_measurements_batch():
+    """Deletes many measurements at once.
+
+    Accepts either ``{"items": [{latitude, longitude, parameter, timestamp}, ...]}``
+    (per-item status is returned) or ``{"filter": {parameter, start_date?,
+    end_date?, bbox?}}`` (the deleted row count is returned).
+    """
+    try:
+        data = await request.get_json()
+        if not data or ("items" in data) == ("filter" in data):
+            return jsonify({"error": "Provide exactly one of 'items' or 'filter'."}), 400
+
+        if "items" in data:
+            items = data["items"]
+            if not isinstance(items, list):
+                return jsonify({"error": "'items' must be an array."}), 400
+            if len(items) > MAX_BATCH_DELETE_ITEMS:
+                return jsonify({"error": f"At most {MAX_BATCH_DELETE_ITEMS} items per request."}), 413
+
+            async with get_db_session() as session:
+                statuses = await _batch_delete_items(session, await allocate_row_version(session), items)
+            deleted = sum(1 for s in statuses if s["status"] == "deleted")
+            return jsonify({"status": "success", "deleted": deleted, "results": statuses}), 200
+
+        flt = data["filter"]
+        if not isinstance(flt, dict) or not flt.get("parameter"):
+            return jsonify({"error": "'filter' requires a 'parameter'."}), 400
+        async with get_db_session() as session:
+            deleted = await _batch_delete_filter(session, await allocate_row_version(session), flt)
+        return jsonify({"status": "success", "deleted": deleted}), 200
+
+    except (ValueError, TypeError) as e:
+        current_app.logger.warning(f"Invalid data for batch measurement deletion: {e}")
+        return jsonify({"error": "Invalid data format provided."}), 400
+    except Exception as e:
+        current_app.logger.error(f"Error in delete_measurements_batch: {e}", exc_info=True)
+        return jsonify({"error": "An unexpected error occurred."}), 500
+
+
 # ---------------------------------------------------------------------------
 # App-start hook: async DB initialization -----------------------------------
 # ---------------------------------------------------------------------------
@@ -290,4 +603,10 @@ async def _init_async_db():
                 current_app.logger.info("Database initialization completed successfully")
         except Exception as e:
             current_app.logger.error(f"Failed to initialize database: {e}")
-            raise
\ No newline at end of file
+            raise
+
+
+@bp.after_app_serving
+async def _dispose_db_engine():
+    """Close pooled connections on shutdown (aiosqlite threads block exit otherwise)."""
+    await engine.dispose()
\ No newline at end of file
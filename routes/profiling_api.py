@@ -0,0 +1,134 @@
+from quart import Blueprint, request, jsonify, current_app, url_for, g, Response
+import hmac
+import os
+from utils.profiling import (
+    profile_sessions, current_capture, PROFILE_KINDS, DEFAULT_INTERVAL_MS, MAX_PROFILE_REQUESTS, DONE,
+)
+
+profiling_bp = Blueprint("profiling_api", __name__)
+
+# Profiling is off unless a token is configured; every admin call must
+# present it as "Authorization: Bearer <token>" or "X-Admin-Token".
+PROFILING_TOKEN = os.getenv("PROFILING_TOKEN", "")
+
+
+def _authorized() -> bool:
+    supplied = request.headers.get("X-Admin-Token", "")
+    auth = request.headers.get("Authorization", "")
+    if auth.startswith("Bearer "):
+        supplied = auth[len("Bearer "):]
+    return bool(supplied) and hmac.compare_digest(supplied, PROFILING_TOKEN)
+
+
+@profiling_bp.before_request
+async def _require_admin():
+    if not PROFILING_TOKEN:
+        return jsonify({"error": "Resource not found."}), 404
+    if not _authorized():
+        return jsonify({"error": "Admin token required."}), 403
+
+
+# ---------------------------------------------------------------------------
+# Capture hooks (run for every request while profiling is enabled)
+# ---------------------------------------------------------------------------
+@profiling_bp.before_app_request
+async def _begin_capture():
+    if not PROFILING_TOKEN or request.blueprint == profiling_bp.name:
+        return
+    session = profile_sessions.match(request.path, request.url_rule.rule if request.url_rule else None)
+    if session is not None:
+        g.profile_capture = (session, session.begin())
+        # Render executor threads pick the session up from the request context.
+        current_capture.set(session)
+
+
+@profiling_bp.teardown_app_request
+async def _end_capture(exc):
+    capture = g.pop("profile_capture", None) if g else None
+    if capture is not None:
+        session, started_at = capture
+        session.end(started_at)
+
+
+# ---------------------------------------------------------------------------
+# Admin API
+# ---------------------------------------------------------------------------
+def _session_body(session) -> dict:
+    body = session.to_dict()
+    body["status_url"] = url_for("profiling_api.profile_status", session_id=session.id)
+    if session.status == DONE:
+        files = ("profile.pstats", "profile.collapsed") if session.kind == "cpu" else ("memory.txt",)
+        body["downloads"] = {name: url_for("profiling_api.profile_download", session_id=session.id, name=name)
+                             for name in files}
+    return body
+
+
+@profiling_bp.route("/admin/profile", methods=["POST"])
+async def arm_profile():
+    """Arms a profile of the next ``requests`` requests to ``endpoint``.
+
+    Body: ``{"endpoint": "/generate-heatmap", "kind": "cpu" | "memory",
+    "requests": 1, "interval_ms": 5}``. ``endpoint`` is matched against the
+    request path or the route rule (e.g. ``/legend/<timestamp>.png``).
+    Memory profiles always cover a single request.
+    """
+    payload = await request.get_json(silent=True) or {}
+    endpoint = payload.get("endpoint")
+    kind = payload.get("kind", "cpu")
+    if not endpoint or not isinstance(endpoint, str):
+        return jsonify({"error": "'endpoint' is required."}), 400
+    if kind not in PROFILE_KINDS:
+        return jsonify({"error": f"Unknown kind '{kind}'. Choose from {list(PROFILE_KINDS)}."}), 400
+    try:
+        count = 1 if kind == "memory" else int(payload.get("requests", 1))
+        interval_ms = float(payload.get("interval_ms", DEFAULT_INTERVAL_MS))
+    except (TypeError, ValueError):
+        return jsonify({"error": "'requests' and 'interval_ms' must be numbers."}), 400
+    if not 1 <= count <= MAX_PROFILE_REQUESTS or not 0.5 <= interval_ms <= 1000:
+        return jsonify({"error": f"'requests' must be 1-{MAX_PROFILE_REQUESTS} and 'interval_ms' 0.5-1000."}), 400
+
+    try:
+        session = profile_sessions.arm(endpoint, kind, count, interval_ms)
+    except RuntimeError as e:
+        return jsonify({"error": str(e)}), 409
+    return jsonify(_session_body(session)), 201
+
+
+@profiling_bp.route("/admin/profile/<session_id>", methods=["GET"])
+async def profile_status(session_id):
+    session = profile_sessions.get(session_id)
+    if session is None:
+        return jsonify({"error": "Unknown profile session."}), 404
+    return jsonify(_session_body(session))
+
+
+@profiling_bp.route("/admin/profile/<session_id>/<name>", methods=["GET"])
+async def profile_download(session_id, name):
+    """Downloads ``profile.pstats``, ``profile.collapsed`` (CPU) or ``memory.txt``."""
+    session = profile_sessions.get(session_id)
+    if session is None:
+        return jsonify({"error": "Unknown profile session."}), 404
+    if session.status != DONE:
+        return jsonify({"error": f"Profile is still {session.status}."}), 409
+
+    if session.kind == "cpu" and name == "profile.pstats":
+        data, mimetype = session.pstats_bytes(), "application/octet-stream"
+    elif session.kind == "cpu" and name == "profile.collapsed":
+        data, mimetype = session.collapsed(), "text/plain; charset=utf-8"
+    elif session.kind == "memory" and name == "memory.txt":
+        data, mimetype = session.memory_report or "", "text/plain; charset=utf-8"
+    else:
+        return jsonify({"error": f"No '{name}' for a {session.kind} profile."}), 404
+    response = Response(data, mimetype=mimetype)
+    response.headers["Content-Disposition"] = f'attachment; filename="{session.id[:8]}-{name}"'
+    return response
+
+
+@profiling_bp.route("/admin/profile/<session_id>", methods=["DELETE"])
+async def cancel_profile(session_id):
+    """Stops a session early; whatever was captured stays downloadable."""
+    session = profile_sessions.cancel(session_id)
+    if session is None:
+        return jsonify({"error": "Unknown profile session."}), 404
+    current_app.logger.info(f"Profile session {session_id} stopped")
+    return jsonify(_session_body(session))
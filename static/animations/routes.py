@@ -1,10 +1,9 @@
-from animation_worker import generate_interpolated_video
 from quart import Blueprint, request, jsonify, send_file, current_app
 from datetime import datetime
 from io import BytesIO
 import logging
 
-from generate_video import generate_interpolated_video
+from utils.animation_worker import generate_interpolated_video
 
 bp_animate = Blueprint("animate", __name__, url_prefix="/api/animate")
 
@@ -65,7 +64,7 @@ async def generate_video_route():
             BytesIO(video_bytes),
             mimetype="video/mp4",
             as_attachment=True,
-            download_name=f"{parameter}_animation.mp4"
+            attachment_filename=f"{parameter}_animation.mp4"
         )
 
     except Exception as e:
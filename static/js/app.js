@@ -46,6 +46,7 @@ class HeatmapApp {
             tileContainer: document.getElementById('heatmap-gallery'),
             colormapSelect: document.getElementById('colormap-select'),
             methodSelect: document.getElementById('method-select'),
+            qualitySelect: document.getElementById('quality-select'),
             boundaryFileInput: document.getElementById('boundary-file-input'),
             boundaryFileName: document.getElementById('boundary-file-name'),
             uploadBoundaryBtn: document.getElementById('upload-boundary-button'),
@@ -57,6 +58,7 @@ class HeatmapApp {
             videoEnd: document.getElementById('video-end-date'),
             videoFps: document.getElementById('video-fps'),
             videoFrames: document.getElementById('video-frames'),
+            videoQuality: document.getElementById('video-quality'),
             videoPlayBtn: document.getElementById('play-video-btn'),
             videoStatus: document.getElementById('video-status'),
         };
@@ -87,6 +89,7 @@ class HeatmapApp {
                 fps: parseInt(this.dom.videoFps?.value || '15', 10),
                 frames_per_transition: parseInt(this.dom.videoFrames?.value || '10', 10),
                 colormap: this.dom.colormapSelect ? this.dom.colormapSelect.value : 'turbo',
+                quality: this.dom.videoQuality ? this.dom.videoQuality.value : 'preview',
                 filename,
                 boundary_path: sessionStorage.getItem('boundaryPath') || 'static/data/export.geojson'
             };
@@ -102,7 +105,8 @@ class HeatmapApp {
                 throw new Error(err.error || `Video generation failed (${res.status})`);
             }
 
-            const blob = await res.blob();
+            const job = await res.json();
+            const blob = await this.waitForAnimationJob(job);
             if (this.state.videoBlobUrl) URL.revokeObjectURL(this.state.videoBlobUrl);
             const url = URL.createObjectURL(blob);
             this.state.videoBlobUrl = url;
@@ -130,6 +134,32 @@ class HeatmapApp {
         }
     }
 
+    // Polls a queued /api/animate job until it finishes, then downloads the video.
+    async waitForAnimationJob(job, intervalMs = 1000) {
+        // Cache hits come back already done.
+        while (job.status !== 'done') {
+            const res = await fetch(job.status_url);
+            const status = await res.json().catch(() => ({}));
+            if (!res.ok) throw new Error(status.error || `Video status failed (${res.status})`);
+            if (status.status === 'done') break;
+            if (status.status === 'failed') throw new Error(status.error || 'Video generation failed');
+            if (status.status === 'cancelled') throw new Error('Video generation was cancelled');
+            if (status.total_frames) {
+                const eta = status.eta_seconds != null ? `, ~${Math.ceil(status.eta_seconds)}s left` : '';
+                this.dom.videoStatus.textContent = `Rendering ${status.frames_done}/${status.total_frames} frames (${status.percent}%${eta})`;
+            } else {
+                this.dom.videoStatus.textContent = 'Queued...';
+            }
+            await new Promise(resolve => setTimeout(resolve, intervalMs));
+        }
+        const res = await fetch(job.result_url);
+        if (!res.ok) {
+            const err = await res.json().catch(() => ({}));
+            throw new Error(err.error || `Video download failed (${res.status})`);
+        }
+        return res.blob();
+    }
+
     init() {
         this.initMap();
         this.addEventListeners();
@@ -395,6 +425,14 @@ class HeatmapApp {
                 }
             });
         }
+        if (this.dom.qualitySelect) {
+            // Switching to "Full" is the explicit request for the final render.
+            this.dom.qualitySelect.addEventListener('change', () => {
+                if (this.state.lastData) {
+                    this.generateHeatmap();
+                }
+            });
+        }
 
         // Event delegation for deleting measurements from map popups
         this.state.map.on('click', (e) => {
@@ -674,6 +712,7 @@ class HeatmapApp {
             
             const payload = {
                 data: this.state.lastData.data,
+                dataset: this.state.lastData.dataset,
                 bandwidth: parseFloat(this.dom.bandwidthSlider.value),
                 opacity: parseFloat(this.dom.opacitySlider.value),
                 timestamp_columns: this.state.lastData.timestamp_columns,
@@ -681,6 +720,7 @@ class HeatmapApp {
                 global_max: this.state.globalMax,
                 colormap: this.dom.colormapSelect ? this.dom.colormapSelect.value : 'turbo',
                 method: this.dom.methodSelect ? this.dom.methodSelect.value : 'idw',
+                quality: this.dom.qualitySelect ? this.dom.qualitySelect.value : 'preview',
                 boundary_path: sessionStorage.getItem('boundaryPath') || '/static/data/export.geojson',
                 filename: sessionStorage.getItem("uploadedFilename")
             };
@@ -693,6 +733,7 @@ class HeatmapApp {
                 headers: { 'Content-Type': 'application/json' },
                 body: JSON.stringify({
                     data: this.state.lastData.data,
+                    dataset: this.state.lastData.dataset,
                     bandwidth: parseFloat(this.dom.bandwidthSlider.value),
                     opacity: parseFloat(this.dom.opacitySlider.value),
                     timestamp_columns: this.state.lastData.timestamp_columns,
@@ -700,6 +741,7 @@ class HeatmapApp {
                     global_max: this.state.globalMax,
                     colormap: this.dom.colormapSelect ? this.dom.colormapSelect.value : 'turbo',
                     method: this.dom.methodSelect ? this.dom.methodSelect.value : 'idw',
+                    quality: this.dom.qualitySelect ? this.dom.qualitySelect.value : 'preview',
                     boundary_path: sessionStorage.getItem('boundaryPath') || '/static/data/export.geojson'
                 })
             });
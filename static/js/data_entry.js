@@ -1,12 +1,26 @@
 // AG Grid globals
 let gridOptions;
 
+// Delta sync state: server version the grid reflects, locally edited cells,
+// and whether edits happened that a cell patch cannot express.
+let tableVersion = null;
+const dirtyCells = new Map();
+let structureChanged = false;
+let applyingRemoteChanges = false;
+const SYNC_INTERVAL_MS = 30000;
+
+// "parameter|date" columns loaded from the server, i.e. those with stored
+// measurements; columns added in the grid exist only locally until saved.
+const persistedColumns = new Set();
+const ISO_DATE = /^\d{4}-\d{2}-\d{2}$/;
+
 /**
  * Dynamically generates column definitions from pivoted data.
  * @param {Array<Object>} pivotedData - The data from the API.
  * @returns {Array<Object>} AG Grid column definitions.
  */
 function generateColumnDefs(pivotedData) {
+  persistedColumns.clear();
   // If no data, create a default structure for new entries
   if (!pivotedData || pivotedData.length === 0) {
     return [
@@ -41,6 +55,7 @@ function generateColumnDefs(pivotedData) {
     if (!paramGroups[paramName]) {
       paramGroups[paramName] = [];
     }
+    persistedColumns.add(`${paramName}|${date}`);
 
     paramGroups[paramName].push({ 
       headerName: date, 
@@ -87,7 +102,12 @@ async function loadAndConfigureGrid() {
     showStatus('Loading data...', '#0078d4');
     const response = await fetch('/api/table');
     if (!response.ok) throw new Error(`HTTP error! status: ${response.status}`);
-    
+
+    const versionHeader = response.headers.get('X-Table-Version');
+    tableVersion = versionHeader !== null ? parseInt(versionHeader, 10) : null;
+    dirtyCells.clear();
+    structureChanged = false;
+
     const pivotedData = await response.json();
     console.log('Pivoted data loaded from API:', pivotedData);
 
@@ -149,7 +169,10 @@ function initializeGrid() {
     processCellFromClipboard: (params) => {
         return params.value;
     },
+    onCellValueChanged: handleCellValueChanged,
     processDataFromClipboard: (params) => {
+        // Pasted blocks are applied as transactions, which are not tracked per cell.
+        structureChanged = true;
         const data = params.data;
         const focusedCell = gridOptions.api.getFocusedCell();
         if (!focusedCell || !data || data.length === 0) {
@@ -199,10 +222,141 @@ function initializeGrid() {
 
 }
 
+/**
+ * Records an edited measurement cell so it can be saved as a patch.
+ * @param {object} params - The AG Grid cellValueChanged event.
+ */
+function handleCellValueChanged(params) {
+  if (applyingRemoteChanges) return;
+  const field = params.colDef.field;
+  if (field === 'latitude' || field === 'longitude') {
+    structureChanged = true;
+    return;
+  }
+  const parentGroup = findParentGroup(gridOptions.api.getColumnDefs(), field);
+  if (!parentGroup) return;
+  const child = parentGroup.children.find(c => c.field === field);
+  dirtyCells.set(`${params.node.id}|${field}`, {
+    node: params.node,
+    field,
+    parameter: parentGroup.headerName,
+    timestamp: child.headerName,
+  });
+}
+
+/**
+ * Builds the cell-level patch for the locally edited cells.
+ * @returns {Array<object>} Cells for the `{cells: [...]}` patch format.
+ */
+function buildCellPatch() {
+  const cells = [];
+  dirtyCells.forEach(({ node, field, parameter, timestamp }) => {
+    const row = node.data || {};
+    const hasCoords = row.latitude != null && String(row.latitude).trim() !== '' &&
+                      row.longitude != null && String(row.longitude).trim() !== '';
+    if (!hasCoords && row.station_id == null) return;
+    const value = row[field];
+    cells.push({
+      station_id: row.station_id ?? null,
+      latitude: hasCoords ? row.latitude : null,
+      longitude: hasCoords ? row.longitude : null,
+      parameter,
+      timestamp,
+      value: value == null || String(value).trim() === '' ? null : value,
+    });
+  });
+  return cells;
+}
+
+/**
+ * Pulls cells changed on the server since the grid was loaded and merges them.
+ * Cells with unsaved local edits are left alone.
+ */
+async function syncTableChanges() {
+  if (tableVersion === null || !gridOptions || !gridOptions.api) return;
+  try {
+    const response = await fetch(`/api/table/changes?since=${tableVersion}`);
+    if (!response.ok) return;
+    const delta = await response.json();
+    // The server no longer has every deletion since our version.
+    if (delta.reload) {
+      if (dirtyCells.size === 0 && !structureChanged) await loadAndConfigureGrid();
+      return;
+    }
+    if (delta.cells.length === 0 && delta.deleted.length === 0) {
+      tableVersion = delta.version;
+      return;
+    }
+
+    const nodesByStation = new Map();
+    gridOptions.api.forEachNode(node => {
+      if (node.data && node.data.station_id != null) nodesByStation.set(node.data.station_id, node);
+    });
+    const knownFields = new Set();
+    gridOptions.api.getColumnDefs().forEach(def => (def.children || []).forEach(c => knownFields.add(c.field)));
+
+    const updates = [
+      ...delta.cells.map(c => ({ ...c })),
+      ...delta.deleted.map(c => ({ ...c, value: null })),
+    ];
+    // New stations or columns need a full reload of the pivot.
+    if (updates.some(c => !nodesByStation.has(c.station_id) || !knownFields.has(c.field))) {
+      if (dirtyCells.size === 0 && !structureChanged) await loadAndConfigureGrid();
+      return;
+    }
+
+    applyingRemoteChanges = true;
+    try {
+      updates.forEach(c => {
+        const node = nodesByStation.get(c.station_id);
+        if (!dirtyCells.has(`${node.id}|${c.field}`)) node.setDataValue(c.field, c.value);
+      });
+    } finally {
+      applyingRemoteChanges = false;
+    }
+    tableVersion = delta.version;
+  } catch (error) {
+    console.warn('Delta sync failed:', error);
+  }
+}
+
+/**
+ * Saves only the edited cells as a patch.
+ */
+async function saveCellPatch() {
+  const cells = buildCellPatch();
+  if (cells.length === 0) {
+    showStatus('No changes to save.', 'orange');
+    return;
+  }
+  try {
+    showStatus(`Saving ${cells.length} changed cells...`, '#0078d4');
+    const response = await fetch('/api/table', {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify({ cells }),
+    });
+    const result = await response.json();
+    if (!response.ok) {
+      throw new Error(result.error || 'Failed to save data');
+    }
+    dirtyCells.clear();
+    showStatus('Data saved successfully!', 'green');
+    setTimeout(() => { window.location.href = '/'; }, 1500);
+  } catch (error) {
+    console.error('Error saving data:', error);
+    showStatus(`Error: ${error.message}`, 'red');
+  }
+}
+
 /**
  * Un-pivots the grid data and saves it to the server.
  */
 async function saveTableData() {
+  if (tableVersion !== null && !structureChanged) {
+    return saveCellPatch();
+  }
+
   showStatus('Saving...', '#0078d4');
   
   const rowData = [];
@@ -498,6 +652,7 @@ async function handleHeaderDoubleClick(params) {
     findAndUpdate(newDefs);
 
     if (updated) {
+        structureChanged = true;
         gridOptions.api.setColumnDefs(newDefs);
         showStatus('Header updated successfully.', 'green');
     }
@@ -553,16 +708,46 @@ function getContextMenuItems(params) {
   return ['autoSizeAll', 'resetColumns'];
 }
 
+/**
+ * Deletes stored measurements for a parameter (optionally a single date) in one request.
+ * @param {string} parameter - The parameter name.
+ * @param {string|null} date - The timestamp (YYYY-MM-DD), or null for every date.
+ * @returns {Promise<number>} Number of measurements removed on the server.
+ */
+async function deleteMeasurementsOnServer(parameter, date = null) {
+  const filter = { parameter };
+  if (date) {
+    filter.start_date = date;
+    filter.end_date = date;
+  }
+  const response = await fetch('/api/measurements', {
+    method: 'DELETE',
+    headers: { 'Content-Type': 'application/json' },
+    body: JSON.stringify({ filter }),
+  });
+  const result = await response.json();
+  if (!response.ok) {
+    throw new Error(result.error || 'Failed to delete measurements');
+  }
+  return result.deleted;
+}
+
 /**
  * Deletes a column or a whole parameter group from the grid.
  * @param {string} identifier - The field of the column or the headerName of the group.
  * @param {boolean} isChild - True if deleting a child (timestamp), false for a group (parameter).
  */
-function deleteColumnOrGroup(identifier, isChild) {
+async function deleteColumnOrGroup(identifier, isChild) {
   const currentDefs = gridOptions.api.getColumnDefs();
   let newDefs;
+  let parameter;
+  let date = null;
 
   if (isChild) {
+    const parentGroup = findParentGroup(currentDefs, identifier);
+    const child = parentGroup ? parentGroup.children.find(c => c.field === identifier) : null;
+    parameter = parentGroup ? parentGroup.headerName : null;
+    date = child ? child.headerName : null;
     // Delete a single timestamp column
     newDefs = currentDefs.map(group => {
       if (group.children) {
@@ -571,12 +756,41 @@ function deleteColumnOrGroup(identifier, isChild) {
       return group;
     }).filter(group => !group.children || group.children.length > 0); // Remove group if it becomes empty
   } else {
+    parameter = identifier;
     // Delete an entire parameter group
     newDefs = currentDefs.filter(group => group.headerName !== identifier);
   }
 
+  // Only columns loaded from the server have measurements to delete; unsaved
+  // ones (e.g. the 'YYYY-MM-DD' placeholder) are removed from the grid only.
+  const stored = parameter && (date
+    ? ISO_DATE.test(date) && persistedColumns.has(`${parameter}|${date}`)
+    : [...persistedColumns].some(key => key.startsWith(`${parameter}|`)));
+
+  if (!stored) {
+    showStatus(`Deleted successfully.`, 'green');
+  } else {
+    const what = date ? `'${parameter}' on ${date}` : `all '${parameter}' data`;
+    if (confirm(`Delete ${what} from the database as well?`)) {
+      try {
+        showStatus('Deleting...', '#0078d4');
+        const deleted = await deleteMeasurementsOnServer(parameter, date);
+        [...persistedColumns]
+          .filter(key => date ? key === `${parameter}|${date}` : key.startsWith(`${parameter}|`))
+          .forEach(key => persistedColumns.delete(key));
+        showStatus(`Deleted ${deleted} stored measurements.`, 'green');
+      } catch (error) {
+        // Keep the column so the grid still matches the database; the user can retry.
+        console.error('Error deleting measurements:', error);
+        showStatus(`Error: ${error.message}. The column was kept.`, 'red');
+        return;
+      }
+    } else {
+      showStatus(`Removed from the grid; stored measurements were kept.`, 'orange');
+    }
+  }
+
   gridOptions.api.setColumnDefs(newDefs);
-  showStatus(`Deleted successfully.`, 'green');
 }
 
 /**
@@ -623,4 +837,6 @@ if (typeof agGrid === 'undefined') {
 } else {
   initializeGrid();
   setupEventListeners();
+  setInterval(syncTableChanges, SYNC_INTERVAL_MS);
+  window.addEventListener('focus', syncTableChanges);
 }
@@ -0,0 +1,198 @@
+"""Admission control for CPU-heavy work on a shared, bounded render executor.
+
+Heatmaps, legends and animation jobs run on one thread pool of
+``RENDER_WORKERS`` threads instead of on the event loop or their own pools.
+Each kind of work has a quota: how many may run at once, how many may wait
+for a slot and how long they may wait. A request that finds the waiting
+queue full, or waits longer than its timeout, gets ``RenderBusyError``,
+which the routes turn into 429 with ``Retry-After``. Cheap routes never
+queue here, so they stay fast while renders are throttled.
+
+Quotas can be overridden per kind with ``RENDER_<KIND>_CONCURRENCY``,
+``RENDER_<KIND>_QUEUE`` and ``RENDER_<KIND>_TIMEOUT`` (seconds, 0 for no
+limit). Slots are handed out in arrival order, skipping waiters whose kind
+is at its quota.
+
+The executor and its quotas belong to one worker process. With
+``WORKERS=N`` hypercorn processes, the container admits N times each quota.
+The default thread count is divided by N, so the processes together still
+use about one render thread per CPU.
+"""
+
+import asyncio
+import contextvars
+import functools
+import math
+import os
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Callable, TypeVar
+
+from utils.metrics import RENDER_ACTIVE, RENDER_QUEUED, RENDER_REJECTED, RENDER_WAIT_SECONDS, record_stage
+from utils.profiling import run_profiled
+
+T = TypeVar("T")
+
+# Hypercorn worker processes sharing the container (see the Dockerfile).
+WORKER_PROCESSES = max(1, int(os.getenv("WORKERS", "1")))
+RENDER_WORKERS = int(os.getenv("RENDER_WORKERS", str(max(2, os.cpu_count() or 1) // WORKER_PROCESSES or 1)))
+# Weight of the newest run in the per-kind duration average behind Retry-After.
+_DURATION_SMOOTHING = 0.2
+
+
+class RenderBusyError(RuntimeError):
+    """No render slot is available; retry after ``retry_after`` seconds."""
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+@dataclass(frozen=True)
+class RenderQuota:
+    concurrency: int
+    queue: int
+    timeout: float | None
+
+    @classmethod
+    def from_env(cls, kind: str, concurrency: int, queue: int, timeout: float | None) -> "RenderQuota":
+        prefix = f"RENDER_{kind.upper()}_"
+        timeout = float(os.getenv(prefix + "TIMEOUT", timeout or 0))
+        return cls(
+            concurrency=max(1, int(os.getenv(prefix + "CONCURRENCY", concurrency))),
+            queue=max(0, int(os.getenv(prefix + "QUEUE", queue))),
+            timeout=timeout or None,
+        )
+
+
+class RenderExecutor:
+    def __init__(self, workers: int = RENDER_WORKERS):
+        self.workers = workers
+        self._quotas: dict[str, RenderQuota] = {}
+        self._active: dict[str, int] = {}
+        self._waiting: dict[str, int] = {}
+        # (kind, future) in arrival order; the future resolves when a slot is granted.
+        self._waiters: deque[tuple[str, asyncio.Future]] = deque()
+        self._durations: dict[str, float] = {}
+        self._executor: ThreadPoolExecutor | None = None
+
+    def register(self, kind: str, concurrency: int, queue: int, timeout: float | None) -> RenderQuota:
+        """Declare a kind of work and its default quota (environment overrides apply)."""
+        quota = RenderQuota.from_env(kind, min(concurrency, self.workers), queue, timeout)
+        self._quotas[kind] = quota
+        self._active[kind] = self._waiting[kind] = 0
+        self._publish(kind)
+        return quota
+
+    def stats(self) -> dict[str, dict]:
+        return {kind: {"active": self._active[kind], "queued": self._waiting[kind],
+                       "concurrency": quota.concurrency, "queue": quota.queue}
+                for kind, quota in self._quotas.items()}
+
+    async def run(self, kind: str, fn: Callable[..., T], *args, **kwargs) -> T:
+        """Run ``fn(*args, **kwargs)`` on the executor once ``kind`` is admitted.
+
+        The call runs in a copy of the current context, so stage timings
+        reach the request and a CPU profile of the request samples the
+        render thread. Raises ``RenderBusyError`` if it cannot be admitted.
+        """
+        waited = await self._acquire(kind)
+        record_stage(f"{kind}.queue", waited)
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="render")
+        call = functools.partial(contextvars.copy_context().run, run_profiled, fn, *args, **kwargs)
+        started = time.perf_counter()
+        future = asyncio.get_running_loop().run_in_executor(self._executor, call)
+        # The slot is held until the thread is done, even if the caller is cancelled.
+        future.add_done_callback(lambda _: self._release(kind, time.perf_counter() - started))
+        return await asyncio.shield(future)
+
+    def shutdown(self) -> None:
+        # Each cancelled waiter removes itself from the queue.
+        for _, waiter in list(self._waiters):
+            waiter.cancel()
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+
+    # -- slots --------------------------------------------------------------
+
+    def _has_slot(self, kind: str) -> bool:
+        return (sum(self._active.values()) < self.workers
+                and self._active[kind] < self._quotas[kind].concurrency)
+
+    async def _acquire(self, kind: str) -> float:
+        """Wait for a slot; returns the seconds spent waiting."""
+        quota = self._quotas[kind]
+        if self._has_slot(kind) and not any(k == kind for k, _ in self._waiters):
+            self._grant(kind)
+            RENDER_WAIT_SECONDS.observe((kind,), 0.0)
+            return 0.0
+        if self._waiting[kind] >= quota.queue:
+            raise self._reject(kind, "queue_full")
+
+        waiter = asyncio.get_running_loop().create_future()
+        entry = (kind, waiter)
+        self._waiters.append(entry)
+        self._waiting[kind] += 1
+        self._publish(kind)
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), quota.timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if waiter.done() and not waiter.cancelled():
+                # Granted just as we gave up: hand the slot on.
+                self._release(kind)
+            else:
+                waiter.cancel()
+                self._waiters.remove(entry)
+                self._waiting[kind] -= 1
+                self._publish(kind)
+            if isinstance(e, asyncio.TimeoutError):
+                raise self._reject(kind, "timeout") from None
+            raise
+        waited = time.perf_counter() - started
+        RENDER_WAIT_SECONDS.observe((kind,), waited)
+        return waited
+
+    def _grant(self, kind: str) -> None:
+        self._active[kind] += 1
+        self._publish(kind)
+
+    def _release(self, kind: str, duration: float | None = None) -> None:
+        if duration is not None:
+            previous = self._durations.get(kind, duration)
+            self._durations[kind] = previous + _DURATION_SMOOTHING * (duration - previous)
+        self._active[kind] -= 1
+        self._publish(kind)
+        self._dispatch()
+
+    def _dispatch(self) -> None:
+        """Grant free slots to the oldest waiters whose kind is under quota."""
+        for entry in list(self._waiters):
+            if sum(self._active.values()) >= self.workers:
+                break
+            kind, waiter = entry
+            if waiter.done() or not self._has_slot(kind):
+                continue
+            self._waiters.remove(entry)
+            self._waiting[kind] -= 1
+            self._grant(kind)
+            waiter.set_result(None)
+
+    def _reject(self, kind: str, reason: str) -> RenderBusyError:
+        RENDER_REJECTED.inc((kind, reason))
+        quota = self._quotas[kind]
+        # Time for the work ahead of a new request to drain.
+        ahead = self._waiting[kind] + self._active[kind]
+        retry_after = max(1, math.ceil(self._durations.get(kind, 1.0) * ahead / quota.concurrency))
+        return RenderBusyError(f"Server is busy rendering {kind}s; try again shortly.", retry_after)
+
+    def _publish(self, kind: str) -> None:
+        RENDER_ACTIVE.set((kind,), self._active[kind])
+        RENDER_QUEUED.set((kind,), self._waiting[kind])
+
+
+render_executor = RenderExecutor()
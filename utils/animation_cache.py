@@ -0,0 +1,136 @@
+"""Size-capped on-disk cache of finished animation videos.
+
+Entries are keyed by a hash of everything that determines the output: the
+measurement data, the request parameters and the boundary file. A repeat
+request for the same animation is served straight from disk. Files are
+evicted least-recently-used first once the total size exceeds the cap; the
+file mtime doubles as the last-access time, so the LRU order survives
+restarts. Several workers share the directory, so the total is taken from
+a directory scan at eviction time rather than from per-worker bookkeeping.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+from functools import lru_cache
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+ANIMATION_CACHE_DIR = os.getenv("ANIMATION_CACHE_DIR", os.path.join("data", "animation_cache"))
+ANIMATION_CACHE_MAX_MB = int(os.getenv("ANIMATION_CACHE_MAX_MB", "1024"))
+
+# Bump when a renderer change alters the output for identical inputs.
+RENDER_VERSION = 1
+
+DATASET_COLUMNS = ["latitude", "longitude", "sampled_at", "value"]
+
+
+def dataset_hash(df: pd.DataFrame) -> str:
+    """Content hash of the measurement rows an animation is rendered from."""
+    import pandas as pd
+
+    columns = [c for c in DATASET_COLUMNS if c in df.columns]
+    row_hashes = pd.util.hash_pandas_object(df[columns], index=False).to_numpy()
+    digest = hashlib.sha256(",".join(columns).encode())
+    digest.update(row_hashes.tobytes())
+    return digest.hexdigest()
+
+
+@lru_cache(maxsize=16)
+def _file_hash(path: str, mtime_ns: int, size: int) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def boundary_hash(path: str) -> str:
+    """Content hash of a boundary GeoJSON (memoized per path/mtime/size)."""
+    st = os.stat(path)
+    return _file_hash(os.path.abspath(path), st.st_mtime_ns, st.st_size)
+
+
+def animation_cache_key(df: pd.DataFrame, boundary_path: str, **params) -> str:
+    """Cache key for an animation of ``df`` with the given render parameters."""
+    material = {
+        "version": RENDER_VERSION,
+        "dataset": dataset_hash(df),
+        "boundary": boundary_hash(boundary_path),
+        "params": params,
+    }
+    return hashlib.sha256(json.dumps(material, sort_keys=True, default=str).encode()).hexdigest()
+
+
+class AnimationCache:
+    def __init__(self, root: str = ANIMATION_CACHE_DIR, max_bytes: int = ANIMATION_CACHE_MAX_MB * 1024 * 1024):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.root, f"{key}.mp4")
+
+    def _scan(self) -> list[tuple[float, int, str]]:
+        """(mtime, size, key) of every cached video, written by any worker."""
+        entries = []
+        for name in os.listdir(self.root):
+            if not name.endswith(".mp4"):
+                continue
+            try:
+                st = os.stat(os.path.join(self.root, name))
+            except FileNotFoundError:  # evicted by another worker meanwhile
+                continue
+            entries.append((st.st_mtime, st.st_size, name[:-4]))
+        return entries
+
+    @property
+    def total_bytes(self) -> int:
+        os.makedirs(self.root, exist_ok=True)
+        return sum(size for _, size, _ in self._scan())
+
+    def get(self, key: str) -> str | None:
+        """Path of the cached video for ``key`` (marking it recently used), or None."""
+        if not key.isalnum():  # keys come from URLs; never leave the cache directory
+            return None
+        path = self._path(key)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return path
+
+    def put(self, key: str, src_path: str) -> str:
+        """Move a finished video into the cache and return its cached path."""
+        os.makedirs(self.root, exist_ok=True)
+        dest = self._path(key)
+        # The job result directory may be on another filesystem.
+        shutil.move(src_path, dest)
+        with self._lock:
+            self._evict(keep=key)
+        return dest
+
+    def _evict(self, keep: str) -> None:
+        entries = self._scan()
+        total = sum(size for _, size, _ in entries)
+        for _, size, key in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            try:
+                os.remove(self._path(key))
+            except FileNotFoundError:  # evicted by another worker meanwhile
+                pass
+            total -= size
+            logging.info(f"Evicted cached animation {key}")
+
+
+animation_cache = AnimationCache()
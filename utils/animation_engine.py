@@ -0,0 +1,230 @@
+"""The animation pipeline shared by every video generator.
+
+An animation is built in fixed stages:
+
+1. load the boundary polygon and lay a lon/lat grid over its bounds;
+2. interpolate each sampling date onto the grid with a spatial
+   interpolator from ``SPATIAL_METHODS`` (IDW, RBF, GP/kriging, KDE);
+3. fit a temporal interpolant from ``TEMPORAL_METHODS`` (linear, cubic)
+   through those keyframes;
+4. render masked, colormapped frames as arrays (in parallel worker
+   processes) and stream them into the H.264 encoder.
+
+``render_animation`` runs the whole pipeline for a long-format
+``latitude/longitude/sampled_at/value`` frame. ``render_station_animation``
+covers the station-first variant, where values are already interpolated in
+time at every station and only need the spatial and render stages.
+
+The keyframe stack and the boundary mask of ``render_animation`` are kept
+in the shared store (``utils.shared_store``). Re-rendering the same data
+with another colormap, frame rate or temporal method, from any worker,
+skips the spatial stage.
+"""
+
+import logging
+from typing import Callable, Iterable, Iterator
+
+import numpy as np
+import pandas as pd
+
+from utils.animation_cache import RENDER_VERSION, boundary_hash, dataset_hash
+from utils.boundary import DEFAULT_BOUNDARY_PATH, boundary_file, load_boundary
+from utils.frame_encoder import DEFAULT_FRAME_WIDTH, FrameRenderer, boundary_mask, encode_video_to_file
+from utils.metrics import stage
+from utils.parallel_render import iter_rendered_frames
+from utils.shared_store import array_key, shared_store
+from utils.spatial_interp import SPATIAL_INTERPOLATORS, KDESpatialInterpolator
+from utils.temporal_interp import TEMPORAL_KINDS, LazyTemporalInterpolator
+
+DEFAULT_GRID_SIZE = 300
+
+SPATIAL_METHODS = tuple(SPATIAL_INTERPOLATORS)
+TEMPORAL_METHODS = TEMPORAL_KINDS
+
+# Render presets. ``preview`` uses a coarse grid, small frames and a
+# quarter of the temporal frames (at a quarter of the frame rate, so the
+# clip keeps its duration) for quick iteration before a final render.
+QUALITY_PRESETS = {
+    'full': {'grid_size': DEFAULT_GRID_SIZE, 'width': DEFAULT_FRAME_WIDTH, 'frame_divisor': 1},
+    'preview': {'grid_size': 100, 'width': 320, 'frame_divisor': 4},
+}
+ANIMATION_QUALITIES = tuple(QUALITY_PRESETS)
+
+# Frames per spatial solve in the station-first path.
+STATION_FRAME_WINDOW = 32
+
+
+# ---------------------------------------------------------------------------
+# Stage 1: boundary and grid
+# ---------------------------------------------------------------------------
+
+# The polygon itself comes from ``utils.boundary.load_boundary``, which
+# caches it per file version.
+
+def make_grid(bounds, size: int = DEFAULT_GRID_SIZE) -> tuple[tuple[int, int], np.ndarray]:
+    """(grid shape, (G, 2) lon/lat points) in ``np.mgrid`` [lon_i, lat_j] layout."""
+    min_lon, min_lat, max_lon, max_lat = bounds
+    grid_x, grid_y = np.mgrid[min_lon:max_lon:size * 1j, min_lat:max_lat:size * 1j]
+    return grid_x.shape, np.column_stack([grid_x.ravel(), grid_y.ravel()])
+
+
+# ---------------------------------------------------------------------------
+# Stage 2: spatial keyframes
+# ---------------------------------------------------------------------------
+
+def spatial_interpolator(method: str, grid_points: np.ndarray, value_range: tuple[float, float], **options):
+    """Instantiate the registered spatial interpolator ``method``."""
+    try:
+        cls = SPATIAL_INTERPOLATORS[method]
+    except KeyError:
+        raise ValueError(f"Unknown spatial interpolation '{method}'. Choose from {SPATIAL_METHODS}.")
+    if cls is KDESpatialInterpolator:
+        options.setdefault('value_range', value_range)
+    # Drop unset options so each interpolator keeps its own defaults.
+    return cls(grid_points, **{key: value for key, value in options.items() if value is not None})
+
+
+def keyframe_fields(df: pd.DataFrame, spatial, grid_shape) -> tuple[np.ndarray, list]:
+    """Interpolate every sampling date onto the grid.
+
+    Returns the (K, nx, ny) keyframe stack and the K dates that produced a
+    field; dates with too few stations are skipped.
+    """
+    dates, slices = [], []
+    for date, slice_df in df.groupby('sampled_at', sort=True):
+        dates.append(date)
+        slices.append((slice_df[['longitude', 'latitude']].to_numpy(), slice_df['value'].to_numpy()))
+    fields, kept = [], []
+    for date, field in zip(dates, spatial.fields(slices)):
+        if field is not None:
+            fields.append(field.reshape(grid_shape))
+            kept.append(date)
+    if len(fields) < 2:
+        raise ValueError("Could not generate enough spatial fields for interpolation.")
+    return np.stack(fields), kept
+
+
+# ---------------------------------------------------------------------------
+# Stages 3-4: temporal interpolation, rendering and encoding
+# ---------------------------------------------------------------------------
+
+def with_progress(frames: Iterable[np.ndarray], total_frames: int,
+                  progress: Callable[[int, int], None] | None) -> Iterator[np.ndarray]:
+    """Pass frames through, reporting ``progress(done, total)`` after each one."""
+    for i, frame in enumerate(frames, 1):
+        yield frame
+        if progress is not None:
+            progress(i, total_frames)
+
+
+def render_animation(df: pd.DataFrame, output_path: str, *, fps: int, frames_per_transition: int,
+                     cmap: str = 'viridis', spatial: str = 'rbf', temporal: str = 'cubic',
+                     boundary_path: str = DEFAULT_BOUNDARY_PATH, grid_size: int = DEFAULT_GRID_SIZE,
+                     width: int = DEFAULT_FRAME_WIDTH, time_axis: str = 'index',
+                     total_frames: int | None = None, spatial_options: dict | None = None,
+                     progress: Callable[[int, int], None] | None = None, fragmented: bool = False,
+                     quality: str = 'full') -> int:
+    """Render ``df`` (latitude, longitude, sampled_at, value) to an MP4 at ``output_path``.
+
+    Keyframes sit at consecutive integers (``time_axis='index'``, the default,
+    giving ``frames_per_transition`` frames per date pair) or at their real
+    sampling times (``time_axis='date'``). ``total_frames`` overrides the
+    frame count. ``fragmented`` writes a progressively playable fragmented
+    MP4. ``quality`` picks a preset from ``QUALITY_PRESETS``; the preview
+    preset caps the grid and frame size and thins out the frames. Returns
+    the number of frames written.
+    """
+    if df.empty:
+        raise ValueError("Input DataFrame is empty.")
+    if temporal not in TEMPORAL_METHODS:
+        raise ValueError(f"Unknown temporal interpolation '{temporal}'. Choose from {TEMPORAL_METHODS}.")
+    if quality not in QUALITY_PRESETS:
+        raise ValueError(f"Unknown quality '{quality}'. Choose from {ANIMATION_QUALITIES}.")
+    preset = QUALITY_PRESETS[quality]
+    grid_size = min(grid_size, preset['grid_size'])
+    width = min(width, preset['width'])
+    divisor = preset['frame_divisor']
+    if divisor > 1:
+        frames_per_transition = max(1, -(-frames_per_transition // divisor))
+        fps = max(1, -(-fps // divisor))
+        if total_frames is not None:
+            total_frames = max(2, -(-total_frames // divisor))
+    df = df.assign(sampled_at=pd.to_datetime(df['sampled_at']))
+    if df['sampled_at'].nunique() < 2:
+        raise ValueError("At least two distinct timestamps are required for animation.")
+
+    boundary = load_boundary(boundary_path)
+    boundary_digest = boundary_hash(boundary_file(boundary_path))
+    bounds = boundary.bounds
+    grid_shape, grid_points = make_grid(bounds, grid_size)
+    value_range = (float(df['value'].min()), float(df['value'].max()))
+
+    def build_keyframes():
+        interpolator = spatial_interpolator(spatial, grid_points, value_range, **(spatial_options or {}))
+        fields, field_dates = keyframe_fields(df, interpolator, grid_shape)
+        return {'keyframes': fields, 'dates': np.array(field_dates, dtype='datetime64[ns]')}
+
+    with stage('animation.interpolate'):
+        key = array_key(RENDER_VERSION, dataset_hash(df), boundary_digest, spatial, spatial_options or {}, grid_size)
+        stored = shared_store.arrays('keyframes', key, build_keyframes)
+        keyframes, dates = stored['keyframes'], stored['dates']
+
+    times = None
+    if time_axis == 'date':
+        times = (pd.DatetimeIndex(dates) - dates[0]).total_seconds().to_numpy()
+    interpolant = LazyTemporalInterpolator(keyframes, kind=temporal, times=times)
+    del keyframes
+    if total_frames is None:
+        total_frames = (interpolant.n_keyframes - 1) * frames_per_transition
+
+    mask = shared_store.arrays('boundary_mask', array_key(boundary_digest, width),
+                               lambda: {'mask': boundary_mask(boundary, bounds, width)})['mask']
+    renderer = FrameRenderer(boundary, bounds, grid_shape, cmap, vmin=value_range[0], vmax=value_range[1],
+                             width=width, mask=mask)
+    logging.info(f"Rendering {total_frames} {quality} frames ({spatial}/{temporal}, {len(dates)} keyframes)")
+    frames = iter_rendered_frames(interpolant, renderer, total_frames)
+    # Frames are rendered as the encoder pulls them, so this covers both.
+    with stage('animation.encode'):
+        return encode_video_to_file(with_progress(frames, total_frames, progress), fps, output_path,
+                                    fragmented=fragmented)
+
+
+def render_station_animation(points: np.ndarray, station_frames: np.ndarray, output_path: str, *, fps: int,
+                             cmap: str = 'viridis', spatial: str = 'idw',
+                             boundary_path: str = DEFAULT_BOUNDARY_PATH, grid_size: int = DEFAULT_GRID_SIZE,
+                             width: int = DEFAULT_FRAME_WIDTH, spatial_options: dict | None = None,
+                             progress: Callable[[int, int], None] | None = None) -> int:
+    """Render per-station values that are already interpolated in time.
+
+    ``points`` is (S, 2) lon/lat and ``station_frames`` is (frames, S). Every
+    frame shares the station set, so windows of frames are solved together
+    by the spatial interpolator.
+    """
+    station_frames = np.asarray(station_frames, dtype=np.float32)
+    if station_frames.ndim != 2 or station_frames.shape[0] == 0:
+        raise ValueError("No frames to render.")
+    boundary = load_boundary(boundary_path)
+    bounds = boundary.bounds
+    grid_shape, grid_points = make_grid(bounds, grid_size)
+    finite = station_frames[np.isfinite(station_frames)]
+    if finite.size == 0:
+        raise ValueError("No finite station values to render.")
+    value_range = (float(finite.min()), float(finite.max()))
+
+    interpolator = spatial_interpolator(spatial, grid_points, value_range, **(spatial_options or {}))
+    renderer = FrameRenderer(boundary, bounds, grid_shape, cmap, vmin=value_range[0], vmax=value_range[1],
+                             width=width)
+
+    def frames():
+        for start in range(0, len(station_frames), STATION_FRAME_WINDOW):
+            window = station_frames[start:start + STATION_FRAME_WINDOW]
+            # Stations without a value in a frame are left out of that frame.
+            slices = [(points[ok], values[ok]) for values in window for ok in [np.isfinite(values)]]
+            for field in interpolator.fields(slices):
+                if field is None:
+                    raise ValueError("Too few stations to interpolate.")
+                yield renderer.render(field.reshape(grid_shape))
+
+    total_frames = len(station_frames)
+    with stage('animation.encode'):
+        return encode_video_to_file(with_progress(frames(), total_frames, progress), fps, output_path)
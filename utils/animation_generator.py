@@ -1,14 +1,9 @@
-import numpy as np
+import os
+import tempfile
+from typing import Callable
 import pandas as pd
-import matplotlib.pyplot as plt
-import imageio
-import io
-import json
-from shapely.geometry import shape
-from scipy.interpolate import Rbf, interp1d
-from PIL import Image
-from db import get_db_session, Measurement, Station, Parameter
-from sqlalchemy import select
+from utils.animation_engine import render_animation
+from utils.shared_store import file_key, shared_store
 
 LAKE_BOUNDARY_GEOJSON = 'static/data/export.geojson'
 
@@ -16,9 +11,23 @@ async def fetch_data_for_animation(parameter: str, start_date, end_date, filenam
     """
     Loads user-uploaded Excel/CSV file from disk, reshapes to long format, 
     and filters it for the selected time range. Parameter is used only as a label.
+
+    The long-format frame is kept in the shared store, so the file is parsed
+    once per upload rather than once per request and worker.
     """
     file_path = f"uploads/{filename}"
-    
+    df = shared_store.frame('animation_source', file_key(file_path), lambda: read_animation_source(file_path))
+
+    # Filter by date
+    mask = (df['sampled_at'] >= start_date) & (df['sampled_at'] <= end_date)
+    filtered = df.loc[mask].copy()
+
+    return filtered
+
+def read_animation_source(file_path: str) -> pd.DataFrame:
+    """Long-format latitude/longitude/sampled_at/value rows of an uploaded file."""
+    filename = os.path.basename(file_path)
+
     # Determine file type and read accordingly
     if filename.lower().endswith(('.xls', '.xlsx')):
         df = pd.read_excel(file_path)
@@ -80,86 +89,43 @@ async def fetch_data_for_animation(parameter: str, start_date, end_date, filenam
     # Convert value to numeric and drop invalid
     df['value'] = pd.to_numeric(df['value'], errors='coerce')
     df.dropna(subset=['sampled_at', 'value', 'latitude', 'longitude'], inplace=True)
-
-    # Filter by date
-    mask = (df['sampled_at'] >= start_date) & (df['sampled_at'] <= end_date)
-    filtered = df.loc[mask].copy()
-
-    return filtered
-
-def generate_spatiotemporal_video(df: pd.DataFrame, fps: int, frames_per_transition: int, cmap: str, boundary_path: str = 'static/data/export.geojson') -> bytes:
-    """Generates a spatiotemporally interpolated video from measurement data."""
-    if df.empty:
-        raise ValueError("Input DataFrame is empty.")
-
-    df['sampled_at'] = pd.to_datetime(df['sampled_at'])
-    unique_dates = sorted(df['sampled_at'].unique())
-
-    if len(unique_dates) < 2:
-        raise ValueError("At least two distinct timestamps are required for animation.")
-
-    # --- 1. Spatial Interpolation (RBF) for each time slice ---
-    # Handle path: if it starts with /, remove it to make it relative to CWD (project root)
-    if boundary_path.startswith('/') or boundary_path.startswith('\\'):
-        boundary_path = boundary_path.lstrip('/\\')
-        
-    with open(boundary_path, 'r', encoding='utf-8') as f:
-        gj = json.load(f)
-    if gj.get('type') == 'FeatureCollection':
-        geom_obj = gj['features'][0]['geometry']
-    elif gj.get('type') == 'Feature':
-        geom_obj = gj['geometry']
-    else:
-        geom_obj = gj
-    lake_boundary = shape(geom_obj)
-    min_lon, min_lat, max_lon, max_lat = lake_boundary.bounds
-    grid_x, grid_y = np.mgrid[min_lon:max_lon:300j, min_lat:max_lat:300j]
-
-    spatial_fields = []
-    for date in unique_dates:
-        slice_df = df[df['sampled_at'] == date]
-        if slice_df.shape[0] < 4: # RBF needs a minimum number of points
-            continue
-        
-        rbf_interpolator = Rbf(slice_df['longitude'], slice_df['latitude'], slice_df['value'], function='cubic')
-        field = rbf_interpolator(grid_x, grid_y)
-        spatial_fields.append(field)
-
-    if len(spatial_fields) < 2:
-        raise ValueError("Could not generate enough spatial fields for interpolation.")
-
-    # --- 2. Temporal Interpolation (Cubic Spline) between fields ---
-    spatial_fields = np.array(spatial_fields)
-    time_points = np.arange(len(spatial_fields))
-    total_frames = (len(spatial_fields) - 1) * frames_per_transition
-    interpolated_time_points = np.linspace(0, len(spatial_fields) - 1, total_frames)
-
-    # Create a cubic interpolator for each pixel in the grid
-    interpolator = interp1d(time_points, spatial_fields, axis=0, kind='cubic')
-    interpolated_fields = interpolator(interpolated_time_points)
-
-    # --- 3. Render Frames ---
-    video_frames = []
-    norm = plt.Normalize(vmin=df['value'].min(), vmax=df['value'].max())
-    
-    for field in interpolated_fields:
-        fig, ax = plt.subplots(figsize=(8, 8), dpi=100)
-        ax.set_axis_off()
-        ax.imshow(field.T, extent=(min_lon, max_lon, min_lat, max_lat), origin='lower', cmap=cmap, norm=norm)
-        
-        # Clip to lake boundary
-        patch = plt.Polygon(lake_boundary.exterior.coords, transform=ax.transData)
-        ax.images[0].set_clip_path(patch)
-        
-        buf = io.BytesIO()
-        plt.savefig(buf, format='png', bbox_inches='tight', pad_inches=0)
-        plt.close(fig)
-        buf.seek(0)
-        video_frames.append(Image.open(buf))
-
-    # --- 4. Encode Video ---
-    with io.BytesIO() as video_buffer:
-        imageio.mimsave(video_buffer, video_frames, format='mp4', fps=fps)
-        video_bytes = video_buffer.getvalue()
-
-    return video_bytes
+    return df.reset_index(drop=True)
+
+def generate_spatiotemporal_video(df: pd.DataFrame, fps: int, frames_per_transition: int, cmap: str, boundary_path: str = 'static/data/export.geojson', neighbors: int | None = None, spatial: str = 'rbf', temporal: str = 'cubic') -> bytes:
+    """Generates a spatiotemporally interpolated video and returns the MP4 bytes."""
+    fd, path = tempfile.mkstemp(suffix='.mp4')
+    os.close(fd)
+    try:
+        render_spatiotemporal_video(df, fps, frames_per_transition, cmap, path, boundary_path, neighbors,
+                                    spatial=spatial, temporal=temporal)
+        with open(path, 'rb') as f:
+            return f.read()
+    finally:
+        os.remove(path)
+
+def render_spatiotemporal_video(df: pd.DataFrame, fps: int, frames_per_transition: int, cmap: str, output_path: str, boundary_path: str = 'static/data/export.geojson', neighbors: int | None = None, progress: Callable[[int, int], None] | None = None, spatial: str = 'rbf', temporal: str = 'cubic', fragmented: bool = False, quality: str = 'full') -> int:
+    """Generates a spatiotemporally interpolated video from measurement data.
+
+    The MP4 is written to ``output_path`` and the number of frames is
+    returned. ``progress(frames_done, total_frames)`` is called after each
+    encoded frame; an exception raised from it aborts the render.
+    ``spatial``/``temporal`` pick the interpolation methods (see
+    ``utils.animation_engine``); ``neighbors`` limits RBF, IDW and GP fits
+    to that many nearest stations. ``fragmented`` writes a fragmented MP4
+    that can be played while it is still being rendered. ``quality='preview'``
+    renders a fast low-resolution draft.
+    """
+    spatial_options = {'neighbors': neighbors} if spatial in ('rbf', 'idw', 'gp') else {}
+    return render_animation(
+        df, output_path,
+        fps=fps,
+        frames_per_transition=frames_per_transition,
+        cmap=cmap,
+        spatial=spatial,
+        temporal=temporal,
+        boundary_path=boundary_path,
+        spatial_options=spatial_options,
+        progress=progress,
+        fragmented=fragmented,
+        quality=quality,
+    )
@@ -0,0 +1,275 @@
+"""Bounded background job queue for animation rendering.
+
+``/api/animate`` enqueues a render here and returns immediately. Jobs run on
+the shared render executor under the ``animation`` quota (the heavy lifting
+is numpy and the ffmpeg subprocess, both of which release the GIL), report
+per-frame progress, can be cancelled, and leave their MP4 in a result
+directory until they expire. A render
+submitted under the key of a job that is still queued or running joins that
+job instead of starting another one.
+
+Jobs live in the worker that runs them. With several workers a snapshot
+of each job is kept in ``ANIMATION_JOB_DIR`` as ``<job id>.json``, so any
+worker can report its status, serve its result and cancel it (through a
+``<job id>.cancel`` marker the owning worker checks between frames).
+"""
+
+import asyncio
+import json
+import logging
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from typing import Callable
+
+from utils.admission import render_executor
+from utils.metrics import COALESCED_REQUESTS
+
+# Concurrent renders; at least one render executor slot is left to heatmaps and legends.
+ANIMATION_WORKERS = int(os.getenv("ANIMATION_WORKERS", str(min(2, max(1, render_executor.workers - 1)))))
+ANIMATION_QUEUE_DEPTH = int(os.getenv("ANIMATION_QUEUE_DEPTH", "8"))
+# Finished jobs (and their files) are kept this long for retrieval.
+ANIMATION_RESULT_TTL = int(os.getenv("ANIMATION_RESULT_TTL", "3600"))
+ANIMATION_JOB_DIR = os.getenv("ANIMATION_JOB_DIR", os.path.join("data", "animation_jobs"))
+# Minimum seconds between snapshots of a running job's progress.
+_PUBLISH_INTERVAL = 0.5
+_JOB_ID = re.compile(r"[0-9a-f]{32}")
+
+QUEUED, RUNNING, DONE, FAILED, CANCELLED = "queued", "running", "done", "failed", "cancelled"
+FINISHED_STATES = (DONE, FAILED, CANCELLED)
+
+
+class QueueFullError(RuntimeError):
+    """Raised when the number of pending/running jobs reached the limit."""
+
+
+class JobCancelled(Exception):
+    """Raised inside a render when its job has been cancelled."""
+
+
+class AnimationJob:
+    def __init__(self, job_id: str, label: str, key: str | None = None):
+        self.id = job_id
+        self.label = label
+        self.key = key
+        self.status = QUEUED
+        self.created_at = time.time()
+        self.started_at: float | None = None
+        self.finished_at: float | None = None
+        self.frames_done = 0
+        self.total_frames = 0
+        self.error: str | None = None
+        self.result_path: str | None = None
+        # File the renderer is writing while the job runs.
+        self.output_path: str | None = None
+        self.future = None
+        self.published_at = 0.0
+        self._cancel = threading.Event()
+
+    def report_progress(self, frames_done: int, total_frames: int) -> None:
+        """Progress callback handed to the renderer; also the cancellation point."""
+        self.frames_done = frames_done
+        self.total_frames = total_frames
+        if self._cancel.is_set():
+            raise JobCancelled()
+
+    def to_dict(self) -> dict:
+        percent = 100.0 * self.frames_done / self.total_frames if self.total_frames else 0.0
+        eta = None
+        if self.status == RUNNING and self.frames_done and self.started_at:
+            elapsed = time.time() - self.started_at
+            eta = round(elapsed / self.frames_done * (self.total_frames - self.frames_done), 1)
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "frames_done": self.frames_done,
+            "total_frames": self.total_frames,
+            "percent": round(percent, 1),
+            "eta_seconds": eta,
+            "error": self.error,
+        }
+
+    def snapshot(self) -> dict:
+        """State shared with the other workers (see ``from_snapshot``)."""
+        return {"label": self.label, "key": self.key, "created_at": self.created_at,
+                "started_at": self.started_at, "finished_at": self.finished_at,
+                "result_path": self.result_path, "output_path": self.output_path, **self.to_dict()}
+
+    @classmethod
+    def from_snapshot(cls, data: dict) -> "AnimationJob":
+        """A read-only copy of a job owned by another worker."""
+        job = cls(data["job_id"], data["label"], data["key"])
+        for name in ("status", "created_at", "started_at", "finished_at", "frames_done", "total_frames",
+                     "error", "result_path", "output_path"):
+            setattr(job, name, data[name])
+        return job
+
+
+class AnimationJobQueue:
+    def __init__(self, max_workers: int = ANIMATION_WORKERS, max_queue: int = ANIMATION_QUEUE_DEPTH,
+                 result_ttl: int = ANIMATION_RESULT_TTL, state_dir: str = ANIMATION_JOB_DIR):
+        self.max_queue = max_queue
+        self.result_ttl = result_ttl
+        self.state_dir = state_dir
+        # Jobs beyond max_workers wait for a slot; the queue depth above already bounds them.
+        render_executor.register("animation", concurrency=max_workers, queue=max_queue, timeout=None)
+        self._jobs: dict[str, AnimationJob] = {}
+        self._lock = threading.Lock()
+        self._result_dir: str | None = None
+
+    @property
+    def result_dir(self) -> str:
+        if self._result_dir is None:
+            self._result_dir = tempfile.mkdtemp(prefix="trendmapp-animations-")
+        return self._result_dir
+
+    def depth(self) -> int:
+        """Number of jobs queued or running."""
+        return sum(1 for job in self._jobs.values() if job.status in (QUEUED, RUNNING))
+
+    def submit(self, render: Callable[[str, Callable[[int, int], None]], str | None], label: str = "",
+               key: str | None = None) -> AnimationJob:
+        """Queue ``render(output_path, progress)`` and return its job.
+
+        Must be called from the event loop.
+
+        ``render`` must write the MP4 to ``output_path`` and call
+        ``progress(frames_done, total_frames)`` as frames are encoded. It may
+        move the file elsewhere (e.g. into the animation cache) and return the
+        new path. If a queued or running job was submitted with the same
+        ``key``, that job is returned and ``render`` is not queued.
+        """
+        self._expire()
+        with self._lock:
+            if key is not None:
+                for job in self._jobs.values():
+                    if job.key == key and job.status in (QUEUED, RUNNING):
+                        COALESCED_REQUESTS.inc(("animation",))
+                        return job
+            if self.depth() >= self.max_queue:
+                raise QueueFullError(f"Animation queue is full ({self.max_queue} jobs).")
+            job = AnimationJob(uuid.uuid4().hex, label, key)
+            self._jobs[job.id] = job
+        self._publish(job)
+        job.future = asyncio.ensure_future(render_executor.run("animation", self._run, job, render))
+        return job
+
+    def get(self, job_id: str) -> AnimationJob | None:
+        """A job of this worker, or a snapshot of one owned by another worker."""
+        job = self._jobs.get(job_id)
+        if job is None and _JOB_ID.fullmatch(job_id):
+            try:
+                with open(self._state_path(job_id)) as f:
+                    job = AnimationJob.from_snapshot(json.load(f))
+            except (FileNotFoundError, ValueError):  # unknown, expired or being replaced
+                return None
+        return job
+
+    def cancel(self, job_id: str) -> AnimationJob | None:
+        job = self._jobs.get(job_id)
+        if job is None:
+            job = self.get(job_id)
+            if job is not None and job.status not in FINISHED_STATES:
+                # Owned by another worker, which picks the marker up.
+                open(self._state_path(job_id, ".cancel"), "w").close()
+            return job
+        if job.status in FINISHED_STATES:
+            return job
+        job._cancel.set()
+        if job.status == QUEUED and job.future is not None and job.future.cancel():
+            # Still waiting for a slot: finish it here since _run will not.
+            job.status = CANCELLED
+            job.finished_at = time.time()
+            self._publish(job)
+        return job
+
+    def _run(self, job: AnimationJob, render) -> None:
+        if job._cancel.is_set() or self._cancel_requested(job):
+            job.status = CANCELLED
+            job.finished_at = time.time()
+            self._publish(job)
+            return
+        job.status = RUNNING
+        job.started_at = time.time()
+        path = os.path.join(self.result_dir, f"{job.id}.mp4")
+        job.output_path = path
+        self._publish(job)
+
+        def progress(frames_done: int, total_frames: int) -> None:
+            if time.time() - job.published_at >= _PUBLISH_INTERVAL:
+                self._publish(job)
+                if self._cancel_requested(job):
+                    job._cancel.set()
+            job.report_progress(frames_done, total_frames)
+
+        try:
+            job.result_path = render(path, progress) or path
+            job.status = DONE
+        except JobCancelled:
+            job.status = CANCELLED
+        except Exception as e:
+            logging.error(f"Animation job {job.id} failed: {e}", exc_info=True)
+            job.error = str(e) if isinstance(e, ValueError) else "Animation rendering failed."
+            job.status = FAILED
+        finally:
+            job.finished_at = time.time()
+            if job.status != DONE and os.path.exists(path):
+                os.remove(path)
+            self._publish(job)
+
+    # -- snapshots ----------------------------------------------------------
+
+    def _state_path(self, job_id: str, suffix: str = ".json") -> str:
+        return os.path.join(self.state_dir, job_id + suffix)
+
+    def _publish(self, job: AnimationJob) -> None:
+        job.published_at = time.time()
+        try:
+            os.makedirs(self.state_dir, exist_ok=True)
+            tmp = self._state_path(job.id, f".{threading.get_ident()}.tmp")
+            with open(tmp, "w") as f:
+                json.dump(job.snapshot(), f)
+            os.replace(tmp, self._state_path(job.id))
+        except OSError as e:
+            logging.warning(f"Could not publish animation job {job.id}: {e}")
+
+    def _cancel_requested(self, job: AnimationJob) -> bool:
+        return os.path.exists(self._state_path(job.id, ".cancel"))
+
+    def _forget(self, job: AnimationJob) -> None:
+        for suffix in (".json", ".cancel"):
+            try:
+                os.remove(self._state_path(job.id, suffix))
+            except FileNotFoundError:
+                pass
+
+    def _expire(self) -> None:
+        """Forget finished jobs older than the TTL and delete their files."""
+        cutoff = time.time() - self.result_ttl
+        with self._lock:
+            expired = [job for job in self._jobs.values()
+                       if job.status in FINISHED_STATES and job.finished_at and job.finished_at < cutoff]
+            for job in expired:
+                del self._jobs[job.id]
+        for job in expired:
+            self._forget(job)
+            # Only delete files the queue owns; moved results (the animation
+            # cache) are managed by their new owner.
+            if job.result_path and os.path.dirname(job.result_path) == self._result_dir \
+                    and os.path.exists(job.result_path):
+                os.remove(job.result_path)
+
+    def shutdown(self) -> None:
+        # Queued jobs are dropped; running ones stop at their next progress report.
+        for job in list(self._jobs.values()):
+            self.cancel(job.id)
+            self._forget(job)
+        if self._result_dir:
+            shutil.rmtree(self._result_dir, ignore_errors=True)
+
+
+animation_jobs = AnimationJobQueue()
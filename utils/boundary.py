@@ -0,0 +1,49 @@
+"""Boundary polygons read from GeoJSON, cached per file version.
+
+Parsing the GeoJSON and building the shapely geometry is repeated by every
+heatmap and animation request, so geometries are memoized by path, mtime
+and size; replacing the file invalidates its entry. Shapely geometries are
+immutable, so callers can share them.
+"""
+
+import json
+import os
+from functools import lru_cache
+
+DEFAULT_BOUNDARY_PATH = "static/data/export.geojson"
+
+
+@lru_cache(maxsize=16)
+def _read_geometry(path: str, mtime_ns: int, size: int):
+    from shapely.geometry import shape
+
+    with open(path, 'r', encoding='utf-8') as f:
+        gj = json.load(f)
+    if gj.get('type') == 'FeatureCollection':
+        geom_obj = gj['features'][0]['geometry']
+    elif gj.get('type') == 'Feature':
+        geom_obj = gj['geometry']
+    else:
+        geom_obj = gj
+    return shape(geom_obj)
+
+
+def read_boundary(path: str):
+    """Shapely geometry of a GeoJSON FeatureCollection, Feature or bare geometry file."""
+    st = os.stat(path)
+    return _read_geometry(os.path.abspath(path), st.st_mtime_ns, st.st_size)
+
+
+def boundary_file(boundary_path: str = DEFAULT_BOUNDARY_PATH) -> str:
+    """Filesystem path of a boundary path as sent by the UI.
+
+    A leading slash means "relative to the project root".
+    """
+    if boundary_path.startswith('/') or boundary_path.startswith('\\'):
+        boundary_path = boundary_path.lstrip('/\\')
+    return boundary_path
+
+
+def load_boundary(boundary_path: str = DEFAULT_BOUNDARY_PATH):
+    """Like ``read_boundary`` for paths as sent by the UI (see ``boundary_file``)."""
+    return read_boundary(boundary_file(boundary_path))
@@ -0,0 +1,141 @@
+"""Response compression: negotiated gzip/brotli and precompressed static files.
+
+Dynamic responses (the JSON of ``/upload``, ``/generate-heatmap``,
+``/api/table`` ...) are compressed in ``after_request`` when the client
+accepts it and the body is at least ``COMPRESS_MIN_BYTES``. Brotli is
+preferred when the ``brotli`` package is installed, gzip otherwise.
+
+Static files are not compressed per request. ``python -m utils.compression
+static`` writes ``.br``/``.gz`` siblings once at build time (at maximum
+levels), and ``send_static`` serves the best variant the client accepts,
+with an ETag and ``Cache-Control``. A variant older than its source is
+ignored, so a replaced file is never answered with stale bytes.
+"""
+
+import argparse
+import gzip
+import logging
+import os
+
+try:
+    import brotli
+except ImportError:  # gzip only
+    brotli = None
+
+COMPRESS_MIN_BYTES = int(os.getenv("COMPRESS_MIN_BYTES", "1024"))
+# Levels for per-request compression; build-time variants use the maximum.
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", "6"))
+BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", "5"))
+
+COMPRESSIBLE_TYPES = ("text/", "application/json", "application/geo+json", "application/javascript",
+                      "image/svg+xml")
+COMPRESSIBLE_SUFFIXES = (".css", ".geojson", ".html", ".js", ".json", ".svg", ".txt")
+# Content-Encoding -> suffix of the precompressed variant, in server preference order.
+VARIANT_SUFFIXES = {"br": ".br", "gzip": ".gz"}
+
+
+def available_encodings() -> tuple[str, ...]:
+    return ("br", "gzip") if brotli is not None else ("gzip",)
+
+
+def negotiate(accept_encoding: str | None, offered) -> str | None:
+    """The offered encoding the ``Accept-Encoding`` header ranks highest, or None.
+
+    Ties go to the order of ``offered``; ``q=0`` excludes an encoding.
+    """
+    if not accept_encoding:
+        return None
+    weights: dict[str, float] = {}
+    for item in accept_encoding.split(","):
+        name, _, params = item.strip().partition(";")
+        q = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        weights[name.strip().lower()] = q
+    best, best_q = None, 0.0
+    for encoding in offered:
+        q = weights.get(encoding, weights.get("*", 0.0))
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+def compress(data: bytes, encoding: str, best: bool = False) -> bytes:
+    """``data`` encoded as ``encoding``; ``best`` trades time for size (build time)."""
+    if encoding == "br":
+        return brotli.compress(data, quality=11 if best else BROTLI_QUALITY)
+    return gzip.compress(data, compresslevel=9 if best else GZIP_LEVEL, mtime=0)
+
+
+def is_compressible(mimetype: str | None) -> bool:
+    return bool(mimetype) and mimetype.startswith(COMPRESSIBLE_TYPES)
+
+
+# ---------------------------------------------------------------------------
+# Precompressed variants
+# ---------------------------------------------------------------------------
+
+def precompress_file(path: str, best: bool = True) -> list[str]:
+    """Write the ``.br``/``.gz`` variants of ``path`` that are missing or stale.
+
+    Variants that would not be smaller than the file are not kept. Returns
+    the paths written.
+    """
+    if not path.endswith(COMPRESSIBLE_SUFFIXES) or os.path.getsize(path) < COMPRESS_MIN_BYTES:
+        return []
+    with open(path, "rb") as f:
+        data = f.read()
+    written = []
+    for encoding in available_encodings():
+        variant = path + VARIANT_SUFFIXES[encoding]
+        if _is_fresh(variant, path):
+            continue
+        body = compress(data, encoding, best=best)
+        if len(body) >= len(data):
+            continue
+        tmp = f"{variant}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(body)
+        os.replace(tmp, variant)
+        written.append(variant)
+    return written
+
+
+def variant_for(path: str, accept_encoding: str | None) -> tuple[str, str | None]:
+    """(file to send, Content-Encoding) for ``path`` and the client's ``Accept-Encoding``."""
+    fresh = [encoding for encoding, suffix in VARIANT_SUFFIXES.items() if _is_fresh(path + suffix, path)]
+    encoding = negotiate(accept_encoding, fresh)
+    if encoding is None:
+        return path, None
+    return path + VARIANT_SUFFIXES[encoding], encoding
+
+
+def _is_fresh(variant: str, source: str) -> bool:
+    try:
+        return os.stat(variant).st_mtime_ns >= os.stat(source).st_mtime_ns
+    except FileNotFoundError:
+        return False
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write .br/.gz variants of static files.")
+    parser.add_argument("roots", nargs="+", help="Directories (or files) to precompress.")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    if brotli is None:
+        logging.warning("brotli is not installed; writing .gz variants only")
+    for root in args.roots:
+        paths = [root] if os.path.isfile(root) else (
+            os.path.join(folder, name) for folder, _, names in os.walk(root) for name in names)
+        for path in paths:
+            for variant in precompress_file(path):
+                logging.info(f"{variant}: {os.path.getsize(path)} -> {os.path.getsize(variant)} bytes")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+"""Figure-free frame rendering and streaming MP4 encoding for animations.
+
+Frames are produced as ``uint8`` RGB arrays: a scalar field is gathered onto
+the output pixel grid with precomputed indices, mapped through a 256-entry
+colormap lookup table and masked to the boundary polygon with a mask that is
+computed once per animation. Frames are handed to an ffmpeg writer as they
+are produced, so memory use does not depend on the number of frames.
+"""
+
+import os
+import tempfile
+from functools import lru_cache
+from typing import Iterable
+
+import numpy as np
+import shapely
+
+LUT_SIZE = 256
+DEFAULT_FRAME_WIDTH = 600
+BACKGROUND_RGB = (255, 255, 255)
+# x264 preset: encoding, not rendering, dominates once frames are arrays.
+FFMPEG_PRESET = "veryfast"
+# Fragmented MP4: the header goes first and every keyframe starts a
+# self-contained fragment, so a player can start on a file still being written.
+FRAGMENTED_MOVFLAGS = "frag_keyframe+empty_moov+default_base_moof"
+
+
+@lru_cache(maxsize=32)
+def colormap_lut(name: str) -> np.ndarray:
+    """(256, 3) uint8 RGB table for a matplotlib colormap name."""
+    import matplotlib
+
+    try:
+        cmap = matplotlib.colormaps[name]
+    except KeyError:
+        raise ValueError(f"Unknown colormap: {name}")
+    rgba = cmap(np.linspace(0.0, 1.0, LUT_SIZE))
+    lut = np.round(rgba[:, :3] * 255).astype(np.uint8)
+    lut.setflags(write=False)
+    return lut
+
+
+def _even(n: int) -> int:
+    # yuv420p needs even frame dimensions
+    return max(2, n + (n % 2))
+
+
+def _frame_size(bounds, width: int) -> tuple[int, int]:
+    min_lon, min_lat, max_lon, max_lat = bounds
+    aspect = (max_lon - min_lon) / (max_lat - min_lat)
+    width = _even(int(width))
+    return width, _even(int(round(width / aspect)))
+
+
+def _pixel_centres(bounds, width: int, height: int) -> tuple[np.ndarray, np.ndarray]:
+    """Pixel centres in map coordinates (row 0 is the northern edge)."""
+    min_lon, min_lat, max_lon, max_lat = bounds
+    xs = min_lon + (np.arange(width) + 0.5) * (max_lon - min_lon) / width
+    ys = max_lat - (np.arange(height) + 0.5) * (max_lat - min_lat) / height
+    return xs, ys
+
+
+def boundary_mask(boundary, bounds, width: int = DEFAULT_FRAME_WIDTH) -> np.ndarray:
+    """(height, width) bool array: which output pixels lie inside ``boundary``."""
+    xs, ys = _pixel_centres(bounds, *_frame_size(bounds, width))
+    lon_px, lat_px = np.meshgrid(xs, ys)
+    # Preparing builds the spatial index; unprepared point-in-polygon tests
+    # against the ~6k-vertex lagoon outline are orders of magnitude slower.
+    shapely.prepare(boundary)
+    return shapely.contains_xy(boundary, lon_px, lat_px)
+
+
+class FrameRenderer:
+    """Turns scalar fields on an (nx, ny) lon/lat grid into masked RGB frames.
+
+    ``field[i, j]`` is the value at ``(lon_i, lat_j)``, i.e. the layout produced
+    by ``np.mgrid[min_lon:max_lon:nx*1j, min_lat:max_lat:ny*1j]``. The output
+    keeps the geographic aspect ratio of ``bounds`` with north up. ``mask``
+    is ``boundary_mask(boundary, bounds, width)``, if already computed.
+    """
+
+    def __init__(self, boundary, bounds, grid_shape, cmap: str, vmin: float, vmax: float,
+                 width: int = DEFAULT_FRAME_WIDTH, background=BACKGROUND_RGB, mask: np.ndarray | None = None):
+        min_lon, min_lat, max_lon, max_lat = bounds
+        nx, ny = grid_shape
+        self.width, self.height = _frame_size(bounds, width)
+        xs, ys = _pixel_centres(bounds, self.width, self.height)
+
+        ix = np.clip(np.rint((xs - min_lon) / (max_lon - min_lon) * (nx - 1)), 0, nx - 1).astype(np.intp)
+        iy = np.clip(np.rint((ys - min_lat) / (max_lat - min_lat) * (ny - 1)), 0, ny - 1).astype(np.intp)
+        # Flat index into field.ravel() for every output pixel.
+        self._gather = (ix[np.newaxis, :] * ny + iy[:, np.newaxis]).ravel()
+        self.grid_shape = (nx, ny)
+
+        self.mask = boundary_mask(boundary, bounds, width) if mask is None else mask
+        self._outside = np.flatnonzero(~self.mask)
+
+        # Entry LUT_SIZE is the background colour, so masking is just an index
+        # write and the colour lookup is a single take().
+        self.lut = np.vstack([colormap_lut(cmap), np.asarray(background, dtype=np.uint8)])
+        self.vmin = float(vmin)
+        span = float(vmax) - self.vmin
+        self._scale = (LUT_SIZE - 1) / span if span > 0 else 0.0
+
+        # Reused per-frame buffers.
+        self._values = np.empty(self._gather.size, dtype=np.float32)
+        self._indices = np.empty(self._gather.size, dtype=np.uint16)
+
+    # Arrays and scalars render() depends on; see state()/from_state().
+    _STATE_ARRAYS = ("_gather", "_outside", "lut")
+    _STATE_SCALARS = ("width", "height", "grid_shape", "vmin", "_scale")
+
+    def state(self) -> tuple[dict, dict]:
+        """(arrays, scalars) needed to rebuild an equivalent renderer elsewhere."""
+        return ({name: getattr(self, name) for name in self._STATE_ARRAYS},
+                {name: getattr(self, name) for name in self._STATE_SCALARS})
+
+    @classmethod
+    def from_state(cls, arrays: dict, scalars: dict) -> "FrameRenderer":
+        """Rebuild a renderer from ``state()`` output (arrays may be shared views)."""
+        self = cls.__new__(cls)
+        for name, value in {**arrays, **scalars}.items():
+            setattr(self, name, value)
+        self.mask = None
+        self._values = np.empty(self._gather.size, dtype=np.float32)
+        self._indices = np.empty(self._gather.size, dtype=np.uint16)
+        return self
+
+    def render(self, field: np.ndarray, out: np.ndarray | None = None) -> np.ndarray:
+        """Render ``field`` into ``out`` (or a new (height, width, 3) uint8 array)."""
+        flat = np.asarray(field).reshape(-1)
+        np.take(flat, self._gather, out=self._values)
+        np.subtract(self._values, self.vmin, out=self._values)
+        np.multiply(self._values, self._scale, out=self._values)
+        np.nan_to_num(self._values, copy=False, nan=0.0)
+        np.clip(self._values, 0, LUT_SIZE - 1, out=self._values)
+        np.rint(self._values, out=self._values)
+        self._indices[...] = self._values
+        self._indices[self._outside] = LUT_SIZE
+        rgb = np.empty((self.height, self.width, 3), dtype=np.uint8) if out is None else out
+        np.take(self.lut, self._indices, axis=0, out=rgb.reshape(-1, 3))
+        return rgb
+
+
+def encode_video_to_file(frames: Iterable[np.ndarray], fps: int, path: str, ffmpeg_params=None,
+                         fragmented: bool = False) -> int:
+    """Stream ``frames`` into an H.264 MP4 at ``path``; returns the frame count.
+
+    With ``fragmented=True`` the MP4 is written as one-second fragments while
+    frames arrive, so it can be played back progressively before it is done.
+    """
+    import imageio
+
+    ffmpeg_params = list(ffmpeg_params or [])
+    if fragmented:
+        ffmpeg_params += ["-movflags", FRAGMENTED_MOVFLAGS, "-g", str(max(1, int(fps)))]
+    count = 0
+    writer = imageio.get_writer(
+        path,
+        format="FFMPEG",
+        mode="I",
+        fps=fps,
+        codec="libx264",
+        pixelformat="yuv420p",
+        macro_block_size=2,
+        ffmpeg_params=["-preset", FFMPEG_PRESET] + ffmpeg_params,
+    )
+    try:
+        for frame in frames:
+            writer.append_data(frame)
+            count += 1
+    finally:
+        writer.close()
+    return count
+
+
+def encode_video(frames: Iterable[np.ndarray], fps: int) -> bytes:
+    """Stream ``frames`` through ffmpeg and return the finished MP4 bytes."""
+    fd, path = tempfile.mkstemp(suffix=".mp4")
+    os.close(fd)
+    try:
+        encode_video_to_file(frames, fps, path)
+        with open(path, "rb") as f:
+            return f.read()
+    finally:
+        os.remove(path)
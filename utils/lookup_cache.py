@@ -0,0 +1,53 @@
+"""In-process read-through cache for small lookup endpoints.
+
+Entries are tagged with the data version they were loaded at: the
+database's row version (``sync_state``), which every write bumps inside its
+transaction. Because the version lives in the database, a write through
+any worker makes the entries of every worker stale, and ETags built from
+it mean the same thing on every worker. Versions restart when the database
+is recreated, so they are paired with the database's random identity
+(``sync_state.identity``); an old ETag never matches the new database. A
+request costs one primary-key read of the version; a client that already
+holds the current version gets a 304 without running the lookup query.
+"""
+
+import asyncio
+from typing import Any, Awaitable, Callable
+
+
+class VersionedCache:
+    """Maps keys to values that are valid for a single data version."""
+
+    def __init__(self) -> None:
+        self._entries: dict[str, tuple[str, int, Any]] = {}
+        self._locks: dict[str, asyncio.Lock] = {}
+
+    def etag(self, key: str, identity: str, version: int) -> str:
+        """Unquoted entity tag for ``key`` at data version ``version`` of database ``identity``."""
+        return f"{key}-{identity}-{version}"
+
+    async def get_or_load(self, key: str, identity: str, version: int,
+                          loader: Callable[[], Awaitable[Any]]) -> Any:
+        """Return the value for ``key`` at ``version``, running ``loader`` on a miss.
+
+        ``version`` must be read before ``loader`` runs, so a value is never
+        older than the version it is stored under. Concurrent misses for the
+        same key share a single load.
+        """
+        entry = self._entries.get(key)
+        if entry is not None and entry[:2] == (identity, version):
+            return entry[2]
+
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        async with lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[:2] == (identity, version):
+                return entry[2]
+            value = await loader()
+            # A concurrent request may already have stored a newer version.
+            if entry is None or entry[0] != identity or entry[1] < version:
+                self._entries[key] = (identity, version, value)
+            return value
+
+
+lookup_cache = VersionedCache()
@@ -0,0 +1,88 @@
+"""Set-based analytic reads over the Station/Parameter/Measurement tables.
+
+Both the pivot behind ``/api/table`` and the parameter/date range scans used
+for animation run as a single SQL statement whose result is materialized
+column-wise into a DataFrame (``pandas.read_sql_query`` on the session's
+connection) instead of being walked row by row through the ORM. The same code
+runs on Postgres and on the embedded SQLite backend.
+"""
+
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+from sqlalchemy import String, cast, func, select
+
+from db import BACKEND, Measurement, Parameter, Station
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+
+def _iso_day(column):
+    """SQL expression rendering a DATE column as 'YYYY-MM-DD'."""
+    if BACKEND == "sqlite":
+        # SQLite stores SQLAlchemy Date values as ISO text already.
+        return cast(column, String)
+    return func.to_char(column, "YYYY-MM-DD")
+
+
+async def read_frame(session, stmt) -> pd.DataFrame:
+    """Execute ``stmt`` and build a DataFrame directly from the cursor."""
+    import pandas as pd
+
+    return await session.run_sync(lambda sync_session: pd.read_sql_query(stmt, sync_session.connection()))
+
+
+async def fetch_table_pivot(session) -> pd.DataFrame:
+    """Wide station x '<parameter>_<date>' table used by the data-entry grid."""
+    stmt = (
+        select(
+            Station.id.label("station_id"),
+            Station.latitude.label("latitude"),
+            Station.longitude.label("longitude"),
+            (Parameter.name + "_" + _iso_day(Measurement.sampled_at)).label("param_date"),
+            Measurement.value.label("value"),
+        )
+        .select_from(Station)
+        .join(Measurement, Measurement.station_id == Station.id)
+        .join(Parameter, Parameter.id == Measurement.parameter_id)
+    )
+    df = await read_frame(session, stmt)
+    if df.empty:
+        return df
+    # (station, parameter, date) is unique, so a plain pivot needs no aggregation.
+    pivot_df = df.pivot(index=["station_id", "latitude", "longitude"], columns="param_date", values="value")
+    pivot_df.columns.name = None
+    return pivot_df.reset_index()
+
+
+async def fetch_measurement_range(session, parameter: str, start, end) -> pd.DataFrame:
+    """Non-null measurements of ``parameter`` sampled within [start, end].
+
+    Returns columns ``latitude``, ``longitude``, ``sampled_at`` (datetime64)
+    and ``value``, ordered by date.
+    """
+    import pandas as pd
+
+    stmt = (
+        select(
+            Station.latitude.label("latitude"),
+            Station.longitude.label("longitude"),
+            Measurement.sampled_at.label("sampled_at"),
+            Measurement.value.label("value"),
+        )
+        .select_from(Measurement)
+        .join(Station, Station.id == Measurement.station_id)
+        .join(Parameter, Parameter.id == Measurement.parameter_id)
+        .where(
+            Parameter.name == parameter,
+            Measurement.sampled_at >= start,
+            Measurement.sampled_at <= end,
+            Measurement.value.isnot(None),
+        )
+        .order_by(Measurement.sampled_at)
+    )
+    df = await read_frame(session, stmt)
+    df["sampled_at"] = pd.to_datetime(df["sampled_at"])
+    return df
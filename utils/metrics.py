@@ -0,0 +1,204 @@
+"""Per-stage timings, ``Server-Timing`` headers and Prometheus-style metrics.
+
+Handlers wrap their phases in ``stage("heatmap.interpolate")`` or mark
+consecutive phases with ``StageClock.lap``. Each stage
+is added to the current request's timings, which ``after_request`` turns
+into a ``Server-Timing`` header. Every observation also lands in
+process-wide histograms that ``/metrics`` renders in the Prometheus text
+format. Work outside a request (background animation jobs) updates only
+the histograms.
+
+Like the DB query counter, the per-request timings live in a mutable cell
+in a ContextVar, so stages timed from SQLAlchemy's greenlets or
+``asyncio.to_thread`` workers (which copy the context) still reach the
+request that started them.
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# Histogram bucket upper bounds, in seconds.
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_timings: ContextVar[dict[str, float] | None] = ContextVar("stage_timings", default=None)
+
+
+class Histogram:
+    """Cumulative-bucket histogram keyed by a tuple of label values."""
+
+    def __init__(self, name: str, help_text: str, label_names: tuple[str, ...]):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self._series: dict[tuple, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, labels: tuple, seconds: float) -> None:
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * len(BUCKETS), 0, 0.0]
+            buckets = series[0]
+            for i, bound in enumerate(BUCKETS):
+                if seconds <= bound:
+                    buckets[i] += 1
+            series[1] += 1
+            series[2] += seconds
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted((labels, [list(s[0]), s[1], s[2]]) for labels, s in self._series.items())
+        for labels, (buckets, count, total) in items:
+            base = ",".join(f'{name}="{_escape(value)}"' for name, value in zip(self.label_names, labels))
+            sep = "," if base else ""
+            for bound, n in zip(BUCKETS, buckets):
+                lines.append(f'{self.name}_bucket{{{base}{sep}le="{bound}"}} {n}')
+            lines.append(f'{self.name}_bucket{{{base}{sep}le="+Inf"}} {count}')
+            lines.append(f"{self.name}_sum{{{base}}} {total:.6f}")
+            lines.append(f"{self.name}_count{{{base}}} {count}")
+        return lines
+
+
+class Counter:
+    """Monotonic counter keyed by a tuple of label values."""
+
+    metric_type = "counter"
+
+    def __init__(self, name: str, help_text: str, label_names: tuple[str, ...]):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self._values: dict[tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, labels: tuple, amount: float = 1) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.metric_type}"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for labels, value in items:
+            base = ",".join(f'{name}="{_escape(label)}"' for name, label in zip(self.label_names, labels))
+            lines.append(f"{self.name}{{{base}}} {value:g}")
+        return lines
+
+
+class Gauge(Counter):
+    """Current value keyed by a tuple of label values."""
+
+    metric_type = "gauge"
+
+    def set(self, labels: tuple, value: float) -> None:
+        with self._lock:
+            self._values[labels] = value
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+STAGE_SECONDS = Histogram("trendmapp_stage_seconds", "Time spent in a processing stage.", ("stage",))
+REQUEST_SECONDS = Histogram("trendmapp_request_seconds", "Request handling time.",
+                            ("method", "endpoint", "status"))
+COALESCED_REQUESTS = Counter("trendmapp_coalesced_requests_total",
+                             "Requests served by joining an identical in-flight computation.", ("kind",))
+RENDER_ACTIVE = Gauge("trendmapp_render_active", "Renders running on the shared render executor.", ("kind",))
+RENDER_QUEUED = Gauge("trendmapp_render_queued", "Renders waiting for a render executor slot.", ("kind",))
+RENDER_WAIT_SECONDS = Histogram("trendmapp_render_wait_seconds",
+                                "Time a render waited for a render executor slot.", ("kind",))
+RENDER_REJECTED = Counter("trendmapp_render_rejected_total",
+                          "Renders turned away with 429 (queue full or wait timed out).", ("kind", "reason"))
+COMPRESSED_BYTES = Counter("trendmapp_compressed_bytes_total",
+                           "Response bytes before (in) and after (out) compression.", ("encoding", "direction"))
+
+_ALL_METRICS = (STAGE_SECONDS, REQUEST_SECONDS, COALESCED_REQUESTS, RENDER_ACTIVE, RENDER_QUEUED,
+                RENDER_WAIT_SECONDS, RENDER_REJECTED, COMPRESSED_BYTES)
+
+
+# ---------------------------------------------------------------------------
+# Recording
+# ---------------------------------------------------------------------------
+
+def start_request_timings() -> None:
+    """Begin collecting stage timings for the current request/task."""
+    _timings.set({})
+
+
+def request_timings() -> dict[str, float]:
+    """Stage name -> seconds recorded for the current request (empty if not started)."""
+    return _timings.get() or {}
+
+
+def record_stage(name: str, seconds: float) -> None:
+    """Add ``seconds`` to stage ``name`` for this request and the global histogram."""
+    timings = _timings.get()
+    if timings is not None:
+        timings[name] = timings.get(name, 0.0) + seconds
+    STAGE_SECONDS.observe((name,), seconds)
+
+
+def merge_timings(timings: dict[str, float]) -> None:
+    """Add stages timed elsewhere (a shared computation) to this request only.
+
+    The histograms already saw them when they were recorded.
+    """
+    current = _timings.get()
+    if current is not None:
+        for name, seconds in timings.items():
+            current[name] = current.get(name, 0.0) + seconds
+
+
+@contextmanager
+def stage(name: str):
+    """Time the enclosed block as stage ``name``."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(name, time.perf_counter() - start)
+
+
+class StageClock:
+    """Times consecutive phases of a handler without nesting blocks.
+
+    ``lap(name)`` records the time since the previous lap (or since the
+    clock was created) as stage ``name``; ``reset()`` starts the next phase
+    without recording anything.
+    """
+
+    def __init__(self):
+        self._last = time.perf_counter()
+
+    def lap(self, name: str) -> None:
+        now = time.perf_counter()
+        record_stage(name, now - self._last)
+        self._last = now
+
+    def reset(self) -> None:
+        self._last = time.perf_counter()
+
+
+def observe_request(method: str, endpoint: str, status: int, seconds: float) -> None:
+    REQUEST_SECONDS.observe((method, endpoint, str(status)), seconds)
+
+
+# ---------------------------------------------------------------------------
+# Output
+# ---------------------------------------------------------------------------
+
+def server_timing_header(timings: dict[str, float], total: float | None = None) -> str:
+    """``Server-Timing`` value, durations in milliseconds."""
+    entries = [f"{name};dur={seconds * 1000:.1f}" for name, seconds in timings.items()]
+    if total is not None:
+        entries.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(entries)
+
+
+def render_metrics() -> str:
+    """All metrics in the Prometheus text exposition format."""
+    return "\n".join(line for metric in _ALL_METRICS for line in metric.render()) + "\n"
@@ -0,0 +1,234 @@
+"""Frame-parallel rendering of animations across a process pool.
+
+Once the temporal coefficients are fitted, every output frame can be
+evaluated and colormapped independently. The coefficients, the renderer's
+lookup arrays and a ring of output slots live in one shared-memory block.
+Worker processes attach to it by name and receive only a few scalars per
+task. They render chunks of consecutive frames straight into a slot. The
+parent hands the chunks to the encoder in frame order, so the output is
+byte-identical to the serial path.
+
+The block is POSIX shared memory (``/dev/shm``) when it fits there. Docker
+gives containers only 64 MB by default, and overrunning it kills the
+process with SIGBUS instead of raising, so larger blocks go to a
+memory-mapped file under ``RENDER_SPILL_DIR`` instead. Workers map the
+block only for the duration of a chunk, so nothing stays pinned in the
+pool between jobs.
+"""
+
+import math
+import os
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from multiprocessing import get_context, shared_memory
+from typing import Iterator
+
+import numpy as np
+
+from utils.frame_encoder import FrameRenderer
+from utils.temporal_interp import LazyTemporalInterpolator
+
+ANIMATION_RENDER_PROCESSES = int(os.getenv("ANIMATION_RENDER_PROCESSES", str(min(4, os.cpu_count() or 1))))
+# Frames per task; large enough to amortize dispatch, small enough to keep
+# the encoder fed early.
+RENDER_CHUNK_FRAMES = 8
+# Output slots per worker: one being rendered, one waiting for the encoder.
+SLOTS_PER_WORKER = 2
+# File-backed blocks, for jobs that do not fit in /dev/shm.
+RENDER_SPILL_DIR = os.getenv("RENDER_SPILL_DIR", os.path.join("data", "render_blocks"))
+# Share of the free /dev/shm space one block may take.
+_SHM_HEADROOM = 0.8
+
+_ALIGN = 64
+
+
+def _layout(specs: dict[str, tuple[tuple, str]]) -> tuple[dict, int]:
+    """Byte offsets for named (shape, dtype) arrays packed into one block."""
+    offsets, size = {}, 0
+    for name, (shape, dtype) in specs.items():
+        size = -(-size // _ALIGN) * _ALIGN
+        offsets[name] = (size, tuple(shape), dtype)
+        size += int(np.prod(shape)) * np.dtype(dtype).itemsize
+    return offsets, max(size, 1)
+
+
+def _views(buf, offsets: dict) -> dict[str, np.ndarray]:
+    return {name: np.ndarray(shape, dtype=dtype, buffer=buf, offset=offset)
+            for name, (offset, shape, dtype) in offsets.items()}
+
+
+def _shm_free_bytes() -> float:
+    try:
+        st = os.statvfs("/dev/shm")
+    except OSError:  # no /dev/shm (e.g. macOS): shared memory is not size-limited this way
+        return math.inf
+    return st.f_bavail * st.f_frsize
+
+
+class _Block:
+    """One job's shared block: POSIX shared memory if it fits, else a mapped file."""
+
+    def __init__(self, size: int):
+        self.shm = None
+        self.path = None
+        if size <= _shm_free_bytes() * _SHM_HEADROOM:
+            self.shm = shared_memory.SharedMemory(create=True, size=size)
+            self.buf = self.shm.buf
+            self.ref = {"shm_name": self.shm.name}
+        else:
+            os.makedirs(RENDER_SPILL_DIR, exist_ok=True)
+            fd, path = tempfile.mkstemp(suffix=".block", dir=RENDER_SPILL_DIR)
+            os.ftruncate(fd, size)
+            os.close(fd)
+            self.path = os.path.abspath(path)
+            self.buf = np.memmap(self.path, dtype=np.uint8, mode="r+", shape=(size,))
+            self.ref = {"path": self.path, "size": size}
+
+    def release(self) -> None:
+        """Free the block; every view into ``buf`` must be gone."""
+        self.buf = None
+        if self.shm is not None:
+            self.shm.close()
+            self.shm.unlink()
+        else:
+            os.remove(self.path)
+
+
+# ---------------------------------------------------------------------------
+# Worker side
+# ---------------------------------------------------------------------------
+
+@contextmanager
+def _attached(spec: dict):
+    """(temporal, renderer, slots) over the job's block, mapped for the block only."""
+    ref = spec["block"]
+    if "shm_name" in ref:
+        shm = shared_memory.SharedMemory(name=ref["shm_name"])
+        buf = shm.buf
+    else:
+        shm = None
+        buf = np.memmap(ref["path"], dtype=np.uint8, mode="r+", shape=(ref["size"],))
+    try:
+        arrays = _views(buf, spec["offsets"])
+        temporal = LazyTemporalInterpolator.from_coefficients(
+            arrays["coeffs"], spec["times"], spec["field_shape"], spec["kind"]
+        )
+        renderer = FrameRenderer.from_state(
+            {key: arrays[key] for key in FrameRenderer._STATE_ARRAYS}, spec["renderer_scalars"]
+        )
+        yield temporal, renderer, arrays["slots"]
+    finally:
+        # Views into the block must be gone before it can be closed.
+        arrays = temporal = renderer = buf = None
+        if shm is not None:
+            shm.close()
+
+
+def _render_chunk(spec: dict, slot: int, frame_times: np.ndarray) -> int:
+    """Render ``frame_times`` into output slot ``slot``; returns the frame count."""
+    with _attached(spec) as (temporal, renderer, slots):
+        field = np.empty(temporal.field_shape, dtype=np.float32)
+        for k, t in enumerate(frame_times):
+            renderer.render(temporal.frame(t, out=field), out=slots[slot, k])
+        slots = None
+    return len(frame_times)
+
+
+# ---------------------------------------------------------------------------
+# Parent side
+# ---------------------------------------------------------------------------
+
+_pools: dict[int, ProcessPoolExecutor] = {}
+# Animation jobs run on several render executor threads.
+_pools_lock = threading.Lock()
+
+
+def get_render_pool(workers: int) -> ProcessPoolExecutor:
+    """Process pool with ``workers`` processes, created on first use and reused."""
+    with _pools_lock:
+        if workers not in _pools:
+            # spawn: the caller is multithreaded (job queue, event loop), where
+            # fork is unsafe.
+            _pools[workers] = ProcessPoolExecutor(max_workers=workers, mp_context=get_context("spawn"))
+        return _pools[workers]
+
+
+def shutdown_render_pools() -> None:
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+
+def iter_rendered_frames(temporal: LazyTemporalInterpolator, renderer: FrameRenderer, total_frames: int,
+                         workers: int = ANIMATION_RENDER_PROCESSES,
+                         chunk_frames: int = RENDER_CHUNK_FRAMES) -> Iterator[np.ndarray]:
+    """Yield the ``total_frames`` rendered RGB frames in order.
+
+    With ``workers > 1`` chunks of frames are rendered in parallel worker
+    processes; otherwise (or for very short animations) frames are rendered
+    in this process. Each yielded frame is a new array in both cases.
+    """
+    times = temporal.frame_times(total_frames)
+    if workers <= 1 or total_frames < 2 * chunk_frames:
+        for t in times:
+            yield renderer.render(temporal.frame(t))
+        return
+
+    n_chunks = math.ceil(total_frames / chunk_frames)
+    n_slots = min(n_chunks, workers * SLOTS_PER_WORKER)
+    arrays, scalars = renderer.state()
+    coeffs = temporal.coefficients
+    offsets, size = _layout({
+        "coeffs": (coeffs.shape, coeffs.dtype.str),
+        **{name: (a.shape, a.dtype.str) for name, a in arrays.items()},
+        "slots": ((n_slots, chunk_frames, renderer.height, renderer.width, 3), "|u1"),
+    })
+
+    shared = _Block(size)
+    pending = {}
+    views = slots = block = None
+    try:
+        views = _views(shared.buf, offsets)
+        views["coeffs"][...] = coeffs
+        for name, a in arrays.items():
+            views[name][...] = a
+        spec = {
+            "block": shared.ref,
+            "offsets": offsets,
+            "times": temporal.times,
+            "field_shape": temporal.field_shape,
+            "kind": temporal.kind,
+            "renderer_scalars": scalars,
+        }
+        pool = get_render_pool(workers)
+        slots = views["slots"]
+        submitted = 0
+        for chunk in range(n_chunks):
+            # Keep every slot busy; slot (chunk % n_slots) is reused only
+            # after the chunk that occupied it has been yielded.
+            while submitted < n_chunks and submitted < chunk + n_slots:
+                start = submitted * chunk_frames
+                pending[submitted] = pool.submit(
+                    _render_chunk, spec, submitted % n_slots, times[start:start + chunk_frames]
+                )
+                submitted += 1
+            count = pending.pop(chunk).result()
+            block = slots[chunk % n_slots]
+            for k in range(count):
+                yield block[k].copy()
+    finally:
+        # Views into the block must be gone before it can be closed.
+        views = slots = block = None
+        for future in pending.values():
+            future.cancel()
+        for future in pending.values():
+            if not future.cancelled():
+                try:
+                    future.result()
+                except Exception:
+                    pass
+        shared.release()
@@ -0,0 +1,299 @@
+"""On-demand profiling of live requests.
+
+A ``ProfileSession`` is armed for one endpoint and captures the next N
+requests to it:
+
+- ``cpu``: a sampling profiler. A background thread reads the stack of the
+  thread serving the request every few milliseconds. Samples are kept as
+  collapsed stacks (``flamegraph.pl`` / speedscope input) and can be
+  exported as a ``pstats`` file for snakeviz or ``python -m pstats``. The
+  exported call counts are sample counts.
+- ``memory``: a tracemalloc snapshot diff around a single request. Tracing
+  is switched on just before the request and off again afterwards (unless
+  it was already running, e.g. via ``TRACEMALLOC``).
+
+Quart runs request handlers on the event-loop thread, so other requests
+that run while a captured one is in flight appear in its CPU samples too.
+Renders (heatmaps, legends, animations) run on render executor threads.
+``run_profiled`` adds such a thread to the sampler while it works for a
+captured request, so those stacks are in the profile as well.
+
+Sessions live in the worker process that armed them. With several hypercorn
+workers (``WORKERS``), a session sees only the requests routed to that
+process, and only that process can report or cancel it (others answer
+404). Profile with ``WORKERS=1``, or retry until the same worker answers;
+``pid`` in the session identifies it.
+"""
+
+import io
+import logging
+import marshal
+import os
+import sys
+import threading
+import time
+import tracemalloc
+import uuid
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+PROFILE_KINDS = ("cpu", "memory")
+DEFAULT_INTERVAL_MS = 5
+MAX_PROFILE_REQUESTS = 50
+# Finished sessions kept for download.
+MAX_FINISHED_SESSIONS = 8
+
+ARMED, CAPTURING, DONE = "armed", "capturing", "done"
+
+# (filename, first line, function name); the key layout pstats uses.
+FrameKey = tuple[str, int, str]
+
+# Session capturing the current request; set by the capture hook and copied
+# into the render executor's threads with the request context.
+current_capture: ContextVar["ProfileSession | None"] = ContextVar("profile_capture", default=None)
+
+
+class _StackSampler(threading.Thread):
+    """Counts the stacks of one thread (plus any added ones) while ``active`` is set."""
+
+    def __init__(self, thread_id: int, interval: float):
+        super().__init__(name="profile-sampler", daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.active = threading.Event()
+        self.counts: Counter[tuple[FrameKey, ...]] = Counter()
+        self._halt = threading.Event()
+        # Render threads working for a captured request -> nesting depth.
+        self._extra: Counter[int] = Counter()
+        self._extra_lock = threading.Lock()
+
+    def add_thread(self, thread_id: int) -> None:
+        with self._extra_lock:
+            self._extra[thread_id] += 1
+
+    def remove_thread(self, thread_id: int) -> None:
+        with self._extra_lock:
+            self._extra[thread_id] -= 1
+            if self._extra[thread_id] <= 0:
+                del self._extra[thread_id]
+
+    def run(self) -> None:
+        while not self._halt.wait(self.interval):
+            if not self.active.is_set():
+                continue
+            with self._extra_lock:
+                thread_ids = {self.thread_id, *self._extra}
+            frames = sys._current_frames()
+            for thread_id in thread_ids:
+                frame = frames.get(thread_id)
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append((code.co_filename, code.co_firstlineno, code.co_name))
+                    frame = frame.f_back
+                if stack:
+                    self.counts[tuple(reversed(stack))] += 1
+            del frames
+
+    def stop(self) -> None:
+        self._halt.set()
+        self.join()
+
+
+class ProfileSession:
+    def __init__(self, endpoint: str, kind: str, requests: int, interval_ms: float):
+        self.id = uuid.uuid4().hex
+        self.endpoint = endpoint
+        self.kind = kind
+        self.requests = requests
+        self.interval = interval_ms / 1000.0
+        self.status = ARMED
+        self.created_at = time.time()
+        self.started = 0
+        self.captured = 0
+        self.durations: list[float] = []
+        self.samples: Counter[tuple[FrameKey, ...]] = Counter()
+        self.memory_report: str | None = None
+        self._active = 0
+        self._sampler: _StackSampler | None = None
+        self._snapshot: tracemalloc.Snapshot | None = None
+        self._started_tracing = False
+
+    def matches(self, path: str, rule: str | None) -> bool:
+        return self.status != DONE and self.started < self.requests and self.endpoint in (path, rule)
+
+    # -- request hooks ------------------------------------------------------
+
+    def begin(self) -> float:
+        """Called before a matching request runs; returns its start time."""
+        self.started += 1
+        self.status = CAPTURING
+        if self.kind == "cpu":
+            if self._sampler is None:
+                self._sampler = _StackSampler(threading.get_ident(), self.interval)
+                self._sampler.start()
+            self._active += 1
+            self._sampler.active.set()
+        else:
+            self._started_tracing = not tracemalloc.is_tracing()
+            if self._started_tracing:
+                tracemalloc.start(25)
+            self._snapshot = tracemalloc.take_snapshot()
+        return time.perf_counter()
+
+    @contextmanager
+    def sampling_thread(self):
+        """Sample the calling thread too while the block runs (CPU sessions only)."""
+        sampler = self._sampler
+        if sampler is None:
+            yield
+            return
+        thread_id = threading.get_ident()
+        sampler.add_thread(thread_id)
+        try:
+            yield
+        finally:
+            sampler.remove_thread(thread_id)
+
+    def end(self, started_at: float) -> None:
+        """Called after a captured request has finished."""
+        if self.status == DONE:  # cancelled while the request ran
+            return
+        self.durations.append(time.perf_counter() - started_at)
+        self.captured += 1
+        if self.kind == "cpu":
+            self._active -= 1
+            if self._active == 0:
+                self._sampler.active.clear()
+        else:
+            self.memory_report = _memory_diff(self._snapshot, tracemalloc.take_snapshot())
+            self._snapshot = None
+            if self._started_tracing:
+                tracemalloc.stop()
+        if self.captured >= self.requests:
+            self.finish()
+
+    def finish(self) -> None:
+        if self._sampler is not None:
+            self._sampler.stop()
+            self.samples = self._sampler.counts
+            self._sampler = None
+        if self._snapshot is not None and self._started_tracing:
+            tracemalloc.stop()
+        self._snapshot = None
+        self.status = DONE
+
+    # -- results ------------------------------------------------------------
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "pid": os.getpid(),
+            "endpoint": self.endpoint,
+            "kind": self.kind,
+            "status": self.status,
+            "requests": self.requests,
+            "captured": self.captured,
+            "durations_ms": [round(d * 1000, 1) for d in self.durations],
+            "samples": sum(self.samples.values()),
+            "interval_ms": self.interval * 1000,
+        }
+
+    def collapsed(self) -> str:
+        """Samples in the collapsed-stack format (one ``a;b;c count`` line per stack)."""
+        lines = []
+        for stack, count in self.samples.most_common():
+            frames = ";".join(f"{name} ({filename}:{line})" for filename, line, name in stack)
+            lines.append(f"{frames} {count}")
+        return "\n".join(lines) + "\n"
+
+    def pstats_bytes(self) -> bytes:
+        """Samples as a marshalled ``pstats`` dict; times are sample counts x interval."""
+        return marshal.dumps(_samples_to_pstats(self.samples, self.interval))
+
+
+def run_profiled(fn, *args, **kwargs):
+    """Call ``fn``, sampling this thread if the request it works for is being profiled."""
+    session = current_capture.get()
+    if session is None:
+        return fn(*args, **kwargs)
+    with session.sampling_thread():
+        return fn(*args, **kwargs)
+
+
+def _samples_to_pstats(samples: Counter, interval: float) -> dict:
+    # func -> [call count, primitive calls, own time, cumulative time, callers]
+    stats: dict[FrameKey, list] = {}
+    for stack, count in samples.items():
+        seconds = count * interval
+        seen = set()
+        for depth, func in enumerate(stack):
+            entry = stats.setdefault(func, [0, 0, 0.0, 0.0, {}])
+            if func not in seen:  # recursion: count inclusive time once
+                seen.add(func)
+                entry[0] += count
+                entry[1] += count
+                entry[3] += seconds
+            if depth:
+                caller = stack[depth - 1]
+                edge = entry[4].get(caller, (0, 0, 0.0, 0.0))
+                entry[4][caller] = (edge[0] + count, edge[1] + count, edge[2], edge[3] + seconds)
+        stats[stack[-1]][2] += seconds
+    return {func: (cc, nc, tt, ct, callers) for func, (cc, nc, tt, ct, callers) in stats.items()}
+
+
+def _memory_diff(before: tracemalloc.Snapshot, after: tracemalloc.Snapshot, limit: int = 40) -> str:
+    """Text report of the allocation sites that grew the most between two snapshots."""
+    filters = [tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, __file__)]
+    before, after = before.filter_traces(filters), after.filter_traces(filters)
+    out = io.StringIO()
+    lines = after.compare_to(before, "lineno")
+    total = sum(stat.size_diff for stat in lines)
+    out.write(f"Net allocated during request: {total / 1024:.1f} KiB\n\n")
+    out.write(f"Top {limit} allocation sites by growth:\n")
+    for stat in lines[:limit]:
+        out.write(f"{stat}\n")
+    out.write(f"\nTop {min(limit, 10)} tracebacks:\n")
+    for stat in after.compare_to(before, "traceback")[:min(limit, 10)]:
+        out.write(f"\n{stat.size_diff / 1024:+.1f} KiB in {stat.count_diff:+d} blocks\n")
+        out.write("\n".join(stat.traceback.format(limit=15)) + "\n")
+    return out.getvalue()
+
+
+class ProfileRegistry:
+    """The armed session (at most one at a time) and recent finished ones."""
+
+    def __init__(self):
+        self._sessions: dict[str, ProfileSession] = {}
+        self._lock = threading.Lock()
+
+    def arm(self, endpoint: str, kind: str, requests: int, interval_ms: float) -> ProfileSession:
+        with self._lock:
+            if any(s.status != DONE for s in self._sessions.values()):
+                raise RuntimeError("A profile session is already armed; cancel it first.")
+            session = ProfileSession(endpoint, kind, requests, interval_ms)
+            self._sessions[session.id] = session
+            finished = [s for s in self._sessions.values() if s.status == DONE]
+            for old in sorted(finished, key=lambda s: s.created_at)[:-MAX_FINISHED_SESSIONS or None]:
+                del self._sessions[old.id]
+        logging.info(f"Profiling armed: {kind} x{requests} on {endpoint} ({session.id})")
+        return session
+
+    def get(self, session_id: str) -> ProfileSession | None:
+        return self._sessions.get(session_id)
+
+    def match(self, path: str, rule: str | None) -> ProfileSession | None:
+        for session in self._sessions.values():
+            if session.matches(path, rule):
+                return session
+        return None
+
+    def cancel(self, session_id: str) -> ProfileSession | None:
+        session = self._sessions.get(session_id)
+        if session is not None and session.status != DONE:
+            session.finish()
+        return session
+
+
+profile_sessions = ProfileRegistry()
@@ -0,0 +1,223 @@
+"""Memory-mapped store for datasets and grids shared by all workers.
+
+Cleaned upload frames, boundary masks and interpolated grids are written
+once as ``.npy`` files under ``SHARED_STORE_DIR``:
+``<root>/<kind>/<key>/<n>.npy`` plus a ``meta.json``. Every hypercorn
+worker of a container then opens them with ``np.load(mmap_mode="r")``. The
+kernel page cache backs all the mappings, so N workers share one copy of
+each dataset. Whichever worker needs an entry first builds it.
+
+An entry is written to a temporary directory and renamed into place. A
+reader therefore never sees a partial entry. Two workers that build the
+same key at the same time both succeed; the first rename wins. Arrays come
+back read-only. Entries are evicted oldest-first once the store grows past
+``SHARED_STORE_MAX_MB``. The size check scans the store, so it runs at most
+every ``_EVICT_INTERVAL`` seconds unless a tenth of the limit has been
+written since the last scan. A worker that still maps an evicted entry
+keeps a valid mapping. If a new entry cannot be read back (evicted at once
+by another worker, or never published), the caller gets the arrays it just
+built.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+from typing import TYPE_CHECKING, Callable
+
+import numpy as np
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+SHARED_STORE_DIR = os.getenv("SHARED_STORE_DIR", os.path.join("data", "shared_store"))
+SHARED_STORE_MAX_MB = int(os.getenv("SHARED_STORE_MAX_MB", "2048"))
+
+# Entries used more recently than this are not re-touched on every read.
+_TOUCH_INTERVAL = 60.0
+# Eviction scans run at most this often, or sooner once this share of the
+# limit has been written since the last scan.
+_EVICT_INTERVAL = 30.0
+_EVICT_WRITE_FRACTION = 0.1
+# Keys come from array_key/file_key; they may also arrive from clients.
+_KEY_PATTERN = re.compile(r"[0-9a-f]{64}")
+
+
+def array_key(*parts) -> str:
+    """SHA-256 over arrays (dtype, shape and bytes) and JSON-serializable values."""
+    digest = hashlib.sha256()
+    for part in parts:
+        if isinstance(part, np.ndarray):
+            digest.update(f"{part.dtype.str}{part.shape}".encode())
+            digest.update(np.ascontiguousarray(part).tobytes())
+        else:
+            digest.update(json.dumps(part, sort_keys=True, default=str).encode())
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def file_key(path: str) -> str:
+    """Identity of a file as seen by every worker: absolute path, mtime and size."""
+    st = os.stat(path)
+    return array_key(os.path.abspath(path), st.st_mtime_ns, st.st_size)
+
+
+class SharedStore:
+    def __init__(self, root: str = SHARED_STORE_DIR, max_bytes: int = SHARED_STORE_MAX_MB * 1024 * 1024):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._written = 0
+        self._scanned_at = float("-inf")
+        self._evict_lock = threading.Lock()
+
+    def _entry(self, kind: str, key: str) -> str:
+        if not isinstance(key, str) or not _KEY_PATTERN.fullmatch(key):
+            raise ValueError(f"Invalid shared store key: {key!r}")
+        return os.path.join(self.root, kind, key)
+
+    # -- arrays -------------------------------------------------------------
+
+    def get_arrays(self, kind: str, key: str) -> tuple[dict[str, np.ndarray], dict] | None:
+        """(name -> read-only memory-mapped array, meta) of an entry, or None."""
+        entry = self._entry(kind, key)
+        try:
+            with open(os.path.join(entry, "meta.json")) as f:
+                meta = json.load(f)
+            arrays = {name: np.load(os.path.join(entry, f"{i}.npy"), mmap_mode="r", allow_pickle=False)
+                      for i, name in enumerate(meta["arrays"])}
+            if time.time() - os.path.getmtime(entry) > _TOUCH_INTERVAL:
+                os.utime(entry)
+        except FileNotFoundError:  # not built yet, or evicted while reading
+            return None
+        return arrays, meta["meta"]
+
+    def put_arrays(self, kind: str, key: str, arrays: dict[str, np.ndarray],
+                   meta: dict | None = None) -> tuple[dict[str, np.ndarray], dict]:
+        """Publish an entry and return it memory-mapped (as ``get_arrays``).
+
+        Falls back to ``arrays`` themselves if the entry cannot be read back.
+        """
+        parent = os.path.join(self.root, kind)
+        os.makedirs(parent, exist_ok=True)
+        tmp = tempfile.mkdtemp(prefix=f".{key}.", dir=parent)
+        try:
+            for i, array in enumerate(arrays.values()):
+                np.save(os.path.join(tmp, f"{i}.npy"), np.asarray(array), allow_pickle=False)
+            with open(os.path.join(tmp, "meta.json"), "w") as f:
+                json.dump({"arrays": list(arrays), "meta": meta or {}}, f)
+            try:
+                os.rename(tmp, self._entry(kind, key))
+            except OSError:
+                # Another worker published the same key first; theirs is equivalent.
+                shutil.rmtree(tmp, ignore_errors=True)
+        except BaseException:
+            shutil.rmtree(tmp, ignore_errors=True)
+            raise
+        self._maybe_evict(keep=(kind, key), written=sum(np.asarray(a).nbytes for a in arrays.values()))
+        found = self.get_arrays(kind, key)
+        if found is None:
+            logging.warning(f"Shared store entry {kind}/{key} vanished after publishing; using it unmapped")
+            return {name: np.asarray(array) for name, array in arrays.items()}, meta or {}
+        return found
+
+    def arrays(self, kind: str, key: str,
+               build: Callable[[], dict[str, np.ndarray]]) -> dict[str, np.ndarray]:
+        """The entry's arrays, building and publishing them on a miss."""
+        found = self.get_arrays(kind, key)
+        if found is None:
+            found = self.put_arrays(kind, key, build())
+        return found[0]
+
+    # -- data frames --------------------------------------------------------
+
+    def get_frame(self, kind: str, key: str) -> pd.DataFrame | None:
+        """A stored frame; numeric and datetime columns are views of the mapping."""
+        found = self.get_arrays(kind, key)
+        return None if found is None else _to_frame(*found)
+
+    def put_frame(self, kind: str, key: str, df: pd.DataFrame) -> pd.DataFrame:
+        """Store ``df`` column by column and return it as ``get_frame`` would.
+
+        Object columns are stored as strings, with a mask of their missing
+        values so that those come back as NaN rather than ``"nan"``/``"None"``.
+        """
+        arrays, null_masks = {}, {}
+        for name in df.columns:
+            column = df[name]
+            values = column.to_numpy()
+            if values.dtype == object:
+                values = column.astype(str).to_numpy().astype(str)
+                missing = column.isna().to_numpy()
+                if missing.any():
+                    values[missing] = ""
+                    null_masks[str(name)] = missing
+            arrays[str(name)] = values
+        meta = {"columns": list(arrays), "null_masks": {}}
+        # Array names of the masks are positional so they cannot clash with columns.
+        for i, (name, missing) in enumerate(null_masks.items()):
+            meta["null_masks"][name] = f"\0null{i}"
+            arrays[f"\0null{i}"] = missing
+        return _to_frame(*self.put_arrays(kind, key, arrays, meta))
+
+    def frame(self, kind: str, key: str, build: Callable[[], pd.DataFrame]) -> pd.DataFrame:
+        """The stored frame, building and publishing it on a miss."""
+        df = self.get_frame(kind, key)
+        if df is None:
+            df = self.put_frame(kind, key, build())
+        return df
+
+    # -- eviction -----------------------------------------------------------
+
+    def _maybe_evict(self, keep: tuple[str, str], written: int) -> None:
+        with self._evict_lock:
+            self._written += written
+            now = time.monotonic()
+            if (self._written < self.max_bytes * _EVICT_WRITE_FRACTION
+                    and now - self._scanned_at < _EVICT_INTERVAL):
+                return
+            self._written, self._scanned_at = 0, now
+        self._evict(keep)
+
+    def _evict(self, keep: tuple[str, str]) -> None:
+        entries, total = [], 0
+        for kind in os.listdir(self.root):
+            kind_dir = os.path.join(self.root, kind)
+            if not os.path.isdir(kind_dir):
+                continue
+            for key in os.listdir(kind_dir):
+                entry = os.path.join(kind_dir, key)
+                if key.startswith(".") or (kind, key) == keep:
+                    continue
+                try:
+                    size = sum(os.path.getsize(os.path.join(entry, name)) for name in os.listdir(entry))
+                    entries.append((os.path.getmtime(entry), size, entry))
+                except FileNotFoundError:  # evicted by another worker meanwhile
+                    continue
+                total += size
+        for _, size, entry in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(entry, ignore_errors=True)
+            total -= size
+            logging.info(f"Evicted shared store entry {entry}")
+
+
+def _to_frame(arrays: dict[str, np.ndarray], meta: dict) -> pd.DataFrame:
+    import pandas as pd
+
+    columns = {name: arrays[name] for name in meta["columns"]}
+    for name, mask_name in meta.get("null_masks", {}).items():
+        values = columns[name].astype(object)
+        values[np.asarray(arrays[mask_name])] = np.nan
+        columns[name] = values
+    return pd.DataFrame(columns, copy=False)
+
+
+shared_store = SharedStore()
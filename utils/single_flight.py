@@ -0,0 +1,74 @@
+"""Single-flight coalescing of identical concurrent computations.
+
+When several requests ask for the same render at the same moment (a team
+opening one dashboard), the first one starts the computation and the
+others await it and share its result instead of repeating the work. Keys
+are canonical hashes of the render parameters, so JSON key order does not
+matter. Entries only live while the computation is in flight; caching
+finished results is left to the callers. The stages the computation
+records are added to the timings of every caller, so a request that joined
+a render reports it in its Server-Timing header like the one that started it.
+
+Coalescing is per event loop, i.e. across the async tasks of one worker.
+"""
+
+import asyncio
+import hashlib
+import json
+from typing import Awaitable, Callable, TypeVar
+
+from utils.metrics import COALESCED_REQUESTS, merge_timings, request_timings, start_request_timings
+
+T = TypeVar("T")
+
+
+def canonical_key(params) -> str:
+    """SHA-256 of ``params`` (JSON-like) serialized with sorted keys."""
+    blob = json.dumps(params, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+
+async def _timed(compute: Callable[[], Awaitable[T]]) -> tuple[T, dict[str, float]]:
+    # The task runs in a copy of the starting request's context; fresh
+    # timings there keep the flight's stages apart from that request's own.
+    start_request_timings()
+    result = await compute()
+    return result, dict(request_timings())
+
+
+class SingleFlight:
+    """In-flight computations by key; ``kind`` labels the coalescing metric."""
+
+    def __init__(self, kind: str):
+        self.kind = kind
+        self._inflight: dict[str, asyncio.Task] = {}
+
+    def __len__(self) -> int:
+        return len(self._inflight)
+
+    async def run(self, key: str, compute: Callable[[], Awaitable[T]]) -> tuple[T, bool]:
+        """Result of ``compute()`` for ``key`` and whether it was shared.
+
+        Only the first caller for a key runs ``compute``; callers arriving
+        while it runs get the same result (or exception). The computation
+        is shielded, so a caller that disconnects does not cancel it for
+        the others.
+        """
+        task = self._inflight.get(key)
+        shared = task is not None
+        if shared:
+            COALESCED_REQUESTS.inc((self.kind,))
+        else:
+            task = asyncio.ensure_future(_timed(compute))
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._finished(key, t))
+        result, timings = await asyncio.shield(task)
+        merge_timings(timings)
+        return result, shared
+
+    def _finished(self, key: str, task: asyncio.Task) -> None:
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        # Every waiter may have gone away; mark the exception as retrieved.
+        if not task.cancelled():
+            task.exception()
@@ -0,0 +1,252 @@
+"""Spatial interpolation of station measurements onto a regular grid.
+
+Station layouts rarely change between sampling dates, so slices are grouped
+by their exact station set. Each interpolator solves a whole group at once,
+with the dates of the group as right-hand sides. For RBF and GP that means
+one factorization per group (GP hyperparameters are fitted only once per
+dataset). For IDW and KDE the grid-to-station weight matrix is built once
+per group, in grid blocks to bound memory, rather than once per date.
+
+Interpolators are registered by name in ``SPATIAL_INTERPOLATORS``.
+"""
+
+import numpy as np
+from scipy.interpolate import RBFInterpolator
+from scipy.spatial import cKDTree
+from scipy.spatial.distance import cdist
+
+MIN_STATIONS = 4
+
+# Grid points per block when building grid-to-station weight matrices.
+GRID_BLOCK = 8192
+
+# Kilometres per degree, as used for the heatmap bandwidth.
+KM_PER_DEGREE = 111.0
+
+
+def _aggregate_slice(points: np.ndarray, values: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Average duplicate station coordinates and sort stations canonically."""
+    points = np.asarray(points, dtype=np.float64)
+    values = np.asarray(values, dtype=np.float64)
+    unique, inverse = np.unique(points, axis=0, return_inverse=True)
+    inverse = inverse.reshape(-1)
+    sums = np.bincount(inverse, weights=values, minlength=len(unique))
+    counts = np.bincount(inverse, minlength=len(unique))
+    return unique, sums / counts
+
+
+class SpatialInterpolator:
+    """Base class: groups slices by station set and solves each group once.
+
+    ``grid_points`` is a (G, 2) array of (lon, lat) evaluation points.
+    Subclasses implement ``_solve(points, rhs)`` returning (G, dates) values.
+    """
+
+    def __init__(self, grid_points: np.ndarray):
+        self.grid_points = np.asarray(grid_points, dtype=np.float64)
+
+    def _solve(self, points: np.ndarray, rhs: np.ndarray) -> np.ndarray:
+        raise NotImplementedError
+
+    def fields(self, slices: list[tuple[np.ndarray, np.ndarray]]) -> list[np.ndarray | None]:
+        """Interpolate each (points, values) slice onto the grid.
+
+        Returns one float32 (G,) field per slice, in input order, or ``None``
+        for slices with fewer than ``MIN_STATIONS`` distinct stations.
+        """
+        results: list[np.ndarray | None] = [None] * len(slices)
+        groups: dict[bytes, tuple[np.ndarray, list[int], list[np.ndarray]]] = {}
+        for i, (points, values) in enumerate(slices):
+            pts, vals = _aggregate_slice(points, values)
+            if len(pts) < MIN_STATIONS:
+                continue
+            key = pts.tobytes()
+            if key not in groups:
+                groups[key] = (pts, [], [])
+            groups[key][1].append(i)
+            groups[key][2].append(vals)
+
+        for pts, indices, value_columns in groups.values():
+            rhs = np.column_stack(value_columns)  # (stations, dates)
+            grid_values = np.asarray(self._solve(pts, rhs), dtype=np.float32).reshape(len(self.grid_points), -1)
+            for column, i in enumerate(indices):
+                results[i] = np.ascontiguousarray(grid_values[:, column])
+        return results
+
+    def _blockwise(self, points: np.ndarray, rhs: np.ndarray, weights) -> np.ndarray:
+        """``weights(grid_block, points) @ rhs`` evaluated one grid block at a time."""
+        out = np.empty((len(self.grid_points), rhs.shape[1]), dtype=np.float32)
+        for start in range(0, len(self.grid_points), GRID_BLOCK):
+            block = self.grid_points[start:start + GRID_BLOCK]
+            out[start:start + len(block)] = weights(block, points) @ rhs
+        return out
+
+
+class RBFSpatialInterpolator(SpatialInterpolator):
+    """Radial basis function interpolation shared across dates.
+
+    ``grid_points`` is a (G, 2) array of (lon, lat) evaluation points.
+    ``neighbors`` switches to local fits on the ``neighbors`` nearest
+    stations of each grid point, which keeps large networks tractable.
+    """
+
+    def __init__(self, grid_points: np.ndarray, kernel: str = "cubic", neighbors: int | None = None,
+                 smoothing: float = 0.0):
+        super().__init__(grid_points)
+        self.kernel = kernel
+        self.neighbors = neighbors
+        self.smoothing = smoothing
+
+    def _solve(self, points: np.ndarray, rhs: np.ndarray) -> np.ndarray:
+        neighbors = self.neighbors if self.neighbors and self.neighbors < len(points) else None
+        interpolator = RBFInterpolator(
+            points, rhs, kernel=self.kernel, neighbors=neighbors, smoothing=self.smoothing
+        )
+        return interpolator(self.grid_points)
+
+
+class IDWSpatialInterpolator(SpatialInterpolator):
+    """Inverse distance weighting, optionally over the ``neighbors`` nearest stations."""
+
+    def __init__(self, grid_points: np.ndarray, power: float = 2.0, neighbors: int | None = None):
+        super().__init__(grid_points)
+        self.power = power
+        self.neighbors = neighbors
+
+    def _weights(self, dists: np.ndarray) -> np.ndarray:
+        # Same guard as the heatmap IDW: a grid point on a station takes its value.
+        dists = np.maximum(dists, 1e-12)
+        weights = dists ** -self.power
+        return weights / weights.sum(axis=-1, keepdims=True)
+
+    def _solve(self, points: np.ndarray, rhs: np.ndarray) -> np.ndarray:
+        if self.neighbors and self.neighbors < len(points):
+            tree = cKDTree(points)
+            rhs32 = rhs.astype(np.float32)
+            out = np.empty((len(self.grid_points), rhs.shape[1]), dtype=np.float32)
+            for start in range(0, len(self.grid_points), GRID_BLOCK):
+                dists, idx = tree.query(self.grid_points[start:start + GRID_BLOCK], k=self.neighbors)
+                weights = self._weights(dists).astype(np.float32)
+                out[start:start + len(idx)] = np.einsum("gk,gkd->gd", weights, rhs32[idx])
+            return out
+        return self._blockwise(points, rhs, lambda block, pts: self._weights(cdist(block, pts)))
+
+
+class KDESpatialInterpolator(SpatialInterpolator):
+    """Value-weighted Gaussian kernel density, rescaled to ``value_range``.
+
+    Mirrors the heatmap's KDE mode: values are clipped to the range, used as
+    sample weights, and each date's density is min-max scaled back onto the
+    range so dates are comparable.
+    """
+
+    def __init__(self, grid_points: np.ndarray, value_range: tuple[float, float], bandwidth_km: float = 2.7):
+        super().__init__(grid_points)
+        self.vmin, self.vmax = float(value_range[0]), float(value_range[1])
+        self.bandwidth = max(float(bandwidth_km), 0.05) / KM_PER_DEGREE
+
+    def _solve(self, points: np.ndarray, rhs: np.ndarray) -> np.ndarray:
+        scale = -0.5 / self.bandwidth ** 2
+        density = self._blockwise(
+            points, np.clip(rhs, self.vmin, self.vmax),
+            lambda block, pts: np.exp(cdist(block, pts, "sqeuclidean") * scale),
+        )
+        dmin, dmax = density.min(axis=0), density.max(axis=0)
+        span = dmax - dmin
+        flat = span < 1e-12
+        scaled = (density - dmin) / np.where(flat, 1.0, span)
+        scaled = scaled * (self.vmax - self.vmin) + self.vmin
+        scaled[:, flat] = self.vmin
+        return scaled
+
+
+class GPSpatialInterpolator(SpatialInterpolator):
+    """Gaussian process regression (kriging) with an RBF + white-noise kernel.
+
+    Kernel hyperparameters are fitted once per interpolator, i.e. once per
+    dataset, on the first station group (all of its dates jointly,
+    standardized; at most ``max_fit_stations`` stations). Every group is
+    then kriged with that kernel: one Cholesky factorization per group, with
+    all dates of the group solved as right-hand sides, and each date's field
+    predicted once.
+
+    ``neighbors`` switches to local kriging: the grid is cut into tiles of
+    about ``tile`` x ``tile`` points and each tile is predicted from its
+    ``neighbors`` nearest stations, so the cost grows with the number of
+    tiles rather than with the cube of the network size.
+    """
+
+    def __init__(self, grid_points: np.ndarray, length_scale: float = 0.1, noise_level: float = 0.1,
+                 alpha: float = 1e-2, neighbors: int | None = None, tile: int = 32,
+                 max_fit_stations: int = 500, seed: int = 0):
+        super().__init__(grid_points)
+        self.length_scale = length_scale
+        self.noise_level = noise_level
+        self.alpha = alpha
+        self.neighbors = neighbors
+        self.tile = tile
+        self.max_fit_stations = max_fit_stations
+        self.seed = seed
+        self.kernel_ = None
+
+    def fit_kernel(self, points: np.ndarray, rhs: np.ndarray):
+        """Fit (once) and return the kernel with optimized hyperparameters."""
+        if self.kernel_ is None:
+            from sklearn.gaussian_process import GaussianProcessRegressor
+            from sklearn.gaussian_process.kernels import RBF, WhiteKernel
+
+            if len(points) > self.max_fit_stations:
+                rng = np.random.default_rng(self.seed)
+                subset = rng.choice(len(points), self.max_fit_stations, replace=False)
+                points, rhs = points[subset], rhs[subset]
+            kernel = RBF(self.length_scale) + WhiteKernel(self.noise_level)
+            gp = GaussianProcessRegressor(kernel=kernel, alpha=self.alpha, normalize_y=True)
+            gp.fit(points, rhs)
+            self.kernel_ = gp.kernel_
+        return self.kernel_
+
+    def _krige_weights(self, kernel, points: np.ndarray, rhs: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """(weights, mean) such that the prediction is ``k(x, points) @ weights + mean``."""
+        from scipy.linalg import cho_factor, cho_solve
+
+        mean = rhs.mean(axis=0)
+        cov = kernel(points)
+        cov[np.diag_indices_from(cov)] += self.alpha
+        return cho_solve(cho_factor(cov, lower=True), rhs - mean), mean
+
+    def _solve(self, points: np.ndarray, rhs: np.ndarray) -> np.ndarray:
+        kernel = self.fit_kernel(points, rhs)
+        if self.neighbors and self.neighbors < len(points):
+            return self._solve_local(kernel, points, rhs)
+        weights, mean = self._krige_weights(kernel, points, rhs)
+        return self._blockwise(points, weights, kernel) + mean.astype(np.float32)
+
+    def _solve_local(self, kernel, points: np.ndarray, rhs: np.ndarray) -> np.ndarray:
+        grid = self.grid_points
+        n_tiles = max(1, int(np.ceil(np.sqrt(len(grid)) / self.tile)))
+        lo, hi = grid.min(axis=0), grid.max(axis=0)
+        cell = np.floor((grid - lo) / np.where(hi > lo, hi - lo, 1.0) * n_tiles).clip(0, n_tiles - 1)
+        _, tile_of = np.unique(cell[:, 0] * n_tiles + cell[:, 1], return_inverse=True)
+        order = np.argsort(tile_of.reshape(-1), kind="stable")
+        bounds = np.flatnonzero(np.diff(tile_of.reshape(-1)[order])) + 1
+
+        tree = cKDTree(points)
+        solved: dict[bytes, tuple[np.ndarray, np.ndarray, np.ndarray]] = {}
+        out = np.empty((len(grid), rhs.shape[1]), dtype=np.float32)
+        for members in np.split(order, bounds):
+            _, idx = tree.query(grid[members].mean(axis=0), k=self.neighbors)
+            idx = np.sort(idx)
+            key = idx.tobytes()
+            if key not in solved:
+                solved[key] = (idx, *self._krige_weights(kernel, points[idx], rhs[idx]))
+            idx, weights, mean = solved[key]
+            out[members] = kernel(grid[members], points[idx]) @ weights + mean
+        return out
+
+
+SPATIAL_INTERPOLATORS = {
+    "idw": IDWSpatialInterpolator,
+    "rbf": RBFSpatialInterpolator,
+    "gp": GPSpatialInterpolator,
+    "kde": KDESpatialInterpolator,
+}
@@ -0,0 +1,110 @@
+"""Lazy temporal interpolation between spatial keyframes.
+
+The spline is fitted once: piecewise polynomial coefficients are computed
+for every grid cell and kept in float32, in column blocks so the float64 work
+arrays stay small. Output frames are then evaluated on demand, one at a time
+or in small windows, so memory scales with the number of keyframes rather
+than with the number of output frames.
+"""
+
+from typing import Iterator
+
+import numpy as np
+from scipy.interpolate import CubicSpline
+
+TEMPORAL_KINDS = ("linear", "cubic")
+
+# Grid cells per coefficient fitting block (bounds float64 scratch memory).
+FIT_BLOCK = 65_536
+
+
+class LazyTemporalInterpolator:
+    """Piecewise-polynomial interpolant over a stack of keyframe fields.
+
+    ``keyframes`` has shape ``(K, *field_shape)``; keyframe ``k`` sits at time
+    ``k`` unless ``times`` is given. ``kind="cubic"`` is the not-a-knot cubic
+    spline (the interpolant ``interp1d(kind="cubic")`` builds); ``"linear"``
+    blends neighbouring keyframes.
+    """
+
+    def __init__(self, keyframes: np.ndarray, kind: str = "cubic", times=None):
+        if kind not in TEMPORAL_KINDS:
+            raise ValueError(f"Unknown temporal interpolation '{kind}'. Choose from {TEMPORAL_KINDS}.")
+        keyframes = np.asarray(keyframes)
+        n_keys = keyframes.shape[0]
+        if n_keys < 2:
+            raise ValueError("At least two keyframes are required for temporal interpolation.")
+
+        self.kind = kind
+        self.field_shape = keyframes.shape[1:]
+        self.times = np.arange(n_keys, dtype=np.float64) if times is None else np.asarray(times, dtype=np.float64)
+        flat = keyframes.reshape(n_keys, -1)
+        n_cells = flat.shape[1]
+
+        # _coeffs[m, i, p]: coefficient of (t - times[i]) ** (order - m) on
+        # segment i for grid cell p.
+        if kind == "linear":
+            self._coeffs = np.empty((2, n_keys - 1, n_cells), dtype=np.float32)
+            self._coeffs[0] = np.diff(flat, axis=0) / np.diff(self.times)[:, None]
+            self._coeffs[1] = flat[:-1]
+        else:
+            self._coeffs = np.empty((4, n_keys - 1, n_cells), dtype=np.float32)
+            for start in range(0, n_cells, FIT_BLOCK):
+                block = slice(start, start + FIT_BLOCK)
+                spline = CubicSpline(self.times, flat[:, block].astype(np.float64), axis=0)
+                self._coeffs[:, :, block] = spline.c
+
+    @classmethod
+    def from_coefficients(cls, coeffs: np.ndarray, times: np.ndarray, field_shape: tuple,
+                          kind: str = "cubic") -> "LazyTemporalInterpolator":
+        """Wrap already-fitted coefficients (e.g. a shared-memory view) without refitting."""
+        self = cls.__new__(cls)
+        self.kind = kind
+        self.times = np.asarray(times, dtype=np.float64)
+        self.field_shape = tuple(field_shape)
+        self._coeffs = coeffs
+        return self
+
+    @property
+    def coefficients(self) -> np.ndarray:
+        """Fitted float32 coefficients, shape (order + 1, K - 1, cells)."""
+        return self._coeffs
+
+    @property
+    def n_keyframes(self) -> int:
+        return self.times.size
+
+    def frame_times(self, total_frames: int) -> np.ndarray:
+        """Evenly spaced output times spanning the first to last keyframe."""
+        return np.linspace(self.times[0], self.times[-1], total_frames)
+
+    def frame(self, t: float, out: np.ndarray | None = None) -> np.ndarray:
+        """Evaluate the interpolant at time ``t`` as a float32 field."""
+        seg = int(np.clip(np.searchsorted(self.times, t, side="right") - 1, 0, self.times.size - 2))
+        dx = np.float32(t - self.times[seg])
+        coeffs = self._coeffs[:, seg]
+        if out is None:
+            out = np.empty(coeffs.shape[1], dtype=np.float32)
+        else:
+            out = out.reshape(-1)
+        # Horner evaluation, in place.
+        out[...] = coeffs[0]
+        for c in coeffs[1:]:
+            out *= dx
+            out += c
+        return out.reshape(self.field_shape)
+
+    def iter_frames(self, total_frames: int) -> Iterator[np.ndarray]:
+        """Yield ``total_frames`` fields one at a time (each a new array)."""
+        for t in self.frame_times(total_frames):
+            yield self.frame(t)
+
+    def iter_windows(self, total_frames: int, window: int = 8) -> Iterator[np.ndarray]:
+        """Yield consecutive blocks of up to ``window`` frames, shape (w, *field_shape)."""
+        times = self.frame_times(total_frames)
+        for start in range(0, times.size, window):
+            chunk = times[start:start + window]
+            block = np.empty((chunk.size, *self.field_shape), dtype=np.float32)
+            for i, t in enumerate(chunk):
+                self.frame(t, out=block[i])
+            yield block
@@ -1,16 +1,8 @@
 import os
 import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
-from matplotlib.colors import Normalize
-from matplotlib.cm import get_cmap
-from matplotlib import cm
-import cv2
-from datetime import datetime
-from scipy.interpolate import interp1d
-from shapely.geometry import Point
-from shapely.geometry.polygon import Polygon
-import geopandas as gpd
+
+from utils.animation_engine import render_station_animation
 
 # Path constants
 STATIC_VIDEO_DIR = 'static/animations'
@@ -19,15 +11,74 @@ LAKE_BOUNDARY_GEOJSON = 'static/data/export.geojson'
 # Ensure output directory exists
 os.makedirs(STATIC_VIDEO_DIR, exist_ok=True)
 
-def generate_animation_video(df, output_name="animation.mp4", fps=30, duration_seconds=10):
+def interpolate_station_series(df, frame_count):
+    """
+    Linearly interpolates every station's series onto ``frame_count`` evenly
+    spaced times spanning the whole dataset.
+
+    The data is pivoted into a date x station matrix and all stations are
+    interpolated in one pass over the time axis. Each station uses only its
+    own samples, and extrapolates linearly from its first/last two samples
+    (the behaviour of ``interp1d(fill_value="extrapolate")``). Stations with
+    fewer than two sampling dates are dropped; repeated samples are averaged.
+
+    Returns:
+        tuple: (points, values) with points an (S, 2) lon/lat array and
+        values a contiguous (frame_count, S) float32 array.
+    """
+    table = df.pivot_table(index='sampled_at', columns=['longitude', 'latitude'], values='value', aggfunc='mean')
+    values = table.to_numpy(dtype=np.float64)
+    valid = ~np.isnan(values)
+    keep = valid.sum(axis=0) >= 2
+    values, valid = values[:, keep], valid[:, keep]
+    points = np.array(table.columns[keep].tolist(), dtype=np.float64).reshape(-1, 2)
+    n_times, n_stations = values.shape
+    if n_stations == 0:
+        return points, np.empty((frame_count, 0), dtype=np.float32)
+
+    times = (table.index - table.index[0]).total_seconds().to_numpy()
+    frame_times = np.linspace(times[0], times[-1], frame_count)
+
+    # prev[i, s]: last sample of station s at or before date i (-1 if none);
+    # nxt[i, s]: first sample at or after date i (n_times if none).
+    idx = np.arange(n_times)[:, None]
+    prev = np.maximum.accumulate(np.where(valid, idx, -1), axis=0)
+    nxt = np.minimum.accumulate(np.where(valid, idx, n_times)[::-1], axis=0)[::-1]
+
+    # Bracketing samples for every (frame, station).
+    seg = np.clip(np.searchsorted(times, frame_times, side='right') - 1, 0, max(n_times - 2, 0))
+    left = prev[seg]
+    right = nxt[np.minimum(seg + 1, n_times - 1)]
+
+    # Outside a station's own range, extrapolate from its first/last two samples.
+    cols = np.arange(n_stations)
+    first, last = nxt[0], prev[-1]
+    second, penultimate = nxt[first + 1, cols], prev[last - 1, cols]
+    before, after = left < 0, right >= n_times
+    left = np.where(before, first, np.where(after, penultimate, left))
+    right = np.where(before, second, np.where(after, last, right))
+
+    t_left, t_right = times[left], times[right]
+    v_left, v_right = values[left, cols], values[right, cols]
+    frac = (frame_times[:, None] - t_left) / (t_right - t_left)
+    return points, np.ascontiguousarray(v_left + (v_right - v_left) * frac, dtype=np.float32)
+
+def generate_animation_video(df, output_name="animation.mp4", fps=30, duration_seconds=10, cmap="plasma",
+                             spatial="idw"):
     """
     Generates an interpolated video of heatmap transitions over time.
 
+    Each station's series is interpolated in time first; every frame is then
+    interpolated over the lake with ``spatial`` and rendered by the shared
+    animation engine.
+
     Args:
         df (DataFrame): Contains columns [latitude, longitude, sampled_at, value].
         output_name (str): Filename of output video.
         fps (int): Frames per second.
         duration_seconds (int): Total duration of the video in seconds.
+        cmap (str): Matplotlib colormap name.
+        spatial (str): Spatial interpolation method (see utils.animation_engine).
 
     Returns:
         str: Path to generated video.
@@ -36,77 +87,13 @@ def generate_animation_video(df, output_name="animation.mp4", fps=30, duration_s
         raise ValueError("Input DataFrame is empty")
 
     df['sampled_at'] = pd.to_datetime(df['sampled_at'])
-    df.sort_values('sampled_at', inplace=True)
 
     frame_count = fps * duration_seconds
-    timestamps = df['sampled_at'].sort_values().unique()
-    times_numeric = (timestamps - timestamps[0]).astype('timedelta64[s]').astype(float)
-    full_time_range = np.linspace(times_numeric.min(), times_numeric.max(), frame_count)
-
-    # Unique coordinates grid
-    points = df[['latitude', 'longitude']].drop_duplicates().reset_index(drop=True)
-
-    # Prepare interpolated matrix: for each point, interpolate over time
-    interpolated_frames = []
-    for _, row in points.iterrows():
-        sub_df = df[(df['latitude'] == row.latitude) & (df['longitude'] == row.longitude)]
-        if sub_df.empty: continue
-
-        t = (sub_df['sampled_at'] - timestamps[0]).astype('timedelta64[s]').astype(float)
-        v = sub_df['value'].values
-
-        if len(np.unique(t)) < 2:
-            continue  # Cannot interpolate with <2 time points
-
-        interp_func = interp1d(t, v, kind='linear', bounds_error=False, fill_value="extrapolate")
-        v_interp = interp_func(full_time_range)
-        for i, val in enumerate(v_interp):
-            if len(interpolated_frames) <= i:
-                interpolated_frames.append([])
-            interpolated_frames[i].append((row.latitude, row.longitude, val))
-
-    # Load lake boundary to use for masking
-    lake = gpd.read_file(LAKE_BOUNDARY_GEOJSON).geometry.iloc[0]
-    bounds = lake.bounds
-    min_lon, min_lat, max_lon, max_lat = bounds
-
-    # Set resolution and canvas size
-    grid_res = 400
-    width, height = 800, 800
-    dpi = 100
-    fig, ax = plt.subplots(figsize=(width/dpi, height/dpi), dpi=dpi)
+    points, station_frames = interpolate_station_series(df, frame_count)
+    if station_frames.shape[1] == 0:
+        raise ValueError("No station has at least two time points")
 
     video_path = os.path.join(STATIC_VIDEO_DIR, output_name)
-    writer = cv2.VideoWriter(video_path, cv2.VideoWriter_fourcc(*'mp4v'), fps, (width, height))
-
-    cmap = get_cmap('plasma')
-    norm = Normalize()
-
-    for frame in interpolated_frames:
-        ax.clear()
-        lat, lon, val = zip(*frame)
-        lat = np.array(lat)
-        lon = np.array(lon)
-        val = np.array(val)
-        norm.autoscale(val)
-
-        # Plot background lake
-        ax.set_xlim(min_lon, max_lon)
-        ax.set_ylim(min_lat, max_lat)
-        ax.set_aspect('equal')
-        lake_patch = gpd.GeoSeries([lake]).plot(ax=ax, color='#d0f0ff', edgecolor='black', linewidth=0.5)
-
-        # Plot heatmap as scatter for now (can evolve to KDE)
-        colors = cmap(norm(val))
-        ax.scatter(lon, lat, c=colors, s=30, edgecolor='none')
-        ax.axis('off')
-
-        fig.canvas.draw()
-        img = np.frombuffer(fig.canvas.tostring_rgb(), dtype='uint8')
-        img = img.reshape(fig.canvas.get_width_height()[::-1] + (3,))
-        writer.write(cv2.cvtColor(img, cv2.COLOR_RGB2BGR))
-
-    writer.release()
-    plt.close(fig)
+    render_station_animation(points, station_frames, video_path, fps=fps, cmap=cmap, spatial=spatial)
 
     return video_path